@@ -0,0 +1,150 @@
+import logging
+import random
+import time
+from urllib.parse import urlparse
+
+import config
+from metrics import registry as metrics
+from ratelimit import RateLimiter, parse_retry_after
+from sqlite_cache import conditional_headers
+from utils import MISSING, Requester
+
+
+async def gather(*awaitables):
+    """
+    asyncio.gather, asyncio is imported on first use so blocking runs do not pay for it
+    """
+    import asyncio
+    return await asyncio.gather(*awaitables)
+
+
+class AsyncRequester(Requester):
+    """
+    Asyncio version of the Requester. Pagination, serialization and the cache are shared with the blocking Requester,
+    only the HTTP calls change: they go through one aiohttp client shared by every instance, limited by
+    config.ASYNC_MAX_CONCURRENCY requests in flight and by the client side limiter of their host (see ratelimit.py),
+    which also retries throttled responses like http_session.RateLimitedSession
+    """
+    __session = None
+    __semaphore = None
+    __loop = None
+    __limiter = None
+    log = logging.getLogger("AsyncRequester")
+
+    @classmethod
+    def _client(cls):
+        """
+        Shared aiohttp client and semaphore, they are (re)created for the running event loop
+        :return: tuple with the client session and the semaphore limiting the concurrency
+        """
+        # aiohttp takes longer to import than the rest of the project, only asyncio runs pay for it
+        import asyncio
+        import aiohttp
+
+        loop = asyncio.get_event_loop()
+        if AsyncRequester.__session is None or AsyncRequester.__session.closed or AsyncRequester.__loop is not loop:
+            connector = aiohttp.TCPConnector(limit=config.ASYNC_MAX_CONNECTIONS)
+            AsyncRequester.__session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=config.ASYNC_REQUEST_TIMEOUT))
+            AsyncRequester.__semaphore = asyncio.Semaphore(config.ASYNC_MAX_CONCURRENCY)
+            AsyncRequester.__loop = loop
+        return AsyncRequester.__session, AsyncRequester.__semaphore
+
+    @classmethod
+    async def aclose(cls):
+        """
+        Close the shared client, call it before the event loop is closed
+        """
+        if AsyncRequester.__session is not None and not AsyncRequester.__session.closed:
+            await AsyncRequester.__session.close()
+        AsyncRequester.__session = None
+
+    @classmethod
+    def _limiter(cls):
+        """
+        RateLimiter shared by every instance and event loop, built on first use
+        """
+        if AsyncRequester.__limiter is None:
+            AsyncRequester.__limiter = RateLimiter()
+        return AsyncRequester.__limiter
+
+    @staticmethod
+    def _raise_for_status(response):
+        """
+        Raise aiohttp.ClientResponseError for any response that is not a 2xx, including the 3xx raise_for_status
+        lets through
+        """
+        import aiohttp
+
+        response.raise_for_status()
+        raise aiohttp.ClientResponseError(response.request_info, response.history, status=response.status,
+                                          message='Unexpected status', headers=response.headers)
+
+    async def _aget(self, url):
+        """
+        Coroutine to make a get request checking first on the cache, the cache and response handling are the ones of
+        Requester, only the transport changes
+
+        :param url: url
+        :return: content stored on the cache or content of the url in case of cache miss
+        """
+        result, stale_entry = self._cache_lookup(url)
+        if result is not MISSING:
+            return result
+        session, semaphore = self._client()
+        host_limiter = self._limiter().for_host(urlparse(url).hostname)
+        attempt = 0
+        async with semaphore:
+            while True:
+                started_at = await host_limiter.aacquire()
+                start = time.perf_counter()
+                try:
+                    async with session.get(url, headers=conditional_headers(stale_entry)) as response:
+                        body = await response.read()
+                except BaseException:
+                    host_limiter.release(started_at)
+                    raise
+                duration = time.perf_counter() - start
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                host_limiter.release(started_at, status=response.status, latency=duration, retry_after=retry_after)
+                if response.status not in config.RATE_LIMIT_STATUSES or attempt >= config.RATE_LIMIT_RETRIES:
+                    break
+                if retry_after is None:
+                    backoff = config.HTTP_RETRY_BACKOFF_FACTOR * 2 ** attempt
+                    host_limiter.block(backoff + random.uniform(0, config.HTTP_RETRY_JITTER) if backoff > 0 else 0)
+                self.log.debug("Retrying throttled request %s", url)
+                attempt += 1
+        return self._handle_response(url, stale_entry, response.status, response.headers, body, duration,
+                                     lambda: self._raise_for_status(response))
+
+    async def aget_all(self):
+        """
+        Get all objects of the defined endpoint attribute, the remaining pages are requested concurrently
+        """
+        items = []
+        pages = 1
+        start = time.perf_counter()
+        with metrics.stage('fetch'):
+            get_result = await self._aget(self._collection_url())
+            items.extend(get_result.get('results', []))
+
+            page_urls = self._page_urls(get_result)
+            if page_urls:
+                # gather keeps the order of the coroutines, so results come back in page order
+                for page in await gather(*[self._aget(page_url) for page_url in page_urls]):
+                    items.extend(page.get('results', []))
+                pages += len(page_urls)
+            else:
+                while get_result.get('next'):
+                    get_result = await self._aget(get_result.get('next'))
+                    items.extend(get_result.get('results', []))
+                    pages += 1
+        self._record_pages(pages, len(items), time.perf_counter() - start)
+        return self.serialize(items=items)
+
+    async def aget_by_url(self, url):
+        """
+        Get object based on url field, a new object every time (the content comes from the cache when present)
+        """
+        item = await self._aget(url)
+        return self.serialize(items=item)
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the page deserialization path on large synthetic pages: stdlib json + one from_dict call per
+record (the previous path) against json_codec.loads + the bulk from_dicts factory.
+
+    python -m benchmarks.bench_serialize --pages 50 --page-size 1000
+"""
+import argparse
+import json
+import random
+import timeit
+
+import json_codec
+from models import Person
+
+
+def build_pages(pages, page_size, seed=0):
+    """
+    Encoded SWAPI-like people pages
+    :return: list of bytes
+    """
+    rand = random.Random(seed)
+    encoded_pages = []
+    for page in range(pages):
+        results = []
+        for index in range(page_size):
+            person_id = page * page_size + index + 1
+            results.append({
+                'name': 'Person {}'.format(person_id), 'height': str(rand.randint(60, 240)), 'mass': '77',
+                'hair_color': 'blond', 'skin_color': 'fair', 'eye_color': 'blue', 'birth_year': '19BBY',
+                'gender': 'male', 'homeworld': 'https://swapi.co/api/planets/1/',
+                'films': ['https://swapi.co/api/films/{}/'.format(film) for film in range(1, rand.randint(2, 8))],
+                'species': ['https://swapi.co/api/species/{}/'.format(rand.randint(1, 37))],
+                'vehicles': [], 'starships': [], 'created': '2014-12-09T13:50:51.644000Z',
+                'edited': '2014-12-20T21:17:56.891000Z', 'url': 'https://swapi.co/api/people/{}/'.format(person_id)})
+        encoded_pages.append(json.dumps({'count': pages * page_size, 'results': results}).encode('utf-8'))
+    return encoded_pages
+
+
+def per_record(pages):
+    return [[Person.from_dict(record) for record in json.loads(page)['results']] for page in pages]
+
+
+def bulk(pages):
+    return [Person.from_dicts(json_codec.loads(page)['results']) for page in pages]
+
+
+def run(args=None):
+    parser = argparse.ArgumentParser(description='Page deserialization micro-benchmark')
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    arguments = parser.parse_args(args)
+
+    pages = build_pages(arguments.pages, arguments.page_size)
+    records = arguments.pages * arguments.page_size
+    print('decoder: {}'.format('orjson' if json_codec.orjson is not None else 'json'))
+    timings = {}
+    for name, function in (('per_record', per_record), ('bulk', bulk)):
+        timings[name] = min(timeit.repeat(lambda: function(pages), number=1, repeat=arguments.repeat))
+        print('{:<12} {:.4f}s ({:.0f} records/s)'.format(name, timings[name], records / timings[name]))
+    print('speedup: {:.2f}x'.format(timings['per_record'] / timings['bulk']))
+
+
+if __name__ == '__main__':
+    run()
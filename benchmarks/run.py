@@ -0,0 +1,164 @@
+"""
+End to end benchmarks against the local stand-in server (benchmarks.stub_server). Every stage reports wall time,
+requests, bytes and peak memory (tracemalloc) and is compared with the stored baseline (benchmarks/baseline.json).
+
+    python -m benchmarks.run                    # run and compare with the baseline, exit code 1 on regressions
+    python -m benchmarks.run --update-baseline  # run and store the results as the new baseline
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import config
+import main
+from benchmarks.stub_server import StubDataset, serve
+from csv_handler import CSVHandler
+from http_session import close_session
+from models import PeopleQuerySet, SpeciesQuerySet
+from utils import MemoryCache, Requester
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+FIELDS = {'name': 'name', 'species': 'species', 'height': 'height', 'appearances': 'films_count'}
+
+
+def reset():
+    """
+    Start every stage cold: empty cache and no pooled connections
+    """
+    Requester.set_cache(MemoryCache())
+    close_session()
+
+
+def measure(server, function):
+    """
+    Run function measuring wall time, requests and bytes seen by the server and peak memory
+    :return: tuple (dictionary with the measures, function result)
+    """
+    before = server.counters()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    wall_time = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    after = server.counters()
+    return {'wall_time': round(wall_time, 4),
+            'requests': after['requests'] - before['requests'],
+            'bytes': after['bytes_sent'] + after['bytes_received'] - before['bytes_sent'] - before['bytes_received'],
+            'peak_memory': peak_memory}, result
+
+
+def run_stages(server, output_dir):
+    """
+    Run every stage against the server
+    :return: dictionary {stage: measures}
+    """
+    results = {}
+
+    reset()
+    results['requester_get_all'], people = measure(server, lambda: PeopleQuerySet().get_all())
+
+    results['queryset_top_n'], top_10 = measure(
+        server, lambda: people.order_by('films_count')[0:10].order_by('height').items)
+
+    reset()
+    top_10 = PeopleQuerySet(items=top_10, foreign_keys={'species': SpeciesQuerySet()})
+    results['resolve_foreign_keys'], _ = measure(server, top_10.resolve_foreign_keys)
+
+    results['csv_handler'], _ = measure(server, lambda: CSVHandler(
+        items=people, fields=FIELDS, file_path=os.path.join(output_dir, 'people.csv')))
+
+    reset()
+    results['main'], _ = measure(server, main.main)
+    return results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance, time_slack=0.05, memory_slack=0):
+    """
+    Compare results with the baseline
+    :param time_slack: seconds allowed on top of the wall time tolerance
+    :param memory_slack: bytes allowed on top of the peak memory tolerance
+    :return: list of regression messages
+    """
+    regressions = []
+    for stage, measures in sorted(results.items()):
+        expected = baseline.get(stage)
+        if not expected:
+            continue
+        if measures['wall_time'] > expected['wall_time'] * (1 + time_tolerance) + time_slack:
+            regressions.append('{}: wall time {}s vs baseline {}s'.format(stage, measures['wall_time'],
+                                                                          expected['wall_time']))
+        if measures['requests'] > expected['requests']:
+            regressions.append('{}: {} requests vs baseline {}'.format(stage, measures['requests'],
+                                                                       expected['requests']))
+        if measures['peak_memory'] > expected['peak_memory'] * (1 + memory_tolerance) + memory_slack:
+            regressions.append('{}: peak memory {} bytes vs baseline {} bytes'.format(
+                stage, measures['peak_memory'], expected['peak_memory']))
+    return regressions
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='SWAPI ETL benchmarks')
+    parser.add_argument('--people', type=int, default=1000, help='number of people served by the stand-in')
+    parser.add_argument('--species', type=int, default=37, help='number of species served by the stand-in')
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of answering with a 503')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--time-tolerance', type=float, default=0.5, help='allowed wall time increase (0.5: 50%%)')
+    parser.add_argument('--time-slack', type=float, default=0.05,
+                        help='seconds allowed on top of the wall time tolerance, absorbs noise on fast stages')
+    parser.add_argument('--memory-tolerance', type=float, default=0.25, help='allowed peak memory increase')
+    parser.add_argument('--memory-slack', type=int, default=64 * 1024,
+                        help='bytes allowed on top of the peak memory tolerance, absorbs noise on stages allocating '
+                             'a few KB')
+    return parser.parse_args(args)
+
+
+def run(args=None):
+    arguments = parse_args(args)
+    scenario = {'people': arguments.people, 'species': arguments.species, 'page_size': arguments.page_size,
+                'latency': arguments.latency, 'error_rate': arguments.error_rate}
+
+    output_dir = tempfile.mkdtemp()
+    previous_output_dir, config.OUTPUT_DIR = config.OUTPUT_DIR, output_dir
+    try:
+        with serve(dataset=StubDataset(people=arguments.people, species=arguments.species),
+                   page_size=arguments.page_size, latency=arguments.latency,
+                   error_rate=arguments.error_rate) as server:
+            results = run_stages(server, output_dir)
+    finally:
+        config.OUTPUT_DIR = previous_output_dir
+        shutil.rmtree(output_dir)
+        reset()
+
+    print(json.dumps({'scenario': scenario, 'results': results}, indent=2, sort_keys=True))
+
+    if arguments.update_baseline:
+        with open(arguments.baseline, 'w') as f:
+            json.dump({'scenario': scenario, 'results': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return 0
+
+    if not os.path.isfile(arguments.baseline):
+        return 0
+    with open(arguments.baseline) as f:
+        baseline = json.load(f)
+    if baseline['scenario'] != scenario:
+        print('Baseline scenario {} differs from this run, not comparing'.format(baseline['scenario']))
+        return 0
+    regressions = compare(results, baseline['results'], arguments.time_tolerance, arguments.memory_tolerance,
+                          arguments.time_slack, arguments.memory_slack)
+    for regression in regressions:
+        print('REGRESSION {}'.format(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
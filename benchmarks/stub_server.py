@@ -0,0 +1,258 @@
+"""
+Local stand-in for the SWAPI /people and /species endpoints and the httpbin /post endpoint, with configurable
+dataset size, page size, latency and error rate. It counts requests and bytes so benchmarks can report them.
+
+    python -m benchmarks.stub_server --people 1000 --latency 0.05
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import config
+
+
+class StubDataset:
+    """
+    Deterministic SWAPI like dataset of people and species
+    """
+
+    def __init__(self, people=82, species=37, films=7, seed=0):
+        """
+        :param people: number of people
+        :param species: number of species
+        :param films: number of films people can appear on
+        :param seed: random seed, the same seed generates the same dataset
+        """
+        self.people_count = people
+        self.species_count = species
+        self.films_count = films
+        self.seed = seed
+        self.base_url = 'http://localhost/api'
+        self.resources = {}
+
+    def build(self, base_url):
+        """
+        Generate the records with urls pointing to base_url
+        """
+        self.base_url = base_url
+        rand = random.Random(self.seed)
+        species = [self._record(config.SPECIES, index, name='Species {}'.format(index),
+                                classification=rand.choice(['mammal', 'artificial', 'reptile']))
+                   for index in range(1, self.species_count + 1)]
+        people = []
+        for index in range(1, self.people_count + 1):
+            films = rand.sample(range(1, self.films_count + 1), rand.randint(1, self.films_count))
+            people.append(self._record(
+                config.PEOPLE, index, name='Person {}'.format(index),
+                height=str(rand.randint(60, 240)) if rand.random() > 0.05 else 'unknown',
+                films=['{}/films/{}/'.format(base_url, film) for film in films],
+                species=['{}/{}/{}/'.format(base_url, config.SPECIES, rand.randint(1, self.species_count))]
+                if rand.random() > 0.1 else []))
+        self.resources = {config.PEOPLE: people, config.SPECIES: species}
+        return self
+
+    def _record(self, resource, index, **fields):
+        fields.update({'created': '2014-12-09T13:50:51.644000Z', 'edited': '2014-12-20T21:17:56.891000Z',
+                       'url': '{}/{}/{}/'.format(self.base_url, resource, index)})
+        return fields
+
+    def touch(self, resource, index, **fields):
+        """
+        Change a record as if it had been edited upstream
+        :param resource: 'people' / 'species'
+        :param index: record id (starting on 1)
+        :param fields: fields to update
+        """
+        record = self.resources[resource][index - 1]
+        record.update(fields)
+        record['edited'] = time.strftime('%Y-%m-%dT%H:%M:%S.000000Z', time.gmtime())
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.random.random() < server.error_rate:
+            return self.send_json({'detail': 'Service unavailable'}, status=503)
+
+        url = urlparse(self.path)
+        segments = [segment for segment in url.path.split('/') if segment]
+        if len(segments) < 2 or segments[0] != 'api' or segments[1] not in server.dataset.resources:
+            return self.send_json({'detail': 'Not found'}, status=404)
+        records = server.dataset.resources[segments[1]]
+        if len(segments) == 3 and segments[2].isdigit() and 0 < int(segments[2]) <= len(records):
+            return self.send_json(records[int(segments[2]) - 1])
+        if len(segments) > 2:
+            return self.send_json({'detail': 'Not found'}, status=404)
+        self.send_json(self.page(segments[1], records, parse_qs(url.query)))
+
+    def page(self, resource, records, query):
+        search = query.get('search', [''])[0].lower()
+        if search:
+            records = [record for record in records if search in record['name'].lower()]
+        page = int(query.get('page', ['1'])[0])
+        page_size = self.server.page_size
+        results = records[(page - 1) * page_size:page * page_size]
+
+        def page_url(number):
+            url = '{}/{}/?'.format(self.server.dataset.base_url, resource)
+            if search:
+                url += 'search={}&'.format(search)
+            return url + 'page={}'.format(number)
+
+        return {'count': len(records), 'next': page_url(page + 1) if page * page_size < len(records) else None,
+                'previous': page_url(page - 1) if page > 1 else None, 'results': results}
+
+    def do_POST(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        body = self.read_body()
+        boundary = self.headers.get('Content-Type', '').partition('boundary=')[2].encode()
+        content = body.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--' + boundary + b'--', 1)[0] if boundary else body
+        try:
+            echoed = content.decode('utf-8')
+        except UnicodeDecodeError:
+            # Like httpbin.org, binary files come back as a base64 data url
+            echoed = 'data:application/octet-stream;base64,' + base64.b64encode(content).decode('ascii')
+        self.send_json({'files': {'file': echoed}, 'headers': dict(self.headers)})
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if not size:
+                    self.rfile.readline()
+                    break
+                body += self.rfile.read(size)
+                self.rfile.readline()
+        else:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.count_bytes(received=len(body))
+        return body
+
+    def send_json(self, content, status=200):
+        body = json.dumps(content).encode()
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if status == 200 and self.command == 'GET' and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count_bytes(sent=len(body))
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Threaded stand-in server, use start / stop or the serve context manager
+    """
+    daemon_threads = True
+
+    def __init__(self, dataset=None, page_size=10, latency=0.0, error_rate=0.0, host='127.0.0.1', port=0, seed=0):
+        """
+        :param dataset: StubDataset [Default: StubDataset()]
+        :param page_size: records per page
+        :param latency: seconds slept before answering every request
+        :param error_rate: probability (0-1) of answering a GET with a 503
+        """
+        super(StubServer, self).__init__((host, port), StubHandler)
+        self.page_size = page_size
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.dataset = (dataset or StubDataset()).build('{}/api'.format(self.base_url))
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    @property
+    def swapi_base_url(self):
+        return '{}/api'.format(self.base_url)
+
+    def count_request(self):
+        with self.lock:
+            self.requests += 1
+
+    def count_bytes(self, sent=0, received=0):
+        with self.lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def counters(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_sent': self.bytes_sent, 'bytes_received': self.bytes_received}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+@contextmanager
+def serve(**kwargs):
+    """
+    Start a StubServer and point config.SWAPI_BASE_URL / config.HTTPBIN_BASE_URL to it while the context is active
+    :param kwargs: StubServer arguments
+    """
+    server = StubServer(**kwargs).start()
+    previous = config.SWAPI_BASE_URL, config.HTTPBIN_BASE_URL
+    config.SWAPI_BASE_URL, config.HTTPBIN_BASE_URL = server.swapi_base_url, server.base_url
+    try:
+        yield server
+    finally:
+        config.SWAPI_BASE_URL, config.HTTPBIN_BASE_URL = previous
+        server.stop()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Local SWAPI / httpbin stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--people', type=int, default=82, help='number of people')
+    parser.add_argument('--species', type=int, default=37, help='number of species')
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of answering with a 503')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    arguments = parse_args()
+    stub = StubServer(dataset=StubDataset(people=arguments.people, species=arguments.species),
+                      page_size=arguments.page_size, latency=arguments.latency, error_rate=arguments.error_rate,
+                      host=arguments.host, port=arguments.port)
+    print('Serving SWAPI on {} and httpbin on {}'.format(stub.swapi_base_url, stub.base_url))
+    stub.serve_forever()
@@ -0,0 +1,161 @@
+"""
+Command line entry point of the ETL, the options build the pipeline run by main.main():
+
+    python cli.py                                                 # top 10 people by appearances ordered by height
+    python cli.py --top 5 --sort height --order name --format ndjson --output tallest.ndjson --no-upload
+    python cli.py --resource species --sort name --top 20 --cache sqlite
+    python cli.py --processes 4                                   # pages split across 4 processes, see sharding.py
+    python cli.py --snapshot .cache/swapi.snapshot                # offline run without upload, see snapshot.py
+    python cli.py --incremental                                   # default people ranking, see incremental.py
+
+Only the standard library, config and metrics are imported before the options are parsed, the rest of the project
+(and requests / aiohttp / pyarrow) is imported when a code path needs it. The import time is logged and recorded
+as the import_duration_seconds metric.
+"""
+import argparse
+import logging
+import time
+
+import config
+from logging_config import configure_logging
+from metrics import registry as metrics
+
+log = logging.getLogger("CLI")
+
+# Defaults of every resource: ranking attributes, final order, output fields and foreign keys to join
+RESOURCES = {
+    config.PEOPLE: {'sort': ['films_count'], 'order': ['height'],
+                    'fields': {'name': 'name', 'species': 'species', 'height': 'height',
+                               'appearances': 'films_count'},
+                    'foreign_keys': {'species': config.SPECIES}},
+    config.SPECIES: {'sort': ['name'], 'order': [], 'fields': {'name': 'name'}, 'foreign_keys': {}},
+}
+FORMATS = ('csv', 'ndjson', 'arrow', 'parquet')
+# Defaults of the options that incremental runs do not take, they are None until parse_args checked them
+OPTION_DEFAULTS = {'resource': config.PEOPLE, 'top': 10, 'format': 'csv'}
+INCREMENTAL_IGNORED = ('resource', 'top', 'sort', 'order', 'ascending', 'format', 'output', 'snapshot')
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Star Wars API ETL')
+    parser.add_argument('--resource', choices=sorted(RESOURCES),
+                        help='resource to rank [Default: {}]'.format(OPTION_DEFAULTS['resource']))
+    parser.add_argument('--top', type=int,
+                        help='number of objects kept by the ranking [Default: {}]'.format(OPTION_DEFAULTS['top']))
+    parser.add_argument('--sort', action='append', metavar='ATTRIBUTE',
+                        help='ranking attribute, can be repeated [Default: films_count for people]')
+    parser.add_argument('--order', action='append', metavar='ATTRIBUTE',
+                        help='attribute ordering the ranked objects, can be repeated [Default: height for people]')
+    parser.add_argument('--ascending', action='store_true', help='sort in ascending order')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='output format [Default: {}]'.format(OPTION_DEFAULTS['format']))
+    parser.add_argument('--output', help='output file path, relative paths are placed inside config.OUTPUT_DIR')
+    parser.add_argument('--no-upload', action='store_true', help='do not upload the output to httpbin')
+    parser.add_argument('--workers', type=int, default=config.REQUESTER_MAX_WORKERS,
+                        help='concurrent requests')
+    parser.add_argument('--sequential', action='store_true', help='walk the pages one by one')
+    parser.add_argument('--cache', choices=('memory', 'sqlite', 'redis'), default=config.CACHE_BACKEND,
+                        help='cache backend')
+    parser.add_argument('--processes', type=int, metavar='N',
+                        help='extract the collections with N worker processes sharing the cache (sqlite unless '
+                             '--cache redis), see sharding.py')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only redo the work needed by what changed since the last run (default people '
+                             'ranking only)')
+    parser.add_argument('--snapshot', metavar='PATH',
+                        help='serve every request from a snapshot file, no network (the output is not uploaded)')
+    parser.add_argument('--profile', nargs='?', const=config.PROFILE_DIR, metavar='DIRECTORY',
+                        help='profile every stage and write the reports to DIRECTORY [Default: config.PROFILE_DIR]')
+    parser.add_argument('--metrics-output', default=config.METRICS_OUTPUT, help='metrics file path')
+    parser.add_argument('--log-level', default=config.LOG_LEVEL, help='logging level')
+    arguments = parser.parse_args(args)
+    if arguments.incremental:
+        ignored = ['--{}'.format(name) for name in INCREMENTAL_IGNORED if getattr(arguments, name) not in (None, False)]
+        if ignored:
+            parser.error('--incremental runs the default people ranking, it cannot be combined with {}'.format(
+                ', '.join(ignored)))
+    for name, value in OPTION_DEFAULTS.items():
+        if getattr(arguments, name) is None:
+            setattr(arguments, name, value)
+    return arguments
+
+
+def build_stages(arguments):
+    """
+    Pipeline stages (see config.PIPELINE) matching the command line options
+    :param arguments: parsed options
+    :return: dictionary {stage name: definition}
+    """
+    defaults = RESOURCES[arguments.resource]
+    options = {'desc': not arguments.ascending}
+    operations = [('order_by',) + tuple(arguments.sort or defaults['sort']) + (options,),
+                  ('slice', 0, arguments.top)]
+    if arguments.order or defaults['order']:
+        operations.append(('order_by',) + tuple(arguments.order or defaults['order']) + (options,))
+
+    stages = {
+        arguments.resource: {'type': 'extract', 'resource': arguments.resource},
+        'top': {'type': 'transform', 'input': arguments.resource, 'operations': operations},
+    }
+    output_input = 'top'
+    if defaults['foreign_keys']:
+        for resource in defaults['foreign_keys'].values():
+            stages.setdefault(resource, {'type': 'extract', 'resource': resource})
+        stages['joined'] = {'type': 'join', 'input': 'top', 'foreign_keys': defaults['foreign_keys']}
+        output_input = 'joined'
+
+    load = {'type': 'load', 'input': output_input, 'exporter': arguments.format, 'fields': defaults['fields'],
+            'upload': not (arguments.no_upload or arguments.snapshot)}
+    if arguments.output:
+        load['file_path'] = arguments.output
+    elif arguments.format == 'csv':
+        load['file_path'] = 'output.csv'
+    stages['output'] = load
+    return stages
+
+
+def configure(arguments):
+    """
+    Apply the logging, concurrency, cache and metrics options to config, before the rest of the project is imported
+    """
+    configure_logging(level=arguments.log_level)
+    config.REQUESTER_MAX_WORKERS = config.HTTP_POOL_MAXSIZE = arguments.workers
+    config.RATE_LIMIT_DEFAULT = dict(config.RATE_LIMIT_DEFAULT, max_concurrency=arguments.workers)
+    config.REQUESTER_CONCURRENT = not arguments.sequential
+    config.CACHE_BACKEND = arguments.cache
+    config.METRICS_OUTPUT = arguments.metrics_output
+    if arguments.processes:
+        config.SHARDED = True
+        config.SHARD_WORKERS = arguments.processes
+        if arguments.cache != 'memory':
+            config.SHARD_CACHE_BACKEND = arguments.cache
+    if arguments.profile:
+        config.PROFILE = True
+        config.PROFILE_DIR = arguments.profile
+
+
+def run(args=None):
+    """
+    Run the ETL with the command line options
+    :param args: list of arguments [Default: sys.argv]
+    :return: results of main.main
+    """
+    arguments = parse_args(args)
+    configure(arguments)
+
+    start = time.perf_counter()
+    import main
+    import pipeline  # noqa: F401 imported by main.main, measured here
+    from utils import Requester, build_cache
+    import_duration = time.perf_counter() - start
+    metrics.observe('import_duration_seconds', import_duration)
+    log.info("Modules imported in %.1fms", import_duration * 1000)
+
+    # The requesters cache is built when utils is imported, which may have happened before the options were applied
+    Requester.set_cache(build_cache(arguments.cache))
+
+    return main.main(incremental=arguments.incremental, stages=build_stages(arguments), snapshot=arguments.snapshot)
+
+
+if __name__ == '__main__':
+    run()
@@ -1,10 +1,121 @@
-import logging
+import os
 
-logging.basicConfig(level=logging.DEBUG)
+# Logging configured by the command line entry points (logging_config.py): level, format and whether records are
+# written by a listener thread (QueueHandler / QueueListener) instead of the thread logging them
+LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+LOG_QUEUE = True
 
 SWAPI_BASE_URL = 'https://swapi.co/api'
 PEOPLE = 'people'
 SPECIES = 'species'
 
+# Number of worker threads used to fetch the remaining pages of a collection once the first page is known.
+# Set REQUESTER_CONCURRENT to False to walk the `next` links one by one instead.
+REQUESTER_CONCURRENT = True
+REQUESTER_MAX_WORKERS = 8
+
+# Cache backend used by the requesters: 'memory' (per process), 'sqlite' (persistent between runs) or 'redis'
+# (shared by several nodes, needs the redis package and a Redis compatible server)
+CACHE_BACKEND = 'memory'
+CACHE_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'swapi.sqlite3')
+REDIS_URL = 'redis://localhost:6379/0'
+REDIS_KEY_PREFIX = 'swapi:'
+# In memory cache bounds (least recently used entries are evicted first) and default TTL in seconds (None: no expiry)
+MEMORY_CACHE_MAX_ENTRIES = 1024
+MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024
+MEMORY_CACHE_TTL = None
+# Seconds a response is served from the persistent cache before it is revalidated with a conditional GET
+CACHE_TTL = {PEOPLE: 24 * 60 * 60, SPECIES: 7 * 24 * 60 * 60}
+CACHE_DEFAULT_TTL = 60 * 60
+
+# Offline snapshot (snapshot.py): file written by `python snapshot.py dump` and resources crawled into it
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'swapi.snapshot')
+SNAPSHOT_RESOURCES = (PEOPLE, SPECIES)
+
+# Pipeline run by main(): stages by name with a type and options, stages depend on the stages they take results
+# from ('input' and the 'foreign_keys' of join stages) and stages without pending dependencies run concurrently.
+# - extract: fetch every object of a SWAPI resource, optionally narrowed with 'filter' lookups and split across
+#   worker processes with 'sharded' (see SHARDED)
+# - transform: apply 'operations' to the input query set: ('filter', {lookups}), ('order_by', attribute) and
+#   ('slice', start, stop)
+# - join: replace the urls of the 'foreign_keys' fields of the input by the names of the objects of other stages
+# - load: export the input with an exporter ('csv', 'ndjson', 'arrow', 'parquet') and optionally upload it to httpbin
+PIPELINE = {
+    'people': {'type': 'extract', 'resource': PEOPLE},
+    'species': {'type': 'extract', 'resource': SPECIES},
+    'top_people': {'type': 'transform', 'input': 'people',
+                   'operations': [('order_by', 'films_count'), ('slice', 0, 10), ('order_by', 'height')]},
+    'top_people_species': {'type': 'join', 'input': 'top_people', 'foreign_keys': {'species': 'species'}},
+    'csv': {'type': 'load', 'input': 'top_people_species', 'exporter': 'csv', 'file_path': 'output.csv',
+            'fields': {'name': 'name', 'species': 'species', 'height': 'height', 'appearances': 'films_count'},
+            'upload': True},
+}
+PIPELINE_MAX_WORKERS = 4
+
+# Sharded extraction (sharding.py): extract stages split the pages of their collection in shards of SHARD_PAGES
+# pages fetched by SHARD_WORKERS processes sharing the SHARD_CACHE_BACKEND cache (the memory cache is not shared)
+SHARDED = False
+SHARD_WORKERS = 4
+SHARD_PAGES = 2
+SHARD_CACHE_BACKEND = 'sqlite'
+# Workers are spawned rather than forked, a fork would copy the locks held by the threads of the coordinator
+SHARD_START_METHOD = 'spawn'
+
+# Incremental runs (main(incremental=True)): snapshot of the last extraction
+INCREMENTAL = False
+INCREMENTAL_SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'people_snapshot.json')
+
+# Distinct foreign key urls above which resolve_foreign_keys pulls the whole target collection (a few pages)
+# instead of requesting every object on its own
+FK_COLLECTION_THRESHOLD = 10
+
+# AsyncRequester: requests in flight at the same time, connections kept by the shared client and timeout in seconds
+ASYNC_MAX_CONCURRENCY = 10
+ASYNC_MAX_CONNECTIONS = 10
+ASYNC_REQUEST_TIMEOUT = 30
+
+# Shared HTTP session (Requester and HTTPBin): connection pool, timeout (connect, read) in seconds and retries of
+# connection errors / HTTP_RETRY_STATUSES with exponential backoff (backoff_factor * 2 ** retry) plus random jitter.
+# Throttling statuses (429 / 503) are retried by the rate limiter below instead
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = REQUESTER_MAX_WORKERS
+HTTP_TIMEOUT = (5, 30)
+HTTP_RETRIES = 3
+HTTP_RETRY_BACKOFF_FACTOR = 0.5
+HTTP_RETRY_JITTER = 0.5
+HTTP_RETRY_STATUSES = (500, 502, 504)
+HTTP_RETRY_METHODS = ('GET', 'HEAD')
+
+# Client side rate limiting per host name (ratelimit.py): token bucket of `rate` requests per second (None: no limit)
+# holding `burst` tokens and an AIMD limit of requests in flight between min_concurrency and max_concurrency, that
+# grows while responses are fine and is multiplied by decrease_factor on RATE_LIMIT_STATUSES responses or responses
+# slower than target_latency seconds. Throttled GET / HEAD requests are retried up to RATE_LIMIT_RETRIES times after
+# their Retry-After (capped to RATE_LIMIT_MAX_RETRY_AFTER seconds) or HTTP_RETRY_BACKOFF_FACTOR backoff.
+RATE_LIMIT_DEFAULT = {'rate': None, 'burst': 1, 'initial_concurrency': None, 'min_concurrency': 1,
+                      'max_concurrency': REQUESTER_MAX_WORKERS, 'target_latency': 5, 'decrease_factor': 0.5}
+RATE_LIMITS = {'swapi.co': {'rate': 10, 'burst': 20}}
+RATE_LIMIT_STATUSES = (429, 503)
+RATE_LIMIT_RETRIES = 3
+RATE_LIMIT_MAX_RETRY_AFTER = 60
+
+# CSV output: relative file paths are placed inside OUTPUT_DIR, rows go through a write buffer of CSV_BUFFER_SIZE bytes
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+CSV_BUFFER_SIZE = 1024 * 1024
+# Rows written at once by the NDJSON / Arrow / Parquet exporters
+EXPORT_BATCH_SIZE = 10000
+
+# Metrics dumped at the end of main(): file path (None: logged) and format ('json' / 'prometheus'), histogram buckets
+METRICS_OUTPUT = None
+METRICS_FORMAT = 'json'
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Profiling of the stages (main(profile=True) / cli.py --profile): pstats, collapsed stacks and allocation reports
+PROFILE = False
+PROFILE_DIR = os.path.join(OUTPUT_DIR, 'profile')
+PROFILE_TOP_ALLOCATIONS = 10
+
 HTTPBIN_BASE_URL = 'http://httpbin.org'
 HTTPBIN_FILE_ENDPOINT = 'post'
+# Bytes read from the file at a time while it is uploaded
+HTTPBIN_CHUNK_SIZE = 64 * 1024
@@ -1,7 +1,18 @@
+import contextlib
 import csv
+import gzip
+import io
 import logging
 import os
 
+import config
+from metrics import registry as metrics
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
 
 class CSVHandler:
     class MissingCSVFields(Exception):
@@ -10,36 +21,111 @@ class CSVHandler:
         """
         pass
 
-    def __init__(self, items, fields=None, delimiter=',', quotechar='"', include_headers=True, file_path='output.csv'):
+    COMPRESSIONS = (None, 'gzip', 'zstd')
+
+    def __init__(self, items, fields=None, delimiter=',', quotechar='"', include_headers=True, file_path='output.csv',
+                 file_obj=None, compression=None, buffer_size=None):
         """
+        Rows are written while the items are consumed, so items can be any iterable (a generator from the extractor
+        for example) and memory does not grow with the number of rows.
 
         :param items: items to be dump to the csv file
         :param fields: map of the field names and attributes inside the items following {'header_name':'attribute_name'}
         :param delimiter: csv delimited [Default: ',']
         :param quotechar: csv quotechar [Default: '"']
         :param include_headers: boolean to include headers or not [Default: True]
-        :param file_path: csv file path [Default: 'output.csv']
+        :param file_path: csv file path, relative paths are placed inside config.OUTPUT_DIR [Default: 'output.csv']
+        :param file_obj: file-like object to write to instead of file_path (binary when compression is used)
+        :param compression: None / 'gzip' / 'zstd' [Default: None]
+        :param buffer_size: size in bytes of the write buffer [Default: config.CSV_BUFFER_SIZE]
         """
         self.log = logging.getLogger(self.__class__.__name__)
 
-        self.file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output', file_path)
         if not fields:
             raise CSVHandler.MissingCSVFields
+        if compression not in self.COMPRESSIONS:
+            raise ValueError('Invalid compression: {}'.format(compression))
 
-        headers = fields.keys()
-        items_fields = fields.values()
+        self.file_path = None if file_obj is not None else os.path.join(config.OUTPUT_DIR, file_path)
+        self.compression = compression
+        self.buffer_size = buffer_size or config.CSV_BUFFER_SIZE
+        self.rows_written = 0
 
-        rows = []
-        for item in items:
-            rows.append([str(getattr(item, field)) if field else '' for field in items_fields])
+        headers = fields.keys()
+        items_fields = list(fields.values())
 
-        with open(self.file_path, mode='w') as csv_file:
+        with metrics.stage('csv_write'), self._open(file_obj) as csv_file:
             writer = csv.writer(csv_file, delimiter=delimiter, quotechar=quotechar, quoting=csv.QUOTE_MINIMAL)
             if include_headers:
-                logging.debug("Writting headers to file %s", headers)
+                self.log.debug("Writting headers to file %s", headers)
                 writer.writerow(headers)
-            for row in rows:
-                logging.debug("Writting row to file %s", row)
-                writer.writerow(row)
+            for item in items:
+                writer.writerow([str(getattr(item, field)) if field else '' for field in items_fields])
+                self.rows_written += 1
+        metrics.inc('csv_rows_total', self.rows_written)
+
+        self.log.info("CSV file generated successfuly: %s (%s rows)", self.file_path or file_obj, self.rows_written)
+
+    @contextlib.contextmanager
+    def _open(self, file_obj):
+        """
+        Open the text stream the csv writer writes to, through the write buffer and the compressor if any
+        :param file_obj: file-like object / None to open self.file_path
+        """
+        if self.file_path is not None:
+            directory = os.path.dirname(self.file_path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        if self.compression is None:
+            if file_obj is not None:
+                yield file_obj
+            else:
+                with open(self.file_path, mode='w', newline='', buffering=self.buffer_size) as csv_file:
+                    yield csv_file
+            return
+
+        raw_file = file_obj if file_obj is not None else open(self.file_path, mode='wb', buffering=self.buffer_size)
+        try:
+            with io.TextIOWrapper(self._compressor(raw_file), encoding='utf-8', newline='') as csv_file:
+                yield csv_file
+        finally:
+            if file_obj is None:
+                raw_file.close()
+
+    def _compressor(self, raw_file):
+        """
+        Binary stream compressing on the fly into raw_file, closing it leaves raw_file open
+        """
+        if self.compression == 'gzip':
+            return gzip.GzipFile(fileobj=raw_file, mode='wb')
+        if zstandard is None:
+            raise ImportError('zstd compression requires the zstandard package')
+        return zstandard.ZstdCompressor().stream_writer(raw_file, closefd=False)
+
+
+def csv_chunks(items, fields=None, delimiter=',', quotechar='"', include_headers=True, chunk_size=None,
+               encoding='utf-8'):
+    """
+    Produce the CSV content of the items as encoded chunks without writing any file, for example to upload it
+    straight away with HTTPBin().send_file(file=csv_chunks(...)). Same fields contract as CSVHandler
 
-            logging.info("CSV file generated successfuly: %s", self.file_path)
+    :param chunk_size: approximate size of the chunks in characters [Default: config.CSV_BUFFER_SIZE]
+    :return: generator of bytes
+    """
+    if not fields:
+        raise CSVHandler.MissingCSVFields
+    chunk_size = chunk_size or config.CSV_BUFFER_SIZE
+    items_fields = list(fields.values())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=delimiter, quotechar=quotechar, quoting=csv.QUOTE_MINIMAL)
+    if include_headers:
+        writer.writerow(fields.keys())
+    for item in items:
+        writer.writerow([str(getattr(item, field)) if field else '' for field in items_fields])
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode(encoding)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode(encoding)
@@ -0,0 +1,175 @@
+import itertools
+import json
+import logging
+import os
+
+import config
+from csv_handler import CSVHandler
+
+pyarrow = None
+
+
+def load_pyarrow():
+    """
+    Import pyarrow on first use, it is optional and takes longer to import than the rest of the project
+    :return: pyarrow module / None if not installed
+    """
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.ipc
+            import pyarrow.parquet
+        except ImportError:  # Arrow and Parquet exports are optional
+            pyarrow = None
+    return pyarrow
+
+
+class BaseExporter:
+    """
+    Base exporter sharing the fields contract of CSVHandler ({'header_name': 'attribute_name'}), values keep their
+    type (None, int, str) instead of being converted to strings. Items are consumed and written in batches, so any
+    iterable works and memory only holds one batch.
+    """
+    default_file_path = None
+
+    def __init__(self, items, fields=None, file_path=None, file_obj=None, batch_size=None):
+        """
+        :param items: items to be exported
+        :param fields: map of the field names and attributes inside the items following {'header_name':'attribute_name'}
+        :param file_path: output file path, relative paths are placed inside config.OUTPUT_DIR
+        :param file_obj: file-like object to write to instead of file_path
+        :param batch_size: number of items written at once [Default: config.EXPORT_BATCH_SIZE]
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        if not fields:
+            raise CSVHandler.MissingCSVFields
+
+        self.fields = fields
+        self.batch_size = batch_size or config.EXPORT_BATCH_SIZE
+        self.rows_written = 0
+        self.file_path = None
+        if file_obj is None:
+            self.file_path = os.path.join(config.OUTPUT_DIR, file_path or self.default_file_path)
+            directory = os.path.dirname(self.file_path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        self.write(self.batches(items), file_obj)
+        self.log.info("%s file generated successfuly: %s (%s rows)", self.__class__.__name__,
+                      self.file_path or file_obj, self.rows_written)
+
+    def batches(self, items):
+        """
+        Yield lists of rows {header_name: value} of at most batch_size rows
+        """
+        fields = list(self.fields.items())
+        items = iter(items)
+        while True:
+            batch = [{header: getattr(item, field) if field else None for header, field in fields}
+                     for item in itertools.islice(items, self.batch_size)]
+            if not batch:
+                return
+            self.rows_written += len(batch)
+            yield batch
+
+    def write(self, batches, file_obj):
+        raise NotImplementedError
+
+
+class NDJSONExporter(BaseExporter):
+    """
+    Newline delimited JSON, one object per row
+    """
+    default_file_path = 'output.ndjson'
+
+    def write(self, batches, file_obj):
+        output = file_obj if file_obj is not None else open(self.file_path, mode='w', encoding='utf-8')
+        try:
+            for batch in batches:
+                output.write(''.join(json.dumps(row) + '\n' for row in batch))
+        finally:
+            if file_obj is None:
+                output.close()
+
+
+class ArrowExporter(BaseExporter):
+    """
+    Apache Arrow IPC file (one record batch per batch of rows), it can be memory mapped by the readers.
+    Unless it is given, the type of every column is the type of its first value: batches are held back while some
+    column has only seen None, and columns that never get a value are written with the null type
+    """
+    default_file_path = 'output.arrow'
+
+    def __init__(self, items, fields=None, file_path=None, file_obj=None, batch_size=None, schema=None):
+        """
+        :param schema: pyarrow.Schema of the rows [Default: inferred from the first value of every column]
+        """
+        if load_pyarrow() is None:
+            raise ImportError('{} requires the pyarrow package'.format(self.__class__.__name__))
+        self.schema = schema
+        super(ArrowExporter, self).__init__(items, fields=fields, file_path=file_path, file_obj=file_obj,
+                                            batch_size=batch_size)
+
+    def record_batches(self, batches):
+        pending = []
+        types = {}
+        for batch in batches:
+            if self.schema is not None:
+                yield pyarrow.RecordBatch.from_pylist(batch, schema=self.schema)
+                continue
+            pending.append(batch)
+            for field in pyarrow.RecordBatch.from_pylist(batch).schema:
+                if not pyarrow.types.is_null(field.type):
+                    types.setdefault(field.name, field.type)
+            if len(types) == len(self.fields):
+                self.schema = pyarrow.schema([(header, types[header]) for header in self.fields])
+                yield from self._flush(pending)
+        if self.schema is None and pending:
+            self.schema = pyarrow.schema([(header, types.get(header, pyarrow.null())) for header in self.fields])
+        yield from self._flush(pending)
+
+    def _flush(self, pending):
+        """
+        Record batches of the batches held back while the schema was not known, in order
+        """
+        while pending:
+            yield pyarrow.RecordBatch.from_pylist(pending.pop(0), schema=self.schema)
+
+    def open_writer(self, sink):
+        return pyarrow.ipc.new_file(sink, self.schema)
+
+    def write(self, batches, file_obj):
+        record_batches = self.record_batches(batches)
+        first_batch = next(record_batches, None)
+        if first_batch is None:
+            if self.schema is None:
+                self.schema = pyarrow.schema([(header, pyarrow.null()) for header in self.fields])
+            first_batch = pyarrow.RecordBatch.from_pylist([], schema=self.schema)
+
+        writer = self.open_writer(file_obj if file_obj is not None else self.file_path)
+        try:
+            writer.write_batch(first_batch)
+            for record_batch in record_batches:
+                writer.write_batch(record_batch)
+        finally:
+            writer.close()
+
+
+class ParquetExporter(ArrowExporter):
+    """
+    Apache Parquet file (one row group per batch of rows)
+    """
+    default_file_path = 'output.parquet'
+
+    def open_writer(self, sink):
+        return pyarrow.parquet.ParquetWriter(sink, self.schema)
+
+
+# Output formats by name
+EXPORTERS = {
+    'csv': CSVHandler,
+    'ndjson': NDJSONExporter,
+    'arrow': ArrowExporter,
+    'parquet': ParquetExporter,
+}
@@ -0,0 +1,159 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import config
+from ratelimit import RateLimiter, parse_retry_after
+
+log = logging.getLogger("HTTPSession")
+
+
+class JitterRetry(Retry):
+    """
+    Retry with exponential backoff plus a random jitter, so concurrent workers failing at the same time do not retry
+    at the same time
+    """
+
+    def get_backoff_time(self):
+        backoff = super(JitterRetry, self).get_backoff_time()
+        if backoff <= 0:
+            return backoff
+        return backoff + random.uniform(0, config.HTTP_RETRY_JITTER)
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter applying a default timeout to every request that does not define its own one
+    """
+
+    def __init__(self, timeout=None, *args, **kwargs):
+        """
+        :param timeout: seconds or tuple (connect, read) seconds
+        """
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+
+class RateLimitedSession(requests.Session):
+    """
+    Session sending every request through the client side limiter of its host (see ratelimit.py). Throttled GET /
+    HEAD responses (config.RATE_LIMIT_STATUSES) are retried after their Retry-After, or after an exponential backoff
+    with jitter when the server does not send one
+    """
+
+    def __init__(self, limiter=None):
+        """
+        :param limiter: RateLimiter [Default: RateLimiter()]
+        """
+        super(RateLimitedSession, self).__init__()
+        self.limiter = limiter or RateLimiter()
+
+    def send(self, request, **kwargs):
+        # requests follows redirects by calling send again from inside send, the first response would keep its
+        # concurrency slot while the redirect waits for another one (a deadlock once the limit is down to 1). Every
+        # hop is sent on its own and the redirects are followed once its slot is released
+        allow_redirects = kwargs.pop('allow_redirects', True)
+        response = self._send_limited(request, allow_redirects=False, **kwargs)
+        if not allow_redirects or not response.is_redirect:
+            return response
+        history = [response] + list(self.resolve_redirects(response, request, **kwargs))
+        response = history.pop()
+        response.history = history
+        return response
+
+    def _send_limited(self, request, **kwargs):
+        """
+        Send a request through the limiter of its host, retrying throttled GET / HEAD responses
+        """
+        host_limiter = self.limiter.for_host(urlparse(request.url).hostname)
+        retries = config.RATE_LIMIT_RETRIES if request.method in config.HTTP_RETRY_METHODS else 0
+        attempt = 0
+        while True:
+            started_at = host_limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = super(RateLimitedSession, self).send(request, **kwargs)
+            except Exception:
+                host_limiter.release(started_at)
+                raise
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            host_limiter.release(started_at, status=response.status_code, latency=time.perf_counter() - start,
+                                 retry_after=retry_after)
+            if response.status_code not in config.RATE_LIMIT_STATUSES or attempt >= retries:
+                return response
+            if retry_after is None:
+                backoff = config.HTTP_RETRY_BACKOFF_FACTOR * 2 ** attempt
+                host_limiter.block(backoff + random.uniform(0, config.HTTP_RETRY_JITTER) if backoff > 0 else 0)
+            log.debug("Retrying throttled request %s", request.url)
+            response.close()
+            attempt += 1
+
+
+def raise_for_status(response):
+    """
+    Raise requests.HTTPError for any response that is not a 2xx, including the 3xx raise_for_status lets through
+    :param response: requests.Response
+    """
+    response.raise_for_status()
+    if not 200 <= response.status_code < 300:
+        raise requests.HTTPError('Unexpected status {} for url: {}'.format(response.status_code, response.url),
+                                 response=response)
+
+
+def build_session():
+    """
+    Build a session keeping connections alive on a pool, retrying connection errors and 5xx responses with
+    exponential backoff and jitter and rate limited per host. Settings come from config.HTTP_* / config.RATE_LIMIT*
+    :return: RateLimitedSession
+    """
+    retry = JitterRetry(total=config.HTTP_RETRIES, connect=config.HTTP_RETRIES, read=config.HTTP_RETRIES,
+                        status=config.HTTP_RETRIES, backoff_factor=config.HTTP_RETRY_BACKOFF_FACTOR,
+                        status_forcelist=config.HTTP_RETRY_STATUSES, allowed_methods=config.HTTP_RETRY_METHODS,
+                        raise_on_status=False)
+    adapter = TimeoutHTTPAdapter(timeout=config.HTTP_TIMEOUT, pool_connections=config.HTTP_POOL_CONNECTIONS,
+                                 pool_maxsize=config.HTTP_POOL_MAXSIZE, max_retries=retry)
+    session = RateLimitedSession()
+    session.headers['Connection'] = 'keep-alive'
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+_session = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Session shared by Requester and HTTPBin, built on first use
+    :return: requests.Session
+    """
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                log.debug("Building HTTP session with a pool of %s connections", config.HTTP_POOL_MAXSIZE)
+                _session = build_session()
+    return _session
+
+
+def close_session():
+    """
+    Close the shared session and its pooled connections, next get_session call will build a new one
+    """
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -1,12 +1,78 @@
+import base64
+import hashlib
+import itertools
 import logging
-
-import requests
+import os
+import time
+import uuid
 
 import config
+from metrics import registry as metrics
 
 log = logging.getLogger("HTTPBin")
 
 
+class MultipartStream:
+    """
+    multipart/form-data body with a single file field, the file content is read in chunks while requests sends the
+    body and hashed on the way, so the file is read only once and never held in memory.
+    When the size of the content is known the body has a Content-Length, otherwise it is sent chunked.
+    """
+
+    def __init__(self, chunks, size=None, field_name='file', filename='file'):
+        """
+        :param chunks: iterable of bytes with the file content
+        :param size: size of the file content in bytes / None if unknown
+        :param field_name: name of the form field
+        :param filename: file name sent on the form field
+        """
+        self.boundary = uuid.uuid4().hex
+        self.digest = hashlib.sha256()
+        self.content_type = 'multipart/form-data; boundary={}'.format(self.boundary)
+        head = ('--{}\r\nContent-Disposition: form-data; name="{}"; filename="{}"\r\n'
+                'Content-Type: application/octet-stream\r\n\r\n').format(self.boundary, field_name, filename).encode()
+        tail = '\r\n--{}--\r\n'.format(self.boundary).encode()
+        if size is not None:
+            # requests uses the len attribute as Content-Length
+            self.len = len(head) + size + len(tail)
+        self._parts = itertools.chain([head], self._hash(chunks), [tail])
+        self._buffer = b''
+        self.bytes_read = 0
+
+    def _hash(self, chunks):
+        for chunk in chunks:
+            if chunk:
+                self.digest.update(chunk)
+                yield chunk
+
+    def read(self, size=-1):
+        while size is None or size < 0 or len(self._buffer) < size:
+            part = next(self._parts, None)
+            if part is None:
+                break
+            self._buffer += part
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        self.bytes_read += len(data)
+        return data
+
+    def __iter__(self):
+        if self._buffer:
+            yield self.read()
+        for part in self._parts:
+            self.bytes_read += len(part)
+            yield part
+
+    def hexdigest(self):
+        """
+        Digest of the file content, the content not consumed by the transport yet is read to complete it
+        """
+        for _ in self._parts:
+            pass
+        return self.digest.hexdigest()
+
+
 class HTTPBin:
     """
     Class to interact with HTTPBIN.org page
@@ -17,27 +83,72 @@ class HTTPBin:
 
     def send_file(self, file):
         """
-        Send file to httpbin.org, if the file is not uploaded correctly it will raise an Exception
-        :param file: file path
+        Send file to httpbin.org as a streamed multipart body, if the file is not uploaded correctly it will raise an
+        Exception
+        :param file: file path, binary file-like object or iterable of bytes (an in-memory CSV producer for example)
         """
-        response = requests.post("{}/{}".format(config.HTTPBIN_BASE_URL, config.HTTPBIN_FILE_ENDPOINT),
-                                 files={'file': open(file, mode='rb')})
+        with metrics.stage('upload'):
+            self.__send_file(file)
+
+    def __send_file(self, file):
+        if isinstance(file, str):
+            with open(file, mode='rb') as f:
+                self.__send(chunks=self.__read_chunks(f), size=os.fstat(f.fileno()).st_size,
+                            filename=os.path.basename(file))
+        elif hasattr(file, 'read'):
+            size = None
+            if hasattr(file, 'seekable') and file.seekable():
+                position = file.tell()
+                size = file.seek(0, os.SEEK_END) - position
+                file.seek(position)
+            self.__send(chunks=self.__read_chunks(file), size=size)
+        else:
+            self.__send(chunks=file)
+
+    @staticmethod
+    def __read_chunks(file):
+        return iter(lambda: file.read(config.HTTPBIN_CHUNK_SIZE), b'')
+
+    def __send(self, chunks, size=None, filename='file'):
+        from http_session import get_session
+
+        stream = MultipartStream(chunks=chunks, size=size, filename=filename)
+        start = time.perf_counter()
+        response = get_session().post("{}/{}".format(config.HTTPBIN_BASE_URL, config.HTTPBIN_FILE_ENDPOINT),
+                                      data=stream, headers={'Content-Type': stream.content_type})
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - start, method='POST')
+        metrics.inc('http_requests_total', method='POST', status=response.status_code)
+        metrics.inc('http_sent_bytes_total', stream.bytes_read, method='POST')
+        metrics.inc('http_received_bytes_total', len(response.content), method='POST')
         response.raise_for_status()
-        self.__check_response(response=response.json(), file=file)
+        self.__check_response(response=response.json(), digest=stream.hexdigest())
+
+    @staticmethod
+    def __echoed_bytes(content):
+        """
+        httpbin.org echoes text files as they are and binary ones (Arrow / Parquet) as a base64 data url
+        :param content: echoed file content
+        :return: bytes sent
+        """
+        if content.startswith('data:'):
+            header, _, data = content.partition(',')
+            if header.endswith(';base64'):
+                return base64.b64decode(data)
+        return content.encode('utf-8')
 
-    def __check_response(self, response, file):
+    def __check_response(self, response, digest):
         """
-        Check response, httpbin.org will echo the sent data, so file integrity can be checked, if integrity check fails
-        exception will be raised
+        Check response, httpbin.org will echo the sent data, so file integrity can be checked comparing the digest
+        of the echoed content with the digest computed while sending, if integrity check fails exception will be raised
         :param response: response from httpbin.org
-        :param file: file path
+        :param digest: sha256 hex digest of the sent content
         """
-        response_file_content = response.get('files', {}).get('file').replace('\n', '').replace('\r', '')
-        file_content = ''.join(open(file, mode='r').readlines()).replace('\n', '').replace('\r', '')
-        if response_file_content != file_content:
+        response_file_content = response.get('files', {}).get('file') or ''
+        response_digest = hashlib.sha256(self.__echoed_bytes(response_file_content)).hexdigest()
+        if response_digest != digest:
             raise HTTPBin.FileIntegrityError(
                 "Issue uploading file to httpbin, content recieved on their end is different Local: %s vs Remote: %s",
-                file_content, response_file_content)
+                digest, response_digest)
 
-        logging.info("Intergity of uploaded file OK")
-        logging.info("File successfully uploaded to %s/post", config.HTTPBIN_BASE_URL)
+        log.info("Intergity of uploaded file OK")
+        log.info("File successfully uploaded to %s/post", config.HTTPBIN_BASE_URL)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+
+import config
+from csv_handler import CSVHandler
+from httpbin import HTTPBin
+from metrics import registry as metrics
+from models import PeopleQuerySet, Person, Species, SpeciesQuerySet
+from sqlite_cache import SQLiteCache
+from utils import Requester
+
+log = logging.getLogger("IncrementalETL")
+
+CSV_FIELDS = {'name': 'name', 'species': 'species', 'height': 'height', 'appearances': 'films_count'}
+
+
+class Snapshot:
+    """
+    Last extraction stored as JSON: the serialized people and the species names by url with their SWAPI `edited`
+    timestamp and the fingerprint / file of the last generated output
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = {}
+        self.species = {}
+        self.result = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                content = json.load(f)
+            self.records = content.get('records', {})
+            self.species = content.get('species', {})
+            self.result = content.get('result', {})
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        temporary_path = '{}.tmp'.format(self.path)
+        with open(temporary_path, mode='w') as f:
+            json.dump({'records': self.records, 'species': self.species, 'result': self.result}, f)
+        os.replace(temporary_path, self.path)
+
+
+class IncrementalETL:
+    """
+    ETL run that only does the work needed by what changed upstream since the last run:
+    - every page is revalidated with a conditional GET, so unchanged pages come back as 304 without a body
+    - only people / species whose `edited` timestamp changed (or new ones) are serialized again, the rest comes from
+      the snapshot
+    - the ranking is only rebuilt when some person / species changed and the CSV / upload only when the top people
+      rows (species names included) differ
+    """
+
+    def __init__(self, snapshot_path=None, cache=None, top=10, file_path='output.csv', upload=True):
+        """
+        :param snapshot_path: snapshot file path [Default: config.INCREMENTAL_SNAPSHOT_PATH]
+        :param cache: cache used while extracting [Default: SQLiteCache on config.CACHE_SQLITE_PATH revalidating every
+                      entry]
+        :param top: number of people of the ranking
+        :param file_path: CSV file path
+        :param upload: upload the CSV to httpbin when it changes
+        """
+        self.snapshot = Snapshot(snapshot_path or config.INCREMENTAL_SNAPSHOT_PATH)
+        self.cache = cache if cache is not None else SQLiteCache(ttl={}, default_ttl=0)
+        self.top = top
+        self.file_path = file_path
+        self.upload = upload
+
+    @staticmethod
+    def _extract_records(query_set, previous, build):
+        """
+        Walk the pages of a collection comparing the `edited` timestamps with the previous records
+        :param query_set: query set of the collection
+        :param previous: records of the snapshot by url
+        :param build: function returning the record stored for a new / changed SWAPI record
+        :return: tuple (records by url, number of new / changed / removed records)
+        """
+        records = {}
+        changes = 0
+        for page in query_set.iter_raw_pages():
+            for record in page.get('results', []):
+                kept = previous.get(record['url'])
+                if kept is not None and kept['edited'] == record.get('edited'):
+                    records[record['url']] = kept
+                else:
+                    records[record['url']] = dict(build(record), edited=record.get('edited'))
+                    changes += 1
+        changes += len(set(previous) - set(records))
+        return records, changes
+
+    def extract(self):
+        """
+        Walk the people and species pages comparing the `edited` timestamps with the snapshot
+        :return: tuple (list of people, list of species, number of new / changed / removed people and species)
+        """
+        people, people_changes = self._extract_records(
+            PeopleQuerySet(), self.snapshot.records, lambda record: {'person': Person.from_dict(record).as_dict()})
+        species, species_changes = self._extract_records(
+            SpeciesQuerySet(), self.snapshot.species, lambda record: {'name': record.get('name')})
+        changes = people_changes + species_changes
+        metrics.inc('incremental_changed_records_total', changes)
+        self.snapshot.records, self.snapshot.species = people, species
+        return ([Person.from_attributes(record['person']) for record in people.values()],
+                [Species(name=record['name'], url=url) for url, record in species.items()], changes)
+
+    @staticmethod
+    def fingerprint(people):
+        """
+        Fingerprint of the ranking rows, after resolving the foreign keys
+        """
+        rows = [[person.url, person.name, person.height, person.films_count, person.species] for person in people]
+        return hashlib.sha256(json.dumps(rows).encode('utf-8')).hexdigest()
+
+    def _output_is_current(self):
+        return bool(self.snapshot.result) and os.path.isfile(self.snapshot.result.get('file_path', ''))
+
+    def run(self):
+        """
+        Run the ETL
+        :return: CSV file path (the previous one when nothing changed)
+        """
+        previous_cache = Requester.get_cache()
+        Requester.set_cache(self.cache)
+        try:
+            with metrics.stage('fetch'):
+                people, species, changes = self.extract()
+            if not changes and self._output_is_current():
+                log.info("No changes upstream, keeping %s", self.snapshot.result['file_path'])
+                return self.snapshot.result['file_path']
+
+            with metrics.stage('rank'):
+                top_people = PeopleQuerySet(items=people, foreign_keys={'species': SpeciesQuerySet(items=species)}) \
+                    .order_by('films_count')[0:self.top].order_by('height')
+                # Species names come from the extracted species, no request
+                top_people.resolve_foreign_keys()
+                fingerprint = self.fingerprint(top_people)
+            if fingerprint == self.snapshot.result.get('fingerprint') and self._output_is_current():
+                log.info("%s records changed upstream but the ranking did not, keeping %s", changes,
+                         self.snapshot.result['file_path'])
+                self.snapshot.save()
+                return self.snapshot.result['file_path']
+
+            csv_file = CSVHandler(items=top_people, fields=CSV_FIELDS, file_path=self.file_path)
+            if self.upload:
+                HTTPBin().send_file(file=csv_file.file_path)
+            self.snapshot.result = {'fingerprint': fingerprint, 'file_path': csv_file.file_path}
+            self.snapshot.save()
+            return csv_file.file_path
+        finally:
+            Requester.set_cache(previous_cache)
@@ -0,0 +1,31 @@
+"""
+JSON decoding / encoding through orjson when it is installed, the standard library json module otherwise
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def loads(data):
+    """
+    Decode a JSON document
+    :param data: bytes / str
+    :return: decoded value
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value):
+    """
+    Encode a value as a JSON document
+    :param value: value made of dicts, lists and scalars
+    :return: str
+    """
+    if orjson is not None:
+        return orjson.dumps(value).decode('utf-8')
+    return json.dumps(value)
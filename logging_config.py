@@ -0,0 +1,73 @@
+"""
+Logging setup of the command line entry points. With config.LOG_QUEUE the calling thread only merges the message
+arguments and puts the record on a queue, the handlers of a QueueListener thread format and write it, so formatting
+and slow handlers (a terminal, a network file system) do not block the ETL threads.
+"""
+import atexit
+import copy
+import logging
+import logging.handlers
+import queue
+
+import config
+
+_listener = None
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler leaving the formatting to the handlers of the listener. The standard prepare formats the record
+    (exception traceback included) on the calling thread, this one only merges the arguments into the message, so
+    later changes of mutable arguments do not show up in the log
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging(level=None, use_queue=None, handlers=None):
+    """
+    Configure the root logger
+    :param level: logging level name / number [Default: config.LOG_LEVEL]
+    :param use_queue: write the records from a listener thread [Default: config.LOG_QUEUE]
+    :param handlers: handlers writing the records [Default: a stderr StreamHandler using config.LOG_FORMAT]
+    :return: the QueueListener / None when the handlers run on the calling thread
+    """
+    global _listener
+    shutdown_logging()
+    level = level if level is not None else config.LOG_LEVEL
+    use_queue = config.LOG_QUEUE if use_queue is None else use_queue
+    if handlers is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(config.LOG_FORMAT))
+        handlers = [handler]
+
+    root = logging.getLogger()
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if use_queue:
+        records = queue.SimpleQueue()
+        root.addHandler(DeferredQueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+    else:
+        for handler in handlers:
+            root.addHandler(handler)
+    return _listener
+
+
+def shutdown_logging():
+    """
+    Write the queued records and stop the listener thread
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -1,20 +1,43 @@
-from csv_handler import CSVHandler
-from httpbin import HTTPBin
-from models import PeopleQuerySet, SpeciesQuerySet
+import logging
 
+import config
+from metrics import registry as metrics
 
-def main():
-    all_people_query_set = PeopleQuerySet(foreign_keys={'species': SpeciesQuerySet()}).get_all()
-    top_10_people_by_appearances = all_people_query_set.order_by('films_count')[0:10]
-    top_10_people_by_appearances_order_by_height = top_10_people_by_appearances.order_by('height')
-    top_10_people_by_appearances_order_by_height.resolve_foreign_keys()
+log = logging.getLogger("ETL")
 
-    csv_file = CSVHandler(items=top_10_people_by_appearances_order_by_height.items,
-                          fields={'name': 'name', 'species': 'species', 'height': 'height',
-                                  'appearances': 'films_count'})
 
-    HTTPBin().send_file(file=csv_file.file_path)
+def main(incremental=None, stages=None, profile=None, snapshot=None):
+    """
+    Run the ETL pipeline
+    :param incremental: only redo the work needed by what changed since the last run, see incremental.IncrementalETL
+                        [Default: config.INCREMENTAL]
+    :param stages: pipeline stages, see config.PIPELINE [Default: config.PIPELINE]
+    :param profile: profile every stage and write the reports to config.PROFILE_DIR, see profiling.py
+                    [Default: config.PROFILE]
+    :param snapshot: serve every request from this snapshot file, see snapshot.py (uploads defined by the stages are
+                     kept)
+    :return: results of the pipeline stages / CSV file path of incremental runs
+    """
+    if profile if profile is not None else config.PROFILE:
+        from profiling import profile as profiling
+        with profiling():
+            return main(incremental=incremental, stages=stages, profile=False, snapshot=snapshot)
+
+    if incremental if incremental is not None else config.INCREMENTAL:
+        from incremental import IncrementalETL
+        result = IncrementalETL().run()
+    elif snapshot:
+        from snapshot import run
+        result = run(snapshot, upload=True, stages=stages)
+    else:
+        from pipeline import Pipeline
+        result = Pipeline(stages).run()
+
+    log.info("Run finished: %s", metrics.summary())
+    metrics.dump()
+    return result
 
 
 if __name__ == '__main__':
-    main()
+    from cli import run
+    run()
@@ -0,0 +1,234 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+import config
+
+log = logging.getLogger("Metrics")
+
+
+class Histogram:
+    """
+    Histogram with fixed bucket upper bounds (Prometheus style)
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """
+        List of tuples (upper bound, observations <= upper bound) ending with ('+Inf', count)
+        """
+        cumulative, total = [], 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def to_dict(self):
+        return {'count': self.count, 'sum': round(self.sum, 6),
+                'buckets': {str(bound): count for bound, count in self.cumulative_counts()}}
+
+
+class MetricsRegistry:
+    """
+    Registry of counters and histograms identified by name and labels, for example
+    registry.inc('http_requests_total', method='GET', status=200)
+    registry.observe('http_request_duration_seconds', 0.2, method='GET')
+    with registry.stage('resolve_foreign_keys'): ...
+
+    It can be dumped as JSON or in Prometheus text format
+    """
+
+    def __init__(self, buckets=None):
+        """
+        :param buckets: upper bounds of the histogram buckets in seconds [Default: config.METRICS_BUCKETS]
+        """
+        self.buckets = buckets or config.METRICS_BUCKETS
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.stage_listeners = []
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase a counter
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Add an observation to a histogram
+        """
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def get(self, name, **labels):
+        """
+        Value of a counter (0 if it was never increased)
+        """
+        return self.counters.get(self._key(name, labels), 0)
+
+    def total(self, name):
+        """
+        Sum of a counter over all its labels
+        """
+        with self.lock:
+            return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def add_stage_listener(self, listener):
+        """
+        Register a listener called with the name of every stage, it returns a context manager entered while the
+        stage runs (used by profiling.Profiler)
+        """
+        self.stage_listeners.append(listener)
+
+    def remove_stage_listener(self, listener):
+        self.stage_listeners.remove(listener)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure the duration of an ETL stage as stage_duration_seconds{stage=name}
+        """
+        if not self.stage_listeners:
+            # Stages run on every query set evaluation, skip the ExitStack when nobody listens
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe('stage_duration_seconds', time.perf_counter() - start, stage=name)
+            return
+        with ExitStack() as listeners:
+            for listener in list(self.stage_listeners):
+                listeners.enter_context(listener(name))
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.observe('stage_duration_seconds', time.perf_counter() - start, stage=name)
+
+    def summary(self):
+        """
+        One line summary of the run, for example '9 pages, 82 items, 70 cache hits, 12 requests'
+        """
+        return '{} pages, {} items, {} cache hits, {} requests'.format(
+            self.total('pages_total'), self.total('items_total'), self.total('cache_hits_total'),
+            self.total('http_requests_total'))
+
+    def cache_hit_ratio(self):
+        hits, misses = self.total('cache_hits_total'), self.total('cache_misses_total')
+        return hits / float(hits + misses) if hits + misses else 0.0
+
+    def counter_values(self):
+        """
+        Copy of the counters, to work out what a piece of work added with counter_changes
+        """
+        with self.lock:
+            return dict(self.counters)
+
+    def counter_changes(self, before):
+        """
+        :param before: result of counter_values
+        :return: counters increased since then and their increase
+        """
+        with self.lock:
+            return {key: value - before.get(key, 0) for key, value in self.counters.items()
+                    if value != before.get(key, 0)}
+
+    def add_counters(self, counters):
+        """
+        Add counters recorded somewhere else (a worker process for example)
+        :param counters: result of counter_changes
+        """
+        with self.lock:
+            for key, value in counters.items():
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        with self.lock:
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = [dict(name=name, labels=dict(labels), **histogram.to_dict())
+                          for (name, labels), histogram in sorted(self.histograms.items())]
+        return {'counters': counters, 'histograms': histograms, 'cache_hit_ratio': self.cache_hit_ratio()}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2, sort_keys=True)
+
+    @staticmethod
+    def _labels(labels, **extra):
+        labels = list(labels) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(label, str(value).replace('"', '\\"')) for label, value in labels) + '}'
+
+    def to_prometheus(self):
+        """
+        Metrics in Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            declared = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append('# TYPE {} counter'.format(name))
+                lines.append('{}{} {}'.format(name, self._labels(labels), value))
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append('# TYPE {} histogram'.format(name))
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('{}_bucket{} {}'.format(name, self._labels(labels, le=bound), count))
+                lines.append('{}_sum{} {}'.format(name, self._labels(labels), histogram.sum))
+                lines.append('{}_count{} {}'.format(name, self._labels(labels), histogram.count))
+        lines.append('# TYPE cache_hit_ratio gauge')
+        lines.append('cache_hit_ratio {}'.format(self.cache_hit_ratio()))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path=None, format=None):
+        """
+        Write the metrics to a file (or log them when there is no path)
+        :param path: file path [Default: config.METRICS_OUTPUT]
+        :param format: 'json' / 'prometheus' [Default: config.METRICS_FORMAT]
+        """
+        path = path or config.METRICS_OUTPUT
+        format = format or config.METRICS_FORMAT
+        content = self.to_prometheus() if format == 'prometheus' else self.to_json()
+        if path:
+            with open(path, mode='w') as f:
+                f.write(content)
+            log.info("Metrics written to %s", path)
+        else:
+            log.info("Metrics:\n%s", content)
+        return content
+
+
+registry = MetricsRegistry()
@@ -1,11 +1,46 @@
-import config
-from utils import Requester
-
+import heapq
+import itertools
+import sys
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from operator import and_, attrgetter, itemgetter
 
-class BaseQuerySet(Requester):
+import config
+from async_utils import AsyncRequester, gather
+from metrics import registry as metrics
+
+
+# Lookups supported by BaseQuerySet.filter following field__lookup=value, field=value means field__exact=value
+LOOKUPS = {
+    'exact': lambda field_value, value: field_value == value,
+    'ne': lambda field_value, value: field_value != value,
+    'gt': lambda field_value, value: field_value is not None and field_value > value,
+    'gte': lambda field_value, value: field_value is not None and field_value >= value,
+    'lt': lambda field_value, value: field_value is not None and field_value < value,
+    'lte': lambda field_value, value: field_value is not None and field_value <= value,
+    'in': lambda field_value, value: field_value in value,
+    'contains': lambda field_value, value: field_value is not None and value in field_value,
+    'icontains': lambda field_value, value: field_value is not None and value.lower() in field_value.lower(),
+    'isnull': lambda field_value, value: (field_value is None) == value,
+}
+
+
+class BaseQuerySet(AsyncRequester):
     """
     Base query set to implement specific query sets
+
+    order_by, filter and slicing do not touch the items, they return a new query set with the operation added to a
+    query plan which only runs when the items are needed (iterating, len, indexing or self.items).
+    An order_by followed by a slice runs as a top-N selection with a heap instead of sorting every item.
+
+    Filters on a query set that has not been fetched yet are pushed down to SWAPI ?search= when they look for one of
+    the search_fields, so get_all only moves the pages matching the search.
     """
+    # Fields SWAPI matches (case insensitive, partial match) with the ?search= query parameter
+    search_fields = ()
+    # ColumnTable used by get_all(columnar=True)
+    _table_class = None
 
     def __init__(self, items=None, foreign_keys=None):
         """
@@ -21,15 +56,167 @@ class BaseQuerySet(Requester):
 
         self.items = items
         self.foreign_keys = foreign_keys
+        self.search = None
+        self._fetched = bool(items)
+
+    @property
+    def items(self):
+        """
+        Items of the query set, the query plan runs on first access
+        """
+        if self._result_cache is None:
+            self._result_cache = self._evaluate()
+        return self._result_cache
+
+    @items.setter
+    def items(self, items):
+        self._source = items
+        self._plan = []
+        self._result_cache = None
+
+    def _clone(self, operation):
+        """
+        New query set with the same source and one more operation on its query plan
+        :param operation: tuple (operation name, arguments...)
+        """
+        query_set = self.__class__(foreign_keys=self.foreign_keys)
+        query_set.search = self.search
+        query_set._fetched = self._fetched
+        if self._result_cache is not None:
+            query_set._source, query_set._plan = self._result_cache, [operation]
+        else:
+            query_set._source, query_set._plan = self._source, self._plan + [operation]
+        return query_set
+
+    @staticmethod
+    def _top_n_slice(operation):
+        """
+        Bounds of a slice operation when it can be solved as a top-N selection (non negative start / stop and no step)
+        :return: (start, stop) / None
+        """
+        if operation is None or operation[0] != 'slice':
+            return None
+        key = operation[1]
+        start = key.start or 0
+        if key.stop is None or key.stop < 0 or start < 0 or key.step not in (None, 1):
+            return None
+        return start, key.stop
+
+    def _evaluate(self):
+        """
+        Run the query plan over the source items
+        :return: list of items
+        """
+        if not self._plan:
+            return self._materialize(self._run_plan())
+        with metrics.stage('query_plan'):
+            return self._materialize(self._run_plan())
+
+    @staticmethod
+    def _materialize(items):
+        return items if isinstance(items, (list, TableRows)) else list(items)
+
+    def _run_plan(self):
+        """
+        Run the query plan over the source items without materializing them when it is not needed
+        :return: iterable of items
+        """
+        items = self._source
+        index = 0
+        if isinstance(items, ColumnTable):
+            items, index = self._run_columnar_plan(items)
+        while index < len(self._plan):
+            operation = self._plan[index]
+            if operation[0] == 'filter':
+                items = filter(operation[1], items)
+            elif operation[0] == 'order_by':
+                _, key, desc, _ = operation
+                next_operation = self._plan[index + 1] if index + 1 < len(self._plan) else None
+                top_n = self._top_n_slice(next_operation)
+                if top_n:
+                    # Same result as sorted(...)[start:stop] (ties keep their order) but O(items * log(stop))
+                    start, stop = top_n
+                    select = heapq.nlargest if desc else heapq.nsmallest
+                    items = select(stop, items, key=key)[start:]
+                    index += 1
+                else:
+                    items = sorted(items, key=key, reverse=desc)
+            elif operation[0] == 'slice':
+                key = operation[1]
+                if (key.start or 0) >= 0 and (key.stop or 0) >= 0 and (key.step or 1) > 0:
+                    items = itertools.islice(items, key.start, key.stop, key.step)
+                else:
+                    # Negative bounds / steps need the length of the items
+                    items = list(items)[key]
+            index += 1
+        return items
+
+    def _run_columnar_plan(self, table):
+        """
+        Run the leading operations of the query plan that a ColumnTable supports over its columns: order_by / filter
+        lookups on its columns and slices. The operations only move row indexes around, the result is a TableRows
+        over the table. Everything else runs over the row views afterwards
+        :param table: ColumnTable
+        :return: tuple (TableRows, index of the first operation left to run)
+        """
+        index = 0
+        indexes = None
+        while index < len(self._plan):
+            operation = self._plan[index]
+            if operation[0] == 'order_by' and table.has_columns(operation[3]):
+                next_operation = self._plan[index + 1] if index + 1 < len(self._plan) else None
+                top_n = self._top_n_slice(next_operation)
+                if top_n:
+                    start, stop = top_n
+                    indexes = table.top_n(stop, operation[3], desc=operation[2], indexes=indexes)[start:]
+                    index += 1
+                else:
+                    indexes = table.argsort(operation[3], desc=operation[2], indexes=indexes)
+            elif operation[0] == 'filter' and operation[2] is not None and \
+                    table.has_columns([field for field, _, _ in operation[2]]):
+                indexes = table.where(operation[2], indexes=indexes)
+            elif operation[0] == 'slice':
+                indexes = (range(len(table)) if indexes is None else indexes)[operation[1]]
+            else:
+                break
+            index += 1
+        return table.rows(range(len(table)) if indexes is None else indexes), index
+
+    def get_all(self, columnar=False):
+        """
+        Get all objects (matching self.search) and run the query plan over them
+        :param columnar: store the objects on the column table of the query set (_table_class) instead of one
+                         object per item, the query set yields row views of the table
+        :return: itself
+        """
+        if columnar:
+            table = self._table_class()
+            for page in self.iter_raw_pages():
+                table.extend_dicts(page.get('results', []))
+            self._set_source(table)
+        else:
+            self._set_source(super(BaseQuerySet, self).get_all())
+        return self
 
-    def get_all(self):
+    def stream_all(self, concurrent=None):
         """
-        Get all objects and add them to self.items
+        Like get_all but the objects are deserialized page by page while the query plan consumes them, so an
+        order_by + slice / filter over the collection never holds the whole collection in memory.
+        Iterating a streamed query set before self.items is accessed is single pass.
+        :param concurrent: see Requester.iter_raw_pages
         :return: itself
         """
-        self.items = super(BaseQuerySet, self).get_all()
+        self._set_source(self.iter_items(concurrent=concurrent))
         return self
 
+    def _set_source(self, items):
+        """
+        Replace the source items keeping the query plan
+        """
+        self._source = items
+        self._result_cache = None
+        self._fetched = True
+
     def get_by_url(self, url):
         """
         Get object by url, useful when resolving foreign_keys
@@ -37,22 +224,182 @@ class BaseQuerySet(Requester):
         :return: itself
         """
         self.items = [super(BaseQuerySet, self).get_by_url(url)]
+        self._fetched = True
+        return self
+
+    async def aget_all(self):
+        """
+        Asyncio version of get_all
+        :return: itself
+        """
+        self._set_source(await super(BaseQuerySet, self).aget_all())
         return self
 
-    def order_by(self, attribute, desc=True):
+    async def aget_by_url(self, url):
+        """
+        Asyncio version of get_by_url
+        :param url: url to fetch the object from
+        :return: itself
+        """
+        self.items = [await super(BaseQuerySet, self).aget_by_url(url)]
+        self._fetched = True
+        return self
+
+    @staticmethod
+    def _order_key(attributes):
+        """
+        Sort key over one or several attributes, empty values are sorted as -1
+        """
+        getter = attrgetter(*attributes)
+        if len(attributes) == 1:
+            return lambda item: getter(item) or -1
+        return lambda item: tuple(value or -1 for value in getter(item))
+
+    def order_by(self, attribute, *attributes, desc=True):
         """
         Order items by attribute
         :param attribute: attribute to sort by
+        :param attributes: more attributes to sort by when the previous ones are equal
         :param desc: Descending (True) / Ascending (False)
         :return: a query set with ordered items sorted by the attribute
         """
-        sorted_list = []
-        for f in sorted(self.items, key=lambda i: getattr(i, attribute) if getattr(i, attribute) else -1,
-                        reverse=desc):
-            sorted_list.append(f)
-        return self.__class__(items=sorted_list, foreign_keys=self.foreign_keys)
+        attributes = (attribute,) + attributes
+        return self._clone(('order_by', self._order_key(attributes), desc, attributes))
 
-    def resolve_foreign_keys(self):
+    def filter(self, *predicates, **lookups):
+        """
+        Filter items by predicates and lookups, for example
+        query_set.filter(lambda person: person.species, height__gte=150, name__icontains='sky')
+
+        Before fetching, the first lookup over a search field (name, name__contains, name__icontains) or search=term
+        is pushed down to SWAPI ?search=, the lookups are still checked locally since SWAPI search is a partial match,
+        and search=term matches locally the items containing term (case insensitive) in one of the search fields.
+        Nothing is pushed down after an order_by / slice, which would then run over the search results only.
+        :param predicates: functions receiving an item and returning True when the item should be kept
+        :param lookups: field__lookup=value conditions, see LOOKUPS
+        :return: a query set with the items matching every predicate and lookup
+        """
+        search = search_term = lookups.pop('search', None)
+        conditions = list(predicates)
+        if search_term is not None:
+            if not self.search_fields:
+                raise ValueError('{} has no search fields'.format(self.__class__.__name__))
+            conditions.append(self._search_predicate(self.search_fields, search_term))
+        parsed_lookups = []
+        for lookup, value in lookups.items():
+            field, _, lookup_type = lookup.partition('__')
+            if lookup_type and lookup_type not in LOOKUPS:
+                raise ValueError('Invalid lookup: {}'.format(lookup))
+            if search is None and field in self.search_fields and lookup_type in ('', 'exact', 'contains', 'icontains'):
+                search = value
+            conditions.append(self._lookup_predicate(field, LOOKUPS[lookup_type or 'exact'], value))
+            parsed_lookups.append((field, lookup_type or 'exact', value))
+
+        # Lookups are kept on the plan so columnar sources can run them over their columns
+        query_set = self._clone(('filter', lambda item: all(condition(item) for condition in conditions),
+                                 None if predicates or search_term is not None else parsed_lookups))
+        only_filters = all(operation[0] == 'filter' for operation in self._plan)
+        if search is not None and not self._fetched and self.search is None and only_filters:
+            query_set.search = search
+        return query_set
+
+    @staticmethod
+    def _lookup_predicate(field, lookup, value):
+        getter = attrgetter(field)
+        return lambda item: lookup(getter(item), value)
+
+    @staticmethod
+    def _search_predicate(fields, term):
+        getters = [attrgetter(field) for field in fields]
+        term = term.lower()
+        return lambda item: any(term in (getter(item) or '').lower() for getter in getters)
+
+    def get_by_urls(self, urls):
+        """
+        Get several objects by url concurrently without touching self.items, useful when resolving foreign_keys
+        :param urls: urls to fetch the objects from
+        :return: dictionary {url: object}
+        """
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(config.REQUESTER_MAX_WORKERS, len(urls))) as executor:
+            return dict(zip(urls, executor.map(super(BaseQuerySet, self).get_by_url, urls)))
+
+    async def aget_by_urls(self, urls):
+        """
+        Asyncio version of get_by_urls
+        :param urls: urls to fetch the objects from
+        :return: dictionary {url: object}
+        """
+        results = await gather(*[super(BaseQuerySet, self).aget_by_url(url) for url in urls])
+        return dict(zip(urls, results))
+
+    def _foreign_key_urls(self, field):
+        """
+        Distinct urls referenced by a foreign key field, in order of appearance
+        :param field: foreign key field
+        """
+        return list(OrderedDict.fromkeys(getattr(item, field) for item in self.items if getattr(item, field)))
+
+    @staticmethod
+    def _foreign_key_strategy(query_set, urls, strategy):
+        """
+        Decide how the objects behind the urls are going to be fetched
+        - loaded: the target query set already holds its items, no request needed
+        - collection: pull the whole target collection (a few pages) when there are more urls than
+          config.FK_COLLECTION_THRESHOLD
+        - urls: request every distinct url concurrently
+        """
+        if strategy != 'auto':
+            return strategy
+        if len(query_set):
+            return 'loaded'
+        if len(urls) > config.FK_COLLECTION_THRESHOLD:
+            return 'collection'
+        return 'urls'
+
+    def _known_objects(self, query_set, urls, strategy):
+        """
+        Objects behind the urls that need no request: the items of the target query set first, they are the ones
+        the caller extracted, then the ones any requester deserialized (identity map)
+        :return: dictionary {url: object}
+        """
+        objects_by_url = {}
+        if strategy in ('auto', 'loaded') and len(query_set):
+            loaded = self._index_by_url(query_set.items)
+            objects_by_url = {url: loaded[url] for url in urls if url in loaded}
+        objects_by_url.update(self._loaded_objects(query_set, [url for url in urls if url not in objects_by_url]))
+        return objects_by_url
+
+    @staticmethod
+    def _loaded_objects(query_set, urls):
+        """
+        Objects behind the urls already deserialized by any requester (identity map)
+        :return: dictionary {url: object}
+        """
+        objects_by_url = {}
+        for url in urls:
+            loaded = query_set.loaded_object(url)
+            if loaded is not None:
+                objects_by_url[url] = loaded
+        return objects_by_url
+
+    @staticmethod
+    def _index_by_url(items):
+        return {item.url: item for item in items if getattr(item, 'url', None)}
+
+    def _apply_foreign_keys(self, field, objects_by_url):
+        """
+        Replace the urls of a foreign key field by the name of the objects in one pass
+        :param field: foreign key field
+        :param objects_by_url: dictionary {url: object}
+        """
+        for item in self.items:
+            foreign_object = objects_by_url.get(getattr(item, field))
+            if foreign_object is not None:
+                setattr(item, field, foreign_object.name)  # Assuming that every single model has name
+
+    def resolve_foreign_keys(self, strategy='auto'):
         """
         Resolve foreign keys requesting the object inside the URL contain in the field
         For example
@@ -62,20 +409,48 @@ class BaseQuerySet(Requester):
         - otherfield: value
 
         species should be defined on self.foreign_keys when calling this function and they will get resolved.
+        Every distinct url is fetched only once (see _foreign_key_strategy) and then applied to all the items.
+        :param strategy: 'auto' / 'urls' / 'collection' / 'loaded' [Default: 'auto']
         :return: it will replace the urls by the actual 'name field of the foreign object'
         """
-        self.resolve_foreign_keys = True
-        for field, query_set_class in self.foreign_keys.items():
-            for item in self.items:
-                url = getattr(item, field)
-                result = query_set_class.get_by_url(url=url)
-                setattr(item, field, result.name)  # Assuming that every single model has name
+        with metrics.stage('resolve_foreign_keys'):
+            self._resolve_foreign_keys(strategy)
+
+    def _resolve_foreign_keys(self, strategy):
+        for field, query_set in self.foreign_keys.items():
+            urls = self._foreign_key_urls(field)
+            objects_by_url = self._known_objects(query_set, urls, strategy)
+            urls = [url for url in urls if url not in objects_by_url]
+            if urls:
+                if self._foreign_key_strategy(query_set, urls, strategy) == 'collection':
+                    objects_by_url.update(self._index_by_url(query_set.__class__().get_all()))
+                missing_urls = [url for url in urls if url not in objects_by_url]
+                objects_by_url.update(query_set.get_by_urls(missing_urls))
+            self._apply_foreign_keys(field, objects_by_url)
+
+    async def aresolve_foreign_keys(self, strategy='auto'):
+        """
+        Asyncio version of resolve_foreign_keys
+        :param strategy: 'auto' / 'urls' / 'collection' / 'loaded' [Default: 'auto']
+        """
+        with metrics.stage('resolve_foreign_keys'):
+            await self._aresolve_foreign_keys(strategy)
+
+    async def _aresolve_foreign_keys(self, strategy):
+        for field, query_set in self.foreign_keys.items():
+            urls = self._foreign_key_urls(field)
+            objects_by_url = self._known_objects(query_set, urls, strategy)
+            urls = [url for url in urls if url not in objects_by_url]
+            if urls:
+                if self._foreign_key_strategy(query_set, urls, strategy) == 'collection':
+                    objects_by_url.update(self._index_by_url(await query_set.__class__().aget_all()))
+                missing_urls = [url for url in urls if url not in objects_by_url]
+                objects_by_url.update(await query_set.aget_by_urls(missing_urls))
+            self._apply_foreign_keys(field, objects_by_url)
 
     def __getitem__(self, key):
         if isinstance(key, slice):
-            start, stop, step = key.indices(len(self.items))
-            return self.__class__(items=[self.items[i] for i in range(start, stop, step)],
-                                  foreign_keys=self.foreign_keys)
+            return self._clone(('slice', key))
         elif isinstance(key, int):
             return self.items[key]
         elif isinstance(key, tuple):
@@ -84,14 +459,20 @@ class BaseQuerySet(Requester):
             raise TypeError('Invalid argument type: {}'.format(type(key)))
 
     def __iter__(self):
-        for item in self.items:
-            yield item
+        if self._result_cache is None and not isinstance(self._source, list):
+            # Streamed source, items go through the query plan one by one without being kept
+            return iter(self._run_plan())
+        return iter(self.items)
 
     def __len__(self):
         return len(self.items)
 
 
 class Person:
+    attributes = ('name', 'url', 'height', 'species', 'films_count')
+    # __weakref__ lets the requesters identity map reference people without keeping them alive
+    __slots__ = attributes + ('__weakref__',)
+
     @classmethod
     def from_dict(cls, dict):
         """
@@ -100,21 +481,69 @@ class Person:
         :return: Person object
         """
         return cls(name=dict.get('name'), height=dict.get('height'), films=dict.get('films'),
-                   species=dict.get('species'))
+                   species=dict.get('species'), url=dict.get('url'))
 
-    def __init__(self, name, height, films, species):
+    @classmethod
+    def from_dicts(cls, dicts):
+        """
+        Bulk factory method to generate the objects of a whole page, only the fields used by the model are read and
+        the height conversion is done once per distinct value
+        :param dicts: list of dictionaries with the fields
+        :return: list of Person objects
+        """
+        heights = {}
+        people = []
+        append = people.append
+        new = cls.__new__
+        for record in dicts:
+            person = new(cls)
+            person.name = record.get('name')
+            person.url = record.get('url')
+            height = record.get('height')
+            try:
+                person.height = heights[height]
+            except KeyError:
+                person.height = heights[height] = int(height) if height.isdigit() else None
+            species = record.get('species')
+            person.species = species[-1] if species else None
+            person.films_count = len(record.get('films'))
+            append(person)
+        return people
+
+    def __init__(self, name, height, films, species, url=None):
         """
 
         :param name: Person name
         :param height: Person height (string / integer)
         :param films: List of films where the person appears
         :param species: Person species list
+        :param url: Person url on SWAPI
         """
         self.name = name
+        self.url = url
         self.height = int(height) if height.isdigit() else None
-        self.species = species.pop() if species else None
+        # Last species of the list, without popping it from the (possibly cached) list
+        self.species = species[-1] if species else None
         self.films_count = len(films)
 
+    @classmethod
+    def from_attributes(cls, attributes):
+        """
+        Rebuild a person from the attributes returned by as_dict, without serializing it again
+        :param attributes: dictionary with an entry per attribute
+        :return: Person object
+        """
+        person = cls.__new__(cls)
+        for attribute in cls.attributes:
+            setattr(person, attribute, attributes.get(attribute))
+        return person
+
+    def as_dict(self):
+        """
+        Attributes of the person as a dictionary
+        """
+        return {attribute: getattr(self, attribute) for attribute in self.attributes}
+
     def __unicode__(self):
         return u'<Person - {}>'.format(self.name)
 
@@ -125,7 +554,300 @@ class Person:
         return self.__unicode__()
 
 
+class ColumnTable:
+    """
+    Column oriented storage: one typed array per numeric column and one list of interned strings per string column,
+    instead of one object (and its attributes) per row. Operations work on row indexes in NumPy style
+    (argsort / top_n / where return indexes, take builds a new table from them) and iterating the table yields
+    lightweight row views, so a table can be the source of a BaseQuerySet.
+    Sort keys and the common lookups are bound methods of the columns and values (list.__getitem__, int.__le__...),
+    so the loops over the rows run inside sorted / heapq / map instead of calling Python code per row.
+
+    Missing numeric values are stored as NULL and read back as None.
+    """
+    NULL = -1
+    numeric_columns = ()
+    string_columns = ()
+    _view_class = None
+    # Lookups run with a method of the lookup value over the column values: column_value > value is value < column_value
+    _COLUMN_LOOKUPS = {'exact': '__eq__', 'ne': '__ne__', 'gt': '__lt__', 'gte': '__le__', 'lt': '__gt__',
+                       'lte': '__ge__'}
+
+    def __init__(self):
+        self.columns = {}
+        for column in self.numeric_columns:
+            self.columns[column] = array('l')
+        for column in self.string_columns:
+            self.columns[column] = []
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        table = cls()
+        table.extend_dicts(dicts)
+        return table
+
+    @classmethod
+    def from_rows(cls, rows):
+        table = cls()
+        for row in rows:
+            table.append(row)
+        return table
+
+    def extend_dicts(self, dicts):
+        """
+        Append rows from SWAPI dictionaries holding a key per column, numeric values may be digit strings ('unknown'
+        and other values are stored as NULL). Tables with computed columns override it
+        """
+        for item in dicts:
+            for column in self.numeric_columns:
+                value = item.get(column)
+                if isinstance(value, str):
+                    value = int(value) if value.isdigit() else None
+                self.columns[column].append(self.NULL if value is None else value)
+            for column in self.string_columns:
+                value = item.get(column)
+                self.columns[column].append(sys.intern(value) if value is not None else None)
+
+    def append(self, row):
+        """
+        Append a row from an object (a model or a row view) with an attribute per column
+        """
+        for column in self.numeric_columns:
+            value = getattr(row, column)
+            self.columns[column].append(self.NULL if value is None else value)
+        for column in self.string_columns:
+            value = getattr(row, column)
+            self.columns[column].append(sys.intern(value) if value is not None else None)
+
+    def has_columns(self, columns):
+        return all(column in self.columns for column in columns)
+
+    def value(self, column, index):
+        value = self.columns[column][index]
+        if column in self.numeric_columns and value == self.NULL:
+            return None
+        return value
+
+    def set_value(self, column, index, value):
+        if column in self.numeric_columns:
+            value = self.NULL if value is None else value
+        elif value is not None:
+            value = sys.intern(value)
+        self.columns[column][index] = value
+
+    @staticmethod
+    def _gather(values, indexes):
+        """
+        Values at indexes (in that order)
+        """
+        if len(indexes) > 1:
+            return itemgetter(*indexes)(values)
+        return [values[index] for index in indexes]
+
+    def _sort_values(self, column):
+        """
+        Values sorting the rows like BaseQuerySet.order_by, where empty values are sorted as -1. The column itself
+        when that gives the same order: numeric columns without both 0 and NULL (a 0 can sit below -1 only if there
+        are NULLs), string columns without None / ''
+        """
+        values = self.columns[column]
+        if column in self.numeric_columns:
+            exact = not (0 in values and self.NULL in values)
+        else:
+            exact = None not in values and '' not in values
+        return values if exact else [value or -1 for value in values]
+
+    def _sort_key(self, columns):
+        """
+        Sort key over row indexes
+        """
+        if len(columns) == 1:
+            return self._sort_values(columns[0]).__getitem__
+        return list(zip(*[self._sort_values(column) for column in columns])).__getitem__
+
+    def argsort(self, columns, desc=True, indexes=None):
+        """
+        Row indexes sorted by the columns
+        :param indexes: rows to sort [Default: every row]
+        """
+        return sorted(range(len(self)) if indexes is None else indexes, key=self._sort_key(columns), reverse=desc)
+
+    def top_n(self, n, columns, desc=True, indexes=None):
+        """
+        Indexes of the first n rows sorted by the columns, same result as argsort(columns, desc)[:n]
+        :param indexes: rows to select from [Default: every row]
+        """
+        select = heapq.nlargest if desc else heapq.nsmallest
+        return select(n, range(len(self)) if indexes is None else indexes, key=self._sort_key(columns))
+
+    def _lookup_mask(self, column, lookup_type, value, values):
+        """
+        Iterable of booleans (one per value) computed without Python code per value / None if the lookup needs it
+        """
+        method = self._COLUMN_LOOKUPS.get(lookup_type)
+        if method is None:
+            return None
+        if column in self.numeric_columns:
+            if not isinstance(value, int) or isinstance(value, bool) or value == self.NULL:
+                return None
+            mask = map(getattr(value, method), values)
+            if lookup_type not in ('exact', 'ne') and self.NULL in values:
+                # None never compares, NULL rows are left out
+                mask = map(and_, mask, map(self.NULL.__ne__, values))
+            return mask
+        if lookup_type in ('exact', 'ne') and isinstance(value, str) and None not in values:
+            return map(getattr(value, method), values)
+        return None
+
+    def where(self, lookups, indexes=None):
+        """
+        Row indexes matching every lookup
+        :param lookups: list of tuples (column, lookup type, value), see LOOKUPS
+        :param indexes: rows to filter [Default: every row]
+        """
+        indexes = list(range(len(self))) if indexes is None else list(indexes)
+        for column, lookup_type, value in lookups:
+            if not indexes:
+                break
+            values = self.columns[column]
+            if len(indexes) != len(self):
+                values = self._gather(values, indexes)
+            mask = self._lookup_mask(column, lookup_type, value, values)
+            if mask is None:
+                lookup = LOOKUPS[lookup_type]
+                null = self.NULL if column in self.numeric_columns else None
+                mask = [lookup(None if column_value == null else column_value, value) for column_value in values]
+            indexes = list(itertools.compress(indexes, mask))
+        return indexes
+
+    def take(self, indexes):
+        """
+        New table with the rows at indexes (in that order)
+        """
+        indexes = list(indexes)
+        table = self.__class__()
+        for column, values in self.columns.items():
+            if isinstance(values, array):
+                table.columns[column] = array(values.typecode, self._gather(values, indexes))
+            else:
+                table.columns[column] = list(self._gather(values, indexes))
+        return table
+
+    def rows(self, indexes):
+        """
+        Sequence of the rows at indexes (in that order) without copying the columns, see TableRows
+        """
+        return TableRows(self, indexes)
+
+    def __len__(self):
+        return len(self.columns[self.numeric_columns[0]])
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('Row index out of range')
+        return self._view_class(self, index)
+
+    def __iter__(self):
+        return self._view_class.iter_rows(self, range(len(self)))
+
+
+class TableRows:
+    """
+    Sequence of some rows of a ColumnTable given by their indexes, row views are only built when rows are read, so a
+    query plan ordering a big table does not build a view per row
+    """
+    __slots__ = ('table', 'indexes')
+
+    def __init__(self, table, indexes):
+        self.table = table
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return TableRows(self.table, self.indexes[key])
+        return self.table._view_class(self.table, self.indexes[key])
+
+    def __iter__(self):
+        return self.table._view_class.iter_rows(self.table, self.indexes)
+
+
+class RowView:
+    """
+    View of one row of a ColumnTable, reading and writing its attributes goes to the table columns
+    """
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    @classmethod
+    def iter_rows(cls, table, indexes):
+        """
+        Views of the rows at indexes, built without going through __init__ / __setattr__
+        """
+        new, set_table, set_index = object.__new__, RowView._table.__set__, RowView._index.__set__
+        for index in indexes:
+            view = new(cls)
+            set_table(view, table)
+            set_index(view, index)
+            yield view
+
+    def __getattr__(self, name):
+        if not name.startswith('_') and name in self._table.columns:
+            return self._table.value(name, self._index)
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name in RowView.__slots__:
+            object.__setattr__(self, name, value)
+        elif name in self._table.columns:
+            self._table.set_value(name, self._index, value)
+        else:
+            raise AttributeError(name)
+
+
+class PersonView(RowView):
+    __slots__ = ()
+
+    def __unicode__(self):
+        return u'<Person - {}>'.format(self.name)
+
+    def __str__(self):
+        return self.__unicode__()
+
+    def __repr__(self):
+        return self.__unicode__()
+
+
+class PeopleTable(ColumnTable):
+    """
+    Column table of people with the same attributes as Person
+    """
+    numeric_columns = ('height', 'films_count')
+    string_columns = ('name', 'species', 'url')
+    _view_class = PersonView
+
+    def extend_dicts(self, dicts):
+        columns = self.columns
+        for item in dicts:
+            height = item.get('height') or ''
+            species = item.get('species')
+            columns['height'].append(int(height) if height.isdigit() else self.NULL)
+            columns['films_count'].append(len(item.get('films') or ()))
+            columns['name'].append(sys.intern(item.get('name')))
+            columns['species'].append(sys.intern(species[-1]) if species else None)
+            columns['url'].append(item.get('url'))
+
+
 class Species:
+    __slots__ = ('name', 'url', '__weakref__')
+
     @classmethod
     def from_dict(cls, dict):
         """
@@ -134,10 +856,28 @@ class Species:
         :return: Species object
         """
 
-        return cls(name=dict.get('name'))
+        return cls(name=dict.get('name'), url=dict.get('url'))
 
-    def __init__(self, name):
+    @classmethod
+    def from_dicts(cls, dicts):
+        """
+        Bulk factory method to generate the objects of a whole page
+        :param dicts: list of dictionaries with the fields
+        :return: list of Species objects
+        """
+        species = []
+        append = species.append
+        new = cls.__new__
+        for record in dicts:
+            item = new(cls)
+            item.name = record.get('name')
+            item.url = record.get('url')
+            append(item)
+        return species
+
+    def __init__(self, name, url=None):
         self.name = name
+        self.url = url
 
     def __unicode__(self):
         return u'<Species - {}>'.format(self.name)
@@ -155,13 +895,14 @@ class SpeciesQuerySet(BaseQuerySet):
     """
     endpoint = config.SPECIES
     _klass = Species
+    search_fields = ('name',)
 
     @property
     def name(self):
         """
-        Species name property
+        Species name property (name of the last fetched species, the items are left untouched)
         """
-        return self.items.pop().name
+        return self.items[-1].name
 
     def __unicode__(self):
         return u'<SpeciesQuerySet - {}>'.format(len(self))
@@ -179,6 +920,8 @@ class PeopleQuerySet(BaseQuerySet):
     """
     endpoint = config.PEOPLE
     _klass = Person
+    _table_class = PeopleTable
+    search_fields = ('name',)
 
     @property
     def people(self):
@@ -0,0 +1,188 @@
+import copy
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import config
+from exporters import EXPORTERS
+from httpbin import HTTPBin
+from metrics import registry as metrics
+from models import PeopleQuerySet, SpeciesQuerySet
+
+log = logging.getLogger("Pipeline")
+
+# Query set of every SWAPI resource that can be extracted, new resources (planets, starships, films...) only need
+# their query set registered here
+QUERY_SETS = {
+    config.PEOPLE: PeopleQuerySet,
+    config.SPECIES: SpeciesQuerySet,
+}
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Stage:
+    """
+    Stage of a pipeline built from its definition, see config.PIPELINE for the definition format
+    """
+    TYPES = ('extract', 'transform', 'join', 'load')
+
+    def __init__(self, name, definition):
+        """
+        :param name: stage name, other stages refer to its result by this name
+        :param definition: dictionary with the stage type and its options
+        """
+        self.name = name
+        self.definition = definition
+        self.type = definition.get('type')
+        if self.type not in self.TYPES:
+            raise PipelineError('Unknown type of stage {}: {}'.format(name, self.type))
+        if self.type == 'extract' and definition.get('resource') not in QUERY_SETS:
+            raise PipelineError('Unknown resource of stage {}: {}'.format(name, definition.get('resource')))
+        if self.type != 'extract' and not definition.get('input'):
+            raise PipelineError('Stage {} has no input'.format(name))
+
+    @property
+    def dependencies(self):
+        """
+        Names of the stages whose results this stage needs
+        """
+        dependencies = []
+        if self.definition.get('input'):
+            dependencies.append(self.definition['input'])
+        if self.type == 'join':
+            dependencies.extend(self.definition.get('foreign_keys', {}).values())
+        return dependencies
+
+    def run(self, results):
+        """
+        Run the stage
+        :param results: dictionary {stage name: result} holding at least the results of the dependencies
+        :return: result of the stage
+        """
+        with metrics.stage(self.name):
+            return getattr(self, '_{}'.format(self.type))(results)
+
+    def _extract(self, results):
+        """
+        Sharded extractions (option 'sharded' [Default: config.SHARDED]) fetch the whole collection with the worker
+        processes of sharding.py and filter it afterwards, instead of pushing the filter down to SWAPI
+        """
+        if self.definition.get('sharded', config.SHARDED):
+            from sharding import ShardedExtractor
+            query_set = ShardedExtractor().extract([self.definition['resource']])[self.definition['resource']]
+            if self.definition.get('filter'):
+                query_set = query_set.filter(**self.definition['filter'])
+            return query_set
+
+        query_set = QUERY_SETS[self.definition['resource']]()
+        if self.definition.get('filter'):
+            query_set = query_set.filter(**self.definition['filter'])
+        return query_set.get_all()
+
+    def _transform(self, results):
+        """
+        Operations are applied in order: ('filter', {lookups}), ('order_by', attribute[, {'desc': False}]) and
+        ('slice', start, stop). The query plan runs inside the stage
+        """
+        query_set = results[self.definition['input']]
+        for operation in self.definition.get('operations', ()):
+            name, arguments = operation[0], list(operation[1:])
+            if name == 'filter':
+                query_set = query_set.filter(**arguments[0])
+            elif name == 'order_by':
+                options = arguments.pop() if arguments and isinstance(arguments[-1], dict) else {}
+                query_set = query_set.order_by(*arguments, **options)
+            elif name == 'slice':
+                query_set = query_set[slice(*arguments)]
+            else:
+                raise PipelineError('Unknown operation of stage {}: {}'.format(self.name, name))
+        len(query_set)
+        return query_set
+
+    def _join(self, results):
+        """
+        Replace the foreign key urls by the names of the objects extracted by other stages. Items are copied, so the
+        input stage result is left untouched for other stages using it
+        """
+        query_set = results[self.definition['input']]
+        foreign_keys = {field: results[stage] for field, stage in self.definition['foreign_keys'].items()}
+        joined = query_set.__class__(items=[copy.copy(item) for item in query_set], foreign_keys=foreign_keys)
+        joined.resolve_foreign_keys()
+        return joined
+
+    def _load(self, results):
+        exporter = EXPORTERS[self.definition.get('exporter', 'csv')]
+        options = {'fields': self.definition['fields']}
+        if self.definition.get('file_path'):
+            options['file_path'] = self.definition['file_path']
+        output = exporter(items=results[self.definition['input']], **options)
+        if self.definition.get('upload'):
+            HTTPBin().send_file(file=output.file_path)
+        return output.file_path
+
+
+class Pipeline:
+    """
+    Stages with a dependency graph between them. Stages whose dependencies are done run concurrently on a thread
+    pool and their results are passed to the next stages in memory
+    """
+
+    def __init__(self, stages=None, max_workers=None):
+        """
+        :param stages: map of stage names and definitions [Default: config.PIPELINE]
+        :param max_workers: stages running at the same time [Default: config.PIPELINE_MAX_WORKERS]
+        """
+        stages = stages if stages is not None else config.PIPELINE
+        self.stages = {name: Stage(name, definition) for name, definition in stages.items()}
+        self.max_workers = max_workers or config.PIPELINE_MAX_WORKERS
+        self.order = self._sort()
+
+    def _sort(self):
+        """
+        Sort the stages so every stage comes after its dependencies
+        :return: list of stage names
+        """
+        order = []
+        visiting = set()
+
+        def visit(name, path):
+            if name in order:
+                return
+            if name not in self.stages:
+                raise PipelineError('Unknown stage {} required by {}'.format(name, path[-1]))
+            if name in visiting:
+                raise PipelineError('Dependency cycle: {}'.format(' -> '.join(path + [name])))
+            visiting.add(name)
+            for dependency in self.stages[name].dependencies:
+                visit(dependency, path + [name])
+            visiting.discard(name)
+            order.append(name)
+
+        for name in sorted(self.stages):
+            visit(name, [])
+        return order
+
+    def run(self):
+        """
+        Run every stage
+        :return: dictionary {stage name: result}
+        """
+        results = {}
+        pending = list(self.order)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in [name for name in pending
+                             if all(dependency in results for dependency in self.stages[name].dependencies)]:
+                    log.debug("Starting stage %s", name)
+                    pending.remove(name)
+                    running[executor.submit(self.stages[name].run, dict(results))] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    # Errors are raised as soon as they happen, pending stages are not started
+                    results[name] = future.result()
+                    log.debug("Stage %s done", name)
+        return results
@@ -0,0 +1,200 @@
+"""
+Opt-in profiling of the ETL stages (metrics.registry.stage): fetch, serialize, query_plan, resolve_foreign_keys,
+csv_write, upload and the pipeline stages. Every stage runs under cProfile and between two tracemalloc snapshots,
+and the profiler writes to its directory:
+- <stage>.pstats: cProfile statistics of the stage (python -m pstats / snakeviz)
+- stages.collapsed: collapsed stacks of every stage, rooted at the stage name (flamegraph.pl / speedscope)
+- allocations.txt: lines allocating the most memory in every stage
+
+cProfile only sees the thread running the stage, and a nested stage pauses the profile of the stage around it, so
+each profile holds the time not spent in nested stages. tracemalloc is process wide: stages running at the same
+time see each other allocations.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+import config
+from metrics import registry as metrics
+
+log = logging.getLogger("Profiler")
+
+
+class Profiler:
+    """
+    Stage listener profiling every stage, results are aggregated by stage name
+    """
+
+    def __init__(self, directory=None, top_allocations=None):
+        """
+        :param directory: directory of the reports [Default: config.PROFILE_DIR]
+        :param top_allocations: allocation lines reported per stage [Default: config.PROFILE_TOP_ALLOCATIONS]
+        """
+        self.directory = directory or config.PROFILE_DIR
+        self.top_allocations = top_allocations or config.PROFILE_TOP_ALLOCATIONS
+        self.stats = {}  # stage -> pstats.Stats
+        self.allocations = {}  # stage -> {(filename, lineno): [size, count]}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started_tracemalloc = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracemalloc = True
+        metrics.add_stage_listener(self.stage)
+
+    def stop(self):
+        metrics.remove_stage_listener(self.stage)
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+            self.started_tracemalloc = False
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profile a stage, the profile of the enclosing stage of the thread (if any) is paused meanwhile
+        """
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        if stack and stack[-1] is not None:
+            stack[-1].disable()
+        before = tracemalloc.take_snapshot()
+        profile = self._enable()
+        stack.append(profile)
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            after = tracemalloc.take_snapshot()
+            stack.pop()
+            if stack and stack[-1] is not None:
+                stack[-1].enable()
+            self._add(name, profile, after.compare_to(before, 'lineno'))
+
+    @staticmethod
+    def _enable():
+        """
+        :return: enabled cProfile.Profile / None when another thread is already profiled and the interpreter only
+                 allows one profiler at a time (Python 3.12+)
+        """
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None
+        return profile
+
+    def _add(self, name, profile, differences):
+        with self.lock:
+            if profile is not None and name in self.stats:
+                self.stats[name].add(profile)
+            elif profile is not None:
+                self.stats[name] = pstats.Stats(profile)
+            allocations = self.allocations.setdefault(name, {})
+            for difference in differences:
+                if difference.size_diff <= 0:
+                    continue
+                frame = difference.traceback[0]
+                totals = allocations.setdefault((frame.filename, frame.lineno), [0, 0])
+                totals[0] += difference.size_diff
+                totals[1] += difference.count_diff
+
+    def write(self):
+        """
+        Write the reports
+        :return: list of file paths written
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        paths = []
+        with self.lock:
+            for name, stats in sorted(self.stats.items()):
+                path = os.path.join(self.directory, '{}.pstats'.format(name))
+                stats.dump_stats(path)
+                paths.append(path)
+
+            path = os.path.join(self.directory, 'stages.collapsed')
+            with open(path, mode='w') as f:
+                for name, stats in sorted(self.stats.items()):
+                    for stack, microseconds in collapsed_stacks(stats):
+                        f.write('{} {}\n'.format(';'.join([name] + stack), microseconds))
+            paths.append(path)
+
+            path = os.path.join(self.directory, 'allocations.txt')
+            with open(path, mode='w') as f:
+                for name, allocations in sorted(self.allocations.items()):
+                    top = sorted(allocations.items(), key=lambda item: item[1][0], reverse=True)
+                    f.write('{}: {} bytes allocated\n'.format(name, sum(size for size, _ in allocations.values())))
+                    for (filename, lineno), (size, count) in top[:self.top_allocations]:
+                        f.write('  {:>12} bytes {:>8} blocks  {}:{}\n'.format(size, count, filename, lineno))
+            paths.append(path)
+        log.info("Profiles written to %s", self.directory)
+        return paths
+
+
+def _frame(function):
+    filename, lineno, name = function
+    return '{} ({}:{})'.format(name, os.path.basename(filename), lineno)
+
+
+def collapsed_stacks(stats, max_depth=64):
+    """
+    Rebuild stacks from the caller graph of cProfile statistics, the own time of every function is split among its
+    callers in proportion to the time each caller spent on it
+    :param stats: pstats.Stats
+    :param max_depth: deepest stack
+    :return: list of tuples (list of frames from the outermost one, own time in microseconds)
+    """
+    entries = stats.stats
+    callees = {}
+    for function, (_, _, _, _, callers) in entries.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(function)
+
+    stacks = {}
+
+    def visit(function, path, share):
+        _, _, own_time, cumulative_time, _ = entries[function]
+        if cumulative_time * share < 0.000001:
+            return
+        path = path + [_frame(function)]
+        microseconds = int(own_time * share * 1000000)
+        if microseconds:
+            key = tuple(path)
+            stacks[key] = stacks.get(key, 0) + microseconds
+        if len(path) >= max_depth:
+            return
+        for callee in callees.get(function, []):
+            if _frame(callee) in path:
+                continue  # recursion
+            edge_time = entries[callee][4][function][3]
+            callee_cumulative_time = entries[callee][3]
+            if callee_cumulative_time > 0 and edge_time > 0:
+                visit(callee, path, share * min(1.0, edge_time / callee_cumulative_time))
+
+    for function, (_, _, _, _, callers) in entries.items():
+        if not any(caller in entries for caller in callers):
+            visit(function, [], 1.0)
+    return [(list(stack), microseconds) for stack, microseconds in sorted(stacks.items())]
+
+
+@contextmanager
+def profile(directory=None):
+    """
+    Profile every stage run inside the context and write the reports when it ends
+    :param directory: directory of the reports [Default: config.PROFILE_DIR]
+    """
+    profiler = Profiler(directory)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write()
@@ -0,0 +1,292 @@
+import email.utils
+import logging
+import threading
+import time
+
+import config
+from metrics import registry as metrics
+
+log = logging.getLogger("RateLimit")
+
+
+def parse_retry_after(value):
+    """
+    Seconds to wait from a Retry-After header, which holds either seconds or an HTTP date
+    :param value: header value / None
+    :return: seconds (capped to config.RATE_LIMIT_MAX_RETRY_AFTER) / None if missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        seconds = float(value)
+    else:
+        try:
+            date = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        seconds = date.timestamp() - time.time()
+    return min(max(seconds, 0.0), config.RATE_LIMIT_MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """
+    Token bucket refilled with rate tokens per second up to burst tokens, every request takes a token
+    """
+
+    def __init__(self, rate=None, burst=1):
+        """
+        :param rate: tokens per second, None for no limit
+        :param burst: maximum number of tokens, requests allowed at once after an idle period
+        """
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self):
+        """
+        Take a token if there is one
+        :return: 0 when a token was taken / seconds until the next token
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self):
+        """
+        Take a token, waiting for it when the bucket is empty
+        :return: seconds waited
+        """
+        if self.rate is None:
+            return 0.0
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def aacquire(self):
+        """
+        Coroutine version of acquire, waits without blocking the event loop
+        :return: seconds waited
+        """
+        if self.rate is None:
+            return 0.0
+        import asyncio
+
+        waited = 0.0
+        while True:
+            wait = self._take()
+            if not wait:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+def _wake(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class AdaptiveConcurrency:
+    """
+    Limit of requests in flight adjusted with AIMD (additive increase, multiplicative decrease): every successful
+    response grows the limit by about one request per round trip of the whole window, congestion (throttling or
+    slow responses) multiplies it by decrease_factor, at most once per window of requests in flight
+    """
+
+    def __init__(self, initial, minimum=1, maximum=None, decrease_factor=0.5):
+        """
+        :param initial: starting limit
+        :param minimum: lowest limit
+        :param maximum: highest limit [Default: initial]
+        :param decrease_factor: factor applied to the limit on congestion
+        """
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum or initial, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.in_flight = 0
+        self.last_decrease = time.monotonic()
+        self.condition = threading.Condition()
+        # (event loop, future) of the coroutines waiting for a slot, woken up by release
+        self.waiters = []
+
+    def acquire(self):
+        """
+        Wait for a free slot
+        :return: time the request started, to be passed to release
+        """
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    async def aacquire(self):
+        """
+        Coroutine version of acquire, waits without blocking the event loop
+        :return: time the request started, to be passed to release
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        while True:
+            with self.condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return time.monotonic()
+                waiter = loop.create_future()
+                self.waiters.append((loop, waiter))
+            await waiter
+
+    def release(self, started_at, congested):
+        """
+        Free the slot of a finished request and adjust the limit
+        :param started_at: value returned by acquire
+        :param congested: the response showed congestion (throttled / slow)
+        """
+        with self.condition:
+            self.in_flight -= 1
+            if congested:
+                # Requests started before the last decrease already paid for it
+                if started_at >= self.last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self.last_decrease = time.monotonic()
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self.condition.notify_all()
+            waiters, self.waiters = self.waiters, []
+        # release may run on another thread than the loop of the waiter
+        for loop, waiter in waiters:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_wake, waiter)
+
+
+class HostLimiter:
+    """
+    Client side limits of a host: token bucket for the request rate, adaptive concurrency and the pause asked by
+    the server through Retry-After
+    """
+
+    def __init__(self, host, rate=None, burst=1, initial_concurrency=None, min_concurrency=1, max_concurrency=None,
+                 target_latency=None, decrease_factor=0.5):
+        """
+        :param host: host name
+        :param rate: requests per second, None for no limit
+        :param burst: requests allowed at once by the token bucket
+        :param initial_concurrency: starting limit of requests in flight [Default: max_concurrency]
+        :param min_concurrency: lowest limit of requests in flight
+        :param max_concurrency: highest limit of requests in flight [Default: config.REQUESTER_MAX_WORKERS]
+        :param target_latency: seconds above which a response counts as congestion, None to only react to throttling
+        :param decrease_factor: factor applied to the concurrency limit on congestion
+        """
+        self.host = host
+        self.bucket = TokenBucket(rate=rate, burst=burst)
+        max_concurrency = max_concurrency or config.REQUESTER_MAX_WORKERS
+        self.concurrency = AdaptiveConcurrency(initial=initial_concurrency or max_concurrency,
+                                               minimum=min_concurrency, maximum=max_concurrency,
+                                               decrease_factor=decrease_factor)
+        self.target_latency = target_latency
+        self.blocked_until = 0.0
+        self.lock = threading.Lock()
+
+    def block(self, seconds):
+        """
+        Hold every request to the host for some seconds
+        """
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """
+        Wait until a request can be sent: host not blocked, a token available and a free concurrency slot
+        :return: value to be passed to release
+        """
+        waited = 0.0
+        while True:
+            wait = self.blocked_until - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        waited += self.bucket.acquire()
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, host=self.host)
+        return self.concurrency.acquire()
+
+    async def aacquire(self):
+        """
+        Coroutine version of acquire, waits without blocking the event loop
+        :return: value to be passed to release
+        """
+        import asyncio
+
+        waited = 0.0
+        while True:
+            wait = self.blocked_until - time.monotonic()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        waited += await self.bucket.aacquire()
+        if waited:
+            metrics.observe('rate_limit_wait_seconds', waited, host=self.host)
+        return await self.concurrency.aacquire()
+
+    def release(self, started_at, status=None, latency=None, retry_after=None):
+        """
+        Report the outcome of a request
+        :param started_at: value returned by acquire
+        :param status: response status code, None when the request failed without response
+        :param latency: response time in seconds
+        :param retry_after: seconds asked by the server through Retry-After
+        """
+        throttled = status in config.RATE_LIMIT_STATUSES
+        if throttled:
+            metrics.inc('http_throttled_total', host=self.host, status=status)
+            log.debug("Throttled by %s (%s), concurrency limit %.1f", self.host, status, self.concurrency.limit)
+        if retry_after:
+            self.block(retry_after)
+        slow = self.target_latency is not None and latency is not None and latency > self.target_latency
+        self.concurrency.release(started_at, congested=throttled or slow)
+
+
+class RateLimiter:
+    """
+    Host limiters built on first use from config.RATE_LIMIT_DEFAULT updated with the host entry of config.RATE_LIMITS
+    """
+
+    def __init__(self, limits=None, default=None):
+        """
+        :param limits: map of host names and HostLimiter settings [Default: config.RATE_LIMITS]
+        :param default: settings of every host [Default: config.RATE_LIMIT_DEFAULT]
+        """
+        self.limits = config.RATE_LIMITS if limits is None else limits
+        self.default = config.RATE_LIMIT_DEFAULT if default is None else default
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def for_host(self, host):
+        """
+        :param host: host name
+        :return: HostLimiter
+        """
+        limiter = self.hosts.get(host)
+        if limiter is None:
+            with self.lock:
+                limiter = self.hosts.get(host)
+                if limiter is None:
+                    settings = dict(self.default)
+                    settings.update(self.limits.get(host, {}))
+                    limiter = self.hosts[host] = HostLimiter(host, **settings)
+        return limiter
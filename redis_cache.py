@@ -0,0 +1,126 @@
+import logging
+import time
+from urllib.parse import urlparse
+
+import config
+from json_codec import dumps, loads
+from sqlite_cache import CacheEntry
+
+redis = None
+
+
+def load_redis():
+    """
+    Import redis on first use, it is optional and only needed by the redis cache backend
+    :return: redis module / None if not installed
+    """
+    global redis
+    if redis is None:
+        try:
+            import redis
+        except ImportError:  # The redis cache backend is optional
+            redis = None
+    return redis
+
+
+class RedisCache:
+    """
+    Cache shared by several processes / nodes on a Redis compatible server, with the same contract as SQLiteCache:
+    entries expire after the TTL of their endpoint (config.CACHE_TTL) and expired entries are kept to be revalidated
+    with a conditional GET
+    """
+
+    def __init__(self, url=None, prefix=None, ttl=None, default_ttl=None, client=None):
+        """
+        :param url: server url [Default: config.REDIS_URL]
+        :param prefix: prefix of the keys, so several datasets can share a server [Default: config.REDIS_KEY_PREFIX]
+        :param ttl: map of endpoint and time to live in seconds following {'people': 3600} [Default: config.CACHE_TTL]
+        :param default_ttl: time to live of endpoints not present on ttl [Default: config.CACHE_DEFAULT_TTL]
+        :param client: client implementing get / set / scan_iter / delete [Default: redis.Redis built from url]
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.url = url or config.REDIS_URL
+        self.prefix = config.REDIS_KEY_PREFIX if prefix is None else prefix
+        self.ttl = config.CACHE_TTL if ttl is None else ttl
+        self.default_ttl = config.CACHE_DEFAULT_TTL if default_ttl is None else default_ttl
+        if client is None:
+            if load_redis() is None:
+                raise ImportError('{} requires the redis package'.format(self.__class__.__name__))
+            client = redis.Redis.from_url(self.url)
+        self.client = client
+
+    def ttl_for(self, key):
+        """
+        Time to live of a url based on its endpoint, for example https://swapi.co/api/people/?page=2 -> people
+        :param key: url
+        :return: time to live in seconds
+        """
+        for segment in urlparse(key).path.split('/'):
+            if segment in self.ttl:
+                return self.ttl[segment]
+        return self.default_ttl
+
+    def _store(self, key, value, fetched_at, etag, last_modified):
+        self.client.set(self.prefix + key, dumps({'value': value, 'fetched_at': fetched_at, 'etag': etag,
+                                                  'last_modified': last_modified}))
+
+    def get_entry(self, key):
+        """
+        Get the stored entry even if it expired, useful to revalidate it
+        :param key: url
+        :return: CacheEntry / None if key not present on cache
+        """
+        data = self.client.get(self.prefix + key)
+        if data is None:
+            return None
+        return CacheEntry(**loads(data))
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache if it has not expired
+        :param key: url
+        :param default: default value to return in case value not present or expired
+        :return: value / default value
+        """
+        return self.lookup(key, default)[0]
+
+    def lookup(self, key, default=None):
+        """
+        Get a value and, when it expired, the entry to revalidate it with a single read of the stored entry
+        :param key: url
+        :param default: default value to return in case value not present or expired
+        :return: tuple (value / default value, expired CacheEntry / None)
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return default, None
+        if time.time() - entry.fetched_at >= self.ttl_for(key):
+            return default, entry
+        return entry.value, None
+
+    def set(self, key, value, etag=None, last_modified=None):
+        """
+        Store a value inside the cache
+
+        :param key: url
+        :param value: JSON serializable value
+        :param etag: ETag header of the response
+        :param last_modified: Last-Modified header of the response
+        """
+        self._store(key, value, time.time(), etag, last_modified)
+
+    def touch(self, key):
+        """
+        Mark an entry as fetched now, used when the server confirms (304 Not Modified) that it is still valid
+        :param key: url
+        """
+        entry = self.get_entry(key)
+        if entry is not None:
+            self._store(key, entry.value, time.time(), entry.etag, entry.last_modified)
+
+    def clear(self):
+        """
+        Remove every entry under the prefix
+        """
+        for key in self.client.scan_iter(match='{}*'.format(self.prefix)):
+            self.client.delete(key)
@@ -0,0 +1,207 @@
+"""
+Sharded extraction: the coordinator fetches the first page of every collection, splits the urls of the remaining
+pages in shards of config.SHARD_PAGES pages and submits them to an executor. Workers fetch the pages of their shard
+through a cache backend shared by every worker (config.SHARD_CACHE_BACKEND) and send back the deserialized objects,
+which the coordinator merges in page order into one query set per collection.
+
+Any concurrent.futures.Executor works: the default ProcessPoolExecutor on one machine, or an executor running the
+calls on other nodes (mpi4py.futures.MPIPoolExecutor, dask.distributed Client.get_executor()...) together with the
+'redis' backend. Workers do not share config with the coordinator, the settings they need travel with every shard,
+with the request rates of the rate limiter divided between the workers. Worker processes cannot read the snapshot of
+snapshot.use_snapshot, while one is active the collections are extracted by the coordinator instead.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import config
+from metrics import registry as metrics
+from utils import Requester, build_cache
+
+log = logging.getLogger("Sharding")
+
+# config values the workers take from the coordinator
+WORKER_SETTINGS = ('SWAPI_BASE_URL', 'CACHE_SQLITE_PATH', 'CACHE_TTL', 'CACHE_DEFAULT_TTL', 'REDIS_URL',
+                   'REDIS_KEY_PREFIX', 'REQUESTER_MAX_WORKERS', 'HTTP_POOL_CONNECTIONS', 'HTTP_POOL_MAXSIZE',
+                   'HTTP_TIMEOUT', 'HTTP_RETRIES', 'HTTP_RETRY_BACKOFF_FACTOR', 'HTTP_RETRY_JITTER',
+                   'HTTP_RETRY_STATUSES', 'HTTP_RETRY_METHODS', 'RATE_LIMIT_DEFAULT', 'RATE_LIMITS',
+                   'RATE_LIMIT_STATUSES', 'RATE_LIMIT_RETRIES', 'RATE_LIMIT_MAX_RETRY_AFTER')
+
+_executor = None
+_executor_lock = threading.Lock()
+# Backend and settings of the cache built by this worker process
+_worker_cache = None
+
+
+def get_executor():
+    """
+    Process pool shared by the sharded extractions of a run, started on first use
+    :return: ProcessPoolExecutor with config.SHARD_WORKERS processes
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=config.SHARD_WORKERS,
+                                            mp_context=multiprocessing.get_context(config.SHARD_START_METHOD))
+        return _executor
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+atexit.register(shutdown_executor)
+
+
+def split(urls, shard_pages):
+    """
+    :param urls: page urls in page order
+    :param shard_pages: pages per shard
+    :return: list of shards, lists of consecutive urls
+    """
+    return [urls[start:start + shard_pages] for start in range(0, len(urls), shard_pages)]
+
+
+def _process_id():
+    return socket.gethostname(), os.getpid()
+
+
+def _share_limits(limits, workers):
+    """
+    :param limits: HostLimiter settings
+    :param workers: processes sharing them
+    :return: copy of the settings with the rate and burst of one process
+    """
+    limits = dict(limits)
+    if limits.get('rate'):
+        limits['rate'] = limits['rate'] / float(workers)
+    if limits.get('burst'):
+        limits['burst'] = max(1, limits['burst'] // workers)
+    return limits
+
+
+def worker_settings(workers):
+    """
+    Config values sent with every shard (WORKER_SETTINGS), every worker process has its own rate limiter so the
+    rates of config.RATE_LIMIT_DEFAULT / config.RATE_LIMITS are divided between the workers
+    :param workers: worker processes fetching at the same time
+    :return: dictionary {name: value}
+    """
+    workers = max(workers, 1)
+    settings = {name: getattr(config, name) for name in WORKER_SETTINGS}
+    settings['RATE_LIMIT_DEFAULT'] = _share_limits(config.RATE_LIMIT_DEFAULT, workers)
+    settings['RATE_LIMITS'] = {host: _share_limits(limits, workers) for host, limits in config.RATE_LIMITS.items()}
+    return settings
+
+
+def fetch_shard(resource, urls, backend, settings, coordinator):
+    """
+    Worker side: fetch the pages of a shard through the shared cache and deserialize their objects
+    :param resource: SWAPI resource, key of pipeline.QUERY_SETS
+    :param urls: page urls of the shard
+    :param backend: cache backend, see utils.build_cache
+    :param settings: config values of the coordinator (WORKER_SETTINGS)
+    :param coordinator: process id of the coordinator, workers running inside it keep its config and cache
+    :return: tuple (ran on another process, objects in page order, counters increased by the shard)
+    """
+    global _worker_cache
+    from http_session import close_session
+    from pipeline import QUERY_SETS
+
+    remote = _process_id() != coordinator
+    if remote:
+        for name, value in settings.items():
+            setattr(config, name, value)
+        cache_key = (backend, repr(sorted(settings.items())))
+        if _worker_cache != cache_key:
+            Requester.set_cache(build_cache(backend))
+            # The next request builds a session and rate limiter with the new settings
+            close_session()
+            _worker_cache = cache_key
+        before = metrics.counter_values()
+
+    query_set = QUERY_SETS[resource]()
+    items = []
+    for url in urls:
+        items.extend(query_set.get_raw(url).get('results', []))
+    objects = query_set.serialize(items=items)
+    return remote, objects, metrics.counter_changes(before) if remote else {}
+
+
+class ShardedExtractor:
+    """
+    Coordinator of the sharded extraction of one or more collections
+    """
+
+    def __init__(self, executor=None, shard_pages=None, backend=None, workers=None):
+        """
+        :param executor: concurrent.futures.Executor running the shards [Default: get_executor()]
+        :param shard_pages: pages per shard [Default: config.SHARD_PAGES]
+        :param backend: cache backend of the workers [Default: config.SHARD_CACHE_BACKEND]
+        :param workers: worker processes of the executor, they share the request rate [Default: config.SHARD_WORKERS]
+        """
+        self.executor = executor
+        self.shard_pages = shard_pages or config.SHARD_PAGES
+        self.backend = backend or config.SHARD_CACHE_BACKEND
+        self.workers = workers or config.SHARD_WORKERS
+
+    def extract(self, resources):
+        """
+        Extract every object of the resources, the shards of every resource are submitted before any result is
+        waited for, so the collections are fetched at the same time
+        :param resources: SWAPI resources, keys of pipeline.QUERY_SETS
+        :return: dictionary {resource: query set holding every object in page order}
+        """
+        from pipeline import QUERY_SETS
+        from snapshot import SnapshotCache
+
+        if isinstance(Requester.get_cache(), SnapshotCache):
+            # Workers would go to the network, the snapshot serves the whole collections without them
+            log.info("Snapshot in use, extracting %s without worker processes", ', '.join(resources))
+            return {resource: QUERY_SETS[resource]().get_all() for resource in resources}
+
+        executor = self.executor or get_executor()
+        settings = worker_settings(self.workers)
+        coordinator = _process_id()
+        submitted = []
+        with metrics.stage('fetch'):
+            for resource in resources:
+                query_set = QUERY_SETS[resource]()
+                first_page = query_set.get_raw(query_set._collection_url())
+                shards = split(query_set._page_urls(first_page), self.shard_pages)
+                if not shards and first_page.get('next'):
+                    # The page urls cannot be worked out without the count, walk the next links here instead
+                    submitted.append((resource, query_set.get_all(concurrent=False), None, []))
+                    continue
+                futures = [executor.submit(fetch_shard, resource, urls, self.backend, settings, coordinator)
+                           for urls in shards]
+                submitted.append((resource, query_set, first_page, list(zip(shards, futures))))
+
+            query_sets = {}
+            for resource, query_set, first_page, shards in submitted:
+                if first_page is None:
+                    query_sets[resource] = query_set
+                    continue
+                objects = query_set.serialize(items=first_page.get('results', []))
+                pages = 1
+                for urls, future in shards:
+                    remote, shard_objects, counters = future.result()
+                    if remote:
+                        metrics.add_counters(counters)
+                        Requester.get_identity_map().add(shard_objects)
+                    objects.extend(shard_objects)
+                    pages += len(urls)
+                metrics.inc('pages_total', pages, endpoint=resource)
+                metrics.inc('items_total', len(objects), endpoint=resource)
+                log.info("%s: %s pages in %s shards, %s items", resource, pages, len(shards), len(objects))
+                query_set._set_source(objects)
+                query_sets[resource] = query_set
+        return query_sets
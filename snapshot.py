@@ -0,0 +1,236 @@
+"""
+Offline snapshots of the SWAPI dataset: every page and every object of config.SNAPSHOT_RESOURCES stored by url in a
+single file, each response compressed on its own so any of them can be read without touching the rest.
+
+    python snapshot.py dump [path]            # crawl SWAPI into the snapshot
+    python snapshot.py run [path] [--upload]  # run the pipeline served from the snapshot, no network at all
+
+File layout: header (magic, index offset, index length), the zlib compressed JSON responses one after the other and
+the zlib compressed JSON index {'base_url': ..., 'entries': {url: [offset, length]}} at the end.
+"""
+import argparse
+import copy
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import config
+from json_codec import dumps, loads
+from logging_config import configure_logging
+from utils import MISSING, Requester
+
+log = logging.getLogger("Snapshot")
+
+MAGIC = b'SWAPISN1'
+HEADER = struct.Struct('<8sQQ')
+
+
+class _Recorder:
+    """
+    Cache that never hits and keeps every response stored by the requesters, used while crawling
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        return default
+
+    def get_entry(self, key):
+        return None
+
+    def set(self, key, value, etag=None, last_modified=None):
+        with self.lock:
+            self.entries[key] = value
+
+    def touch(self, key):
+        pass
+
+
+def dump(path=None, resources=None):
+    """
+    Crawl every page of the resources through Requester and write them, together with every object on its own url,
+    to a snapshot file
+    :param path: snapshot file path [Default: config.SNAPSHOT_PATH]
+    :param resources: SWAPI resources to crawl [Default: config.SNAPSHOT_RESOURCES]
+    :return: number of responses stored
+    """
+    path = path or config.SNAPSHOT_PATH
+    recorder = _Recorder()
+    previous_cache = Requester.get_cache()
+    Requester.set_cache(recorder)
+    try:
+        for resource in resources or config.SNAPSHOT_RESOURCES:
+            requester = Requester()
+            requester.endpoint = resource
+            for page in requester.iter_raw_pages():
+                for record in page.get('results', []):
+                    if record.get('url'):
+                        recorder.set(record['url'], record)
+    finally:
+        Requester.set_cache(previous_cache)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    temporary_path = '{}.tmp'.format(path)
+    index = {}
+    with open(temporary_path, mode='wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for url, value in recorder.entries.items():
+            data = zlib.compress(dumps(value).encode('utf-8'), 9)
+            index[url] = (f.tell(), len(data))
+            f.write(data)
+        index_offset = f.tell()
+        index_data = zlib.compress(dumps({'base_url': config.SWAPI_BASE_URL, 'created': time.time(),
+                                          'entries': index}).encode('utf-8'), 9)
+        f.write(index_data)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, index_offset, len(index_data)))
+    os.replace(temporary_path, path)
+    log.info("Snapshot of %s responses written to %s (%s bytes)", len(index), path, os.path.getsize(path))
+    return len(index)
+
+
+class SnapshotFile:
+    """
+    Read only access to a snapshot file through a memory map, only the index is decoded when opening it
+    """
+
+    class InvalidSnapshot(Exception):
+        pass
+
+    def __init__(self, path=None):
+        """
+        :param path: snapshot file path [Default: config.SNAPSHOT_PATH]
+        """
+        self.path = path or config.SNAPSHOT_PATH
+        with open(self.path, mode='rb') as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise SnapshotFile.InvalidSnapshot('Not a snapshot file: {}'.format(self.path))
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC or index_offset + index_length > len(self.mmap):
+            self.close()
+            raise SnapshotFile.InvalidSnapshot('Not a snapshot file: {}'.format(self.path))
+        index = loads(zlib.decompress(self.mmap[index_offset:index_offset + index_length]))
+        self.base_url = index['base_url']
+        self.created = index['created']
+        self.entries = index['entries']
+
+    def get(self, url, default=None):
+        """
+        :param url: url of the response
+        :return: decoded response / default if the url is not in the snapshot
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return default
+        offset, length = entry
+        return loads(zlib.decompress(self.mmap[offset:offset + length]))
+
+    def close(self):
+        self.mmap.close()
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class SnapshotCache:
+    """
+    Offline cache backend serving the requesters from a snapshot file, a url missing from the snapshot raises
+    SnapshotMiss instead of going to the network
+    """
+
+    class SnapshotMiss(Exception):
+        pass
+
+    def __init__(self, snapshot):
+        """
+        :param snapshot: SnapshotFile
+        """
+        self.snapshot = snapshot
+
+    def get(self, key, default=None):
+        value = self.snapshot.get(key, MISSING)
+        if value is MISSING:
+            raise SnapshotCache.SnapshotMiss('{} is not in the snapshot {}'.format(key, self.snapshot.path))
+        return value
+
+    def get_entry(self, key):
+        return None
+
+    def set(self, key, value, etag=None, last_modified=None):
+        pass
+
+    def touch(self, key):
+        pass
+
+
+@contextmanager
+def use_snapshot(path=None):
+    """
+    Serve every requester from a snapshot file while the context is active, config.SWAPI_BASE_URL points to the
+    base url the snapshot was crawled from
+    :param path: snapshot file path [Default: config.SNAPSHOT_PATH]
+    """
+    snapshot = SnapshotFile(path)
+    previous_cache, previous_base_url = Requester.get_cache(), config.SWAPI_BASE_URL
+    Requester.set_cache(SnapshotCache(snapshot))
+    config.SWAPI_BASE_URL = snapshot.base_url
+    try:
+        yield snapshot
+    finally:
+        Requester.set_cache(previous_cache)
+        config.SWAPI_BASE_URL = previous_base_url
+        snapshot.close()
+
+
+def run(path=None, upload=False, stages=None):
+    """
+    Run the pipeline stages served from a snapshot file
+    :param path: snapshot file path [Default: config.SNAPSHOT_PATH]
+    :param upload: keep the uploads of the load stages (httpbin has to be reachable)
+    :param stages: pipeline stages [Default: config.PIPELINE]
+    :return: results of the pipeline
+    """
+    from pipeline import Pipeline
+
+    stages = copy.deepcopy(stages if stages is not None else config.PIPELINE)
+    if not upload:
+        for definition in stages.values():
+            definition.pop('upload', None)
+    with use_snapshot(path):
+        return Pipeline(stages).run()
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Offline SWAPI snapshots')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    dump_parser = subparsers.add_parser('dump', help='crawl SWAPI into a snapshot file')
+    dump_parser.add_argument('path', nargs='?', default=config.SNAPSHOT_PATH)
+    run_parser = subparsers.add_parser('run', help='run the pipeline from a snapshot file')
+    run_parser.add_argument('path', nargs='?', default=config.SNAPSHOT_PATH)
+    run_parser.add_argument('--upload', action='store_true', help='upload the output to httpbin')
+    return parser.parse_args(args)
+
+
+if __name__ == '__main__':
+    configure_logging()
+    arguments = parse_args()
+    if arguments.command == 'dump':
+        dump(arguments.path)
+    else:
+        start = time.perf_counter()
+        run(arguments.path, upload=arguments.upload)
+        log.info("Pipeline run from %s in %.3fs", arguments.path, time.perf_counter() - start)
@@ -0,0 +1,154 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlparse
+
+import config
+from json_codec import dumps, loads
+
+CacheEntry = namedtuple('CacheEntry', ['value', 'fetched_at', 'etag', 'last_modified'])
+
+
+def conditional_headers(entry):
+    """
+    Headers to revalidate a stale entry with a conditional GET
+    :param entry: CacheEntry / None
+    :return: dictionary with If-None-Match / If-Modified-Since headers (empty if there is nothing to revalidate)
+    """
+    headers = {}
+    if entry is not None:
+        if entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+    return headers
+
+
+class SQLiteCache:
+    """
+    Persistent cache storing the response bodies on a SQLite database together with the time they were fetched and
+    their ETag / Last-Modified headers, so entries survive between runs.
+    Entries expire after the TTL of their endpoint (config.CACHE_TTL), expired entries are kept to be revalidated
+    with a conditional GET.
+    """
+    SCHEMA = ('CREATE TABLE IF NOT EXISTS responses ('
+              'url TEXT PRIMARY KEY, body TEXT NOT NULL, fetched_at REAL NOT NULL, etag TEXT, last_modified TEXT)')
+
+    def __init__(self, path=None, ttl=None, default_ttl=None):
+        """
+        :param path: database file path [Default: config.CACHE_SQLITE_PATH]
+        :param ttl: map of endpoint and time to live in seconds following {'people': 3600} [Default: config.CACHE_TTL]
+        :param default_ttl: time to live of endpoints not present on ttl [Default: config.CACHE_DEFAULT_TTL]
+        """
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path or config.CACHE_SQLITE_PATH
+        self.ttl = config.CACHE_TTL if ttl is None else ttl
+        self.default_ttl = config.CACHE_DEFAULT_TTL if default_ttl is None else default_ttl
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute(self.SCHEMA)
+
+    def ttl_for(self, key):
+        """
+        Time to live of a url based on its endpoint, for example https://swapi.co/api/people/?page=2 -> people
+        :param key: url
+        :return: time to live in seconds
+        """
+        for segment in urlparse(key).path.split('/'):
+            if segment in self.ttl:
+                return self.ttl[segment]
+        return self.default_ttl
+
+    def get_entry(self, key):
+        """
+        Get the stored entry even if it expired, useful to revalidate it
+        :param key: url
+        :return: CacheEntry / None if key not present on cache
+        """
+        with self.lock:
+            row = self.connection.execute('SELECT body, fetched_at, etag, last_modified FROM responses WHERE url = ?',
+                                          (key,)).fetchone()
+        if row is None:
+            return None
+        body, fetched_at, etag, last_modified = row
+        return CacheEntry(value=loads(body), fetched_at=fetched_at, etag=etag, last_modified=last_modified)
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache if it has not expired
+        :param key: url
+        :param default: default value to return in case value not present or expired
+        :return: value / default value
+        """
+        return self.lookup(key, default)[0]
+
+    def lookup(self, key, default=None):
+        """
+        Get a value and, when it expired, the entry to revalidate it with a single read of the stored entry
+        :param key: url
+        :param default: default value to return in case value not present or expired
+        :return: tuple (value / default value, expired CacheEntry / None)
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return default, None
+        if time.time() - entry.fetched_at >= self.ttl_for(key):
+            return default, entry
+        return entry.value, None
+
+    def set(self, key, value, etag=None, last_modified=None):
+        """
+        Store a value inside the cache
+
+        :param key: url
+        :param value: JSON serializable value
+        :param etag: ETag header of the response
+        :param last_modified: Last-Modified header of the response
+        """
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses (url, body, fetched_at, etag, last_modified) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    (key, dumps(value), time.time(), etag, last_modified))
+
+    def set_many(self, entries, shared_with=None):
+        """
+        Store several values inside the cache in one transaction
+
+        :param entries: list of tuples (key, JSON serializable value)
+        :param shared_with: key of the entry holding the values (not used, every entry is stored on its own)
+        """
+        fetched_at = time.time()
+        rows = [(key, dumps(value), fetched_at, None, None) for key, value in entries]
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany('INSERT OR REPLACE INTO responses (url, body, fetched_at, etag, '
+                                            'last_modified) VALUES (?, ?, ?, ?, ?)', rows)
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def touch(self, key):
+        """
+        Mark an entry as fetched now, used when the server confirms (304 Not Modified) that it is still valid
+        :param key: url
+        """
+        with self.lock:
+            self.connection.execute('UPDATE responses SET fetched_at = ? WHERE url = ?', (time.time(), key))
+
+    def clear(self):
+        """
+        Remove every entry
+        """
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import os
+from unittest import TestCase
+
+import aiohttp
+from mock import patch
+
+import config
+from async_utils import AsyncRequester
+from benchmarks.stub_server import StubDataset, serve
+from metrics import registry as metrics
+from models import PeopleQuerySet, SpeciesQuerySet, Person
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def load_fixture(name):
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', name), 'r') as f:
+        return json.loads(f.read())
+
+
+class TestAsyncRequester(TestCase):
+    def test_private_aget_cache_hit(self):
+        requester = AsyncRequester()
+        requester.get_cache().set(key='http://fake_async_url', value='cache_data')
+        self.assertEqual(run(requester._aget('http://fake_async_url')), 'cache_data')
+
+    def test_private_aget_shares_response_handling(self):
+        async def fetch(url):
+            try:
+                return await requester._aget(url)
+            finally:
+                await AsyncRequester.aclose()
+
+        requester = AsyncRequester()
+        with serve(dataset=StubDataset(people=5, species=1), page_size=10) as server:
+            url = '{}/people/1/'.format(server.swapi_base_url)
+            self.assertEqual(run(fetch(url))['url'], url)
+            self.assertEqual(requester.get_cache().get(url)['url'], url)
+            missing_url = '{}/people/99/'.format(server.swapi_base_url)
+            with self.assertRaises(aiohttp.ClientResponseError):
+                run(fetch(missing_url))
+            self.assertIsNone(requester.get_cache().get(missing_url))
+
+    def test_private_aget_retries_throttled_responses(self):
+        async def fetch(url):
+            try:
+                return await requester._aget(url)
+            finally:
+                await AsyncRequester.aclose()
+
+        metrics.reset()
+        requester = AsyncRequester()
+        with serve(dataset=StubDataset(people=5, species=1), error_rate=1.0) as server, \
+                patch('async_utils.config.HTTP_RETRY_BACKOFF_FACTOR', 0), \
+                patch('async_utils.config.RATE_LIMIT_RETRIES', 2):
+            with self.assertRaises(aiohttp.ClientResponseError):
+                run(fetch('{}/people/1/'.format(server.swapi_base_url)))
+            self.assertEqual(server.counters()['requests'], 3)
+        self.assertEqual(metrics.total('http_throttled_total'), 3)
+
+    @patch('async_utils.AsyncRequester._aget')
+    def test_aget_all_person_query_set(self, mock_aget):
+        mock_aget.side_effect = [load_fixture('people_page_1.json'), load_fixture('people_page_2.json')]
+        result = run(PeopleQuerySet().aget_all())
+
+        self.assertEqual(mock_aget.call_count, 2)
+        self.assertEqual(len(result), 12)
+        self.assertEqual(result.items[0].name, 'Luke Skywalker')
+        self.assertEqual(result.items[11].name, 'Wilhuff Tarkin')
+        mock_aget.assert_any_call('{}/people'.format(config.SWAPI_BASE_URL))
+        mock_aget.assert_any_call('https://swapi.co/api/people/?page=2')
+
+    @patch('async_utils.AsyncRequester._aget')
+    def test_aget_by_url_species_query_set(self, mock_aget):
+        mock_aget.return_value = load_fixture('species_1.json')
+        result = run(SpeciesQuerySet().aget_by_url('https://myfakeurl/species/1'))
+        self.assertEqual(result.name, 'Human')
+        mock_aget.assert_called_once_with('https://myfakeurl/species/1')
+
+    @patch('async_utils.AsyncRequester._aget')
+    def test_aresolve_foreign_keys_requests_each_url_once(self, mock_aget):
+        mock_aget.return_value = load_fixture('species_1.json')
+        query_set = PeopleQuerySet(items=[
+            Person(name='actor_1', height='100', films=[1], species=['https://myfakeurl/species/1']),
+            Person(name='actor_2', height='90', films=[1], species=['https://myfakeurl/species/1']),
+        ], foreign_keys={'species': SpeciesQuerySet()})
+
+        run(query_set.aresolve_foreign_keys())
+
+        self.assertEqual([person.species for person in query_set], ['Human', 'Human'])
+        mock_aget.assert_called_once_with('https://myfakeurl/species/1')
@@ -0,0 +1,96 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+import config
+from benchmarks.stub_server import StubDataset, serve
+from cli import build_stages, parse_args, run
+from http_session import close_session
+from utils import Requester
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TestBuildStages(TestCase):
+    def test_default_options_match_default_pipeline(self):
+        stages = build_stages(parse_args([]))
+        self.assertEqual(stages['top']['operations'], [('order_by', 'films_count', {'desc': True}), ('slice', 0, 10),
+                                                       ('order_by', 'height', {'desc': True})])
+        self.assertEqual(stages['joined']['foreign_keys'], {'species': 'species'})
+        self.assertEqual(stages['output']['input'], 'joined')
+        self.assertEqual(stages['output']['file_path'], 'output.csv')
+        self.assertTrue(stages['output']['upload'])
+
+    def test_options(self):
+        stages = build_stages(parse_args(['--resource', 'species', '--top', '3', '--sort', 'name', '--ascending',
+                                          '--format', 'parquet', '--no-upload']))
+        self.assertEqual(sorted(stages), ['output', 'species', 'top'])
+        self.assertEqual(stages['top']['operations'], [('order_by', 'name', {'desc': False}), ('slice', 0, 3)])
+        self.assertEqual(stages['output']['exporter'], 'parquet')
+        self.assertNotIn('file_path', stages['output'])
+        self.assertFalse(stages['output']['upload'])
+
+    def test_snapshot_does_not_upload(self):
+        stages = build_stages(parse_args(['--snapshot', 'swapi.snapshot']))
+        self.assertFalse(stages['output']['upload'])
+
+    def test_incremental_rejects_ignored_options(self):
+        self.assertTrue(parse_args(['--incremental', '--workers', '2']).incremental)
+        for option in (['--top', '10'], ['--sort', 'name'], ['--format', 'ndjson'], ['--output', 'top.csv'],
+                       ['--snapshot', 'swapi.snapshot']):
+            with patch('sys.stderr'), self.assertRaises(SystemExit):
+                parse_args(['--incremental'] + option)
+
+
+class TestLazyImports(TestCase):
+    def test_heavy_modules_are_not_imported_by_main(self):
+        output = subprocess.check_output(
+            [sys.executable, '-c', 'import json, sys, main; '
+                                   'print(json.dumps([module for module in ("requests", "aiohttp", "asyncio", '
+                                   '"pyarrow") if module in sys.modules]))'], cwd=ROOT)
+        self.assertEqual(json.loads(output), [])
+
+
+class TestRun(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        close_session()
+        self.directory = tempfile.mkdtemp()
+        # run() applies the options to config
+        self.config = patch.multiple(config, REQUESTER_MAX_WORKERS=config.REQUESTER_MAX_WORKERS,
+                                     HTTP_POOL_MAXSIZE=config.HTTP_POOL_MAXSIZE,
+                                     RATE_LIMIT_DEFAULT=config.RATE_LIMIT_DEFAULT,
+                                     REQUESTER_CONCURRENT=config.REQUESTER_CONCURRENT,
+                                     CACHE_BACKEND=config.CACHE_BACKEND, METRICS_OUTPUT=config.METRICS_OUTPUT,
+                                     OUTPUT_DIR=self.directory)
+        self.config.start()
+
+    def tearDown(self):
+        self.config.stop()
+        Requester.set_cache(self.previous_cache)
+        close_session()
+        shutil.rmtree(self.directory)
+
+    def test_run_with_options(self):
+        with serve(dataset=StubDataset(people=30, species=4), page_size=10) as server:
+            results = run(['--top', '3', '--format', 'ndjson', '--output', 'top.ndjson', '--no-upload',
+                           '--workers', '2', '--sequential'])
+            self.assertEqual(server.counters()['requests'], 3 + 1)
+        self.assertEqual(results['output'], os.path.join(self.directory, 'top.ndjson'))
+        with open(results['output']) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(sorted(rows[0]), ['appearances', 'height', 'name', 'species'])
+        heights = [row['height'] or -1 for row in rows]
+        self.assertEqual(heights, sorted(heights, reverse=True))
+
+    def test_run_uploads_binary_formats(self):
+        with serve(dataset=StubDataset(people=30, species=4), page_size=10):
+            results = run(['--top', '3', '--format', 'parquet', '--output', 'top.parquet'])
+        self.assertEqual(results['output'], os.path.join(self.directory, 'top.parquet'))
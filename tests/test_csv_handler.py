@@ -1,10 +1,13 @@
+import gzip
+import io
 import os
+import shutil
 import tempfile
-from unittest import TestCase
+from unittest import TestCase, skipUnless
 
 from mock import patch, call
 
-from csv_handler import CSVHandler
+from csv_handler import CSVHandler, csv_chunks, zstandard
 
 
 class TestFileContent:
@@ -52,3 +55,58 @@ class TestCSVHandler(TestCase):
         self.assertEqual(mock_csv.writer.call_args.kwargs['delimiter'], ',')
         self.assertEqual(mock_csv.writer.call_args.kwargs['quotechar'], '"')
         self.assertEqual(mock_csv.writer.call_args.kwargs['quoting'], mock_csv.QUOTE_MINIMAL)
+
+
+class DummyRow:
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class TestCSVHandlerStreaming(TestCase):
+    fields = {'name': 'name', 'value': 'value', 'empty': None}
+
+    def test_write_generator_to_file_obj(self):
+        output = io.StringIO()
+        csv_file = CSVHandler(items=(DummyRow('row{}'.format(i), i) for i in range(3)), fields=self.fields,
+                              file_obj=output)
+        self.assertIsNone(csv_file.file_path)
+        self.assertEqual(csv_file.rows_written, 3)
+        self.assertEqual(output.getvalue(), 'name,value,empty\r\nrow0,0,\r\nrow1,1,\r\nrow2,2,\r\n')
+
+    def test_write_gzip_file(self):
+        tmp_file = TestFileContent(content='')
+        with tmp_file:
+            CSVHandler(items=[DummyRow('row', None)], fields=self.fields, file_path=tmp_file.filename,
+                       compression='gzip', buffer_size=16)
+            with gzip.open(tmp_file.filename, mode='rt', newline='') as f:
+                self.assertEqual(f.read(), 'name,value,empty\r\nrow,None,\r\n')
+
+    @skipUnless(zstandard, 'zstandard not installed')
+    def test_write_zstd_file_obj(self):
+        output = io.BytesIO()
+        CSVHandler(items=[DummyRow('row', 1)], fields=self.fields, include_headers=False, file_obj=output,
+                   compression='zstd')
+        content = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(output.getvalue())).read()
+        self.assertEqual(content, b'row,1,\r\n')
+
+    def test_relative_path_inside_output_dir(self):
+        output_dir = tempfile.mkdtemp()
+        with patch('csv_handler.config.OUTPUT_DIR', os.path.join(output_dir, 'output')):
+            csv_file = CSVHandler(items=[], fields=self.fields, file_path='people.csv')
+            self.assertEqual(csv_file.file_path, os.path.join(output_dir, 'output', 'people.csv'))
+            self.assertTrue(os.path.isfile(csv_file.file_path))
+        shutil.rmtree(output_dir)
+
+    def test_invalid_compression(self):
+        with self.assertRaises(ValueError):
+            CSVHandler(items=[], fields=self.fields, file_obj=io.StringIO(), compression='bz2')
+
+    def test_csv_chunks(self):
+        chunks = list(csv_chunks(items=(DummyRow('row{}'.format(i), i) for i in range(3)), fields=self.fields,
+                                 chunk_size=10))
+        self.assertTrue(all(isinstance(chunk, bytes) for chunk in chunks))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(b''.join(chunks), b'name,value,empty\r\nrow0,0,\r\nrow1,1,\r\nrow2,2,\r\n')
+        with self.assertRaises(CSVHandler.MissingCSVFields):
+            next(csv_chunks(items=[]))
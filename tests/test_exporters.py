@@ -0,0 +1,77 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+
+from csv_handler import CSVHandler
+from exporters import ArrowExporter, NDJSONExporter, ParquetExporter, load_pyarrow
+from models import Person
+
+pyarrow = load_pyarrow()
+FIELDS = {'name': 'name', 'species': 'species', 'height': 'height', 'appearances': 'films_count'}
+
+
+def people():
+    yield Person(name='Luke Skywalker', height='172', films=[1, 2], species=['https://swapi.co/api/species/1/'])
+    yield Person(name='Unknown', height='unknown', films=[1], species=None)
+    yield Person(name='Yoda', height='66', films=[1, 2, 3], species=['https://swapi.co/api/species/6/'])
+
+
+class TestNDJSONExporter(TestCase):
+    def test_no_fields_provided(self):
+        with self.assertRaises(CSVHandler.MissingCSVFields):
+            NDJSONExporter(items=[], file_obj=io.StringIO())
+
+    def test_write_rows_keeping_types(self):
+        output = io.StringIO()
+        exporter = NDJSONExporter(items=people(), fields=FIELDS, file_obj=output, batch_size=2)
+        self.assertEqual(exporter.rows_written, 3)
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(rows[0], {'name': 'Luke Skywalker', 'species': 'https://swapi.co/api/species/1/',
+                                   'height': 172, 'appearances': 2})
+        self.assertIsNone(rows[1]['height'])
+        self.assertEqual(rows[2]['name'], 'Yoda')
+
+
+@skipUnless(pyarrow, 'pyarrow not installed')
+class TestArrowExporters(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_arrow_file(self):
+        path = os.path.join(self.directory, 'people.arrow')
+        ArrowExporter(items=people(), fields=FIELDS, file_path=path, batch_size=2)
+        with pyarrow.memory_map(path) as source:
+            reader = pyarrow.ipc.open_file(source)
+            self.assertEqual(reader.num_record_batches, 2)
+            table = reader.read_all()
+        self.assertEqual(table.column('height').to_pylist(), [172, None, 66])
+        self.assertEqual(table.schema.field('appearances').type, pyarrow.int64())
+
+    def test_write_parquet_file(self):
+        path = os.path.join(self.directory, 'people.parquet')
+        ParquetExporter(items=people(), fields=FIELDS, file_path=path, batch_size=2)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column('name').to_pylist(), ['Luke Skywalker', 'Unknown', 'Yoda'])
+        self.assertEqual(table.column('height').to_pylist(), [172, None, 66])
+
+    def test_column_without_values_in_first_batch(self):
+        path = os.path.join(self.directory, 'people.parquet')
+        items = [Person(name='Unknown', height='unknown', films=[1], species=None),
+                 Person(name='Luke Skywalker', height='172', films=[1, 2], species=['species/1'])]
+        ParquetExporter(items=items, fields=FIELDS, file_path=path, batch_size=1)
+        table = pyarrow.parquet.read_table(path)
+        self.assertEqual(table.column('height').to_pylist(), [None, 172])
+        self.assertEqual(table.schema.field('height').type, pyarrow.int64())
+        self.assertEqual(table.schema.field('species').type, pyarrow.string())
+
+    def test_write_empty_arrow_file(self):
+        path = os.path.join(self.directory, 'empty.arrow')
+        ArrowExporter(items=[], fields=FIELDS, file_path=path)
+        with pyarrow.memory_map(path) as source:
+            self.assertEqual(pyarrow.ipc.open_file(source).read_all().num_rows, 0)
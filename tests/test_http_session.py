@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from mock import patch
+from requests.adapters import HTTPAdapter
+
+import config
+import http_session
+from http_session import JitterRetry, RateLimitedSession, TimeoutHTTPAdapter, build_session, close_session, get_session
+
+
+class TestHTTPSession(TestCase):
+    def tearDown(self):
+        close_session()
+
+    def test_get_session_is_shared(self):
+        self.assertIs(get_session(), get_session())
+
+    def test_close_session_builds_a_new_one(self):
+        session = get_session()
+        close_session()
+        self.assertIsNot(get_session(), session)
+        self.assertIsNotNone(http_session._session)
+
+    def test_build_session_adapter_settings(self):
+        session = build_session()
+        self.assertIsInstance(session, RateLimitedSession)
+        adapter = session.get_adapter('https://swapi.co/api/people')
+        self.assertIsInstance(adapter, TimeoutHTTPAdapter)
+        self.assertEqual(adapter.timeout, config.HTTP_TIMEOUT)
+        self.assertEqual(adapter._pool_maxsize, config.HTTP_POOL_MAXSIZE)
+        self.assertEqual(adapter.max_retries.total, config.HTTP_RETRIES)
+        self.assertEqual(tuple(adapter.max_retries.status_forcelist), config.HTTP_RETRY_STATUSES)
+
+    @patch.object(HTTPAdapter, 'send')
+    def test_timeout_adapter_applies_default_timeout(self, mock_send):
+        adapter = TimeoutHTTPAdapter(timeout=(1, 2))
+        adapter.send('request')
+        self.assertEqual(mock_send.call_args.kwargs['timeout'], (1, 2))
+        adapter.send('request', timeout=7)
+        self.assertEqual(mock_send.call_args.kwargs['timeout'], 7)
+
+    @patch('http_session.random.uniform')
+    def test_jitter_retry_backoff(self, mock_uniform):
+        mock_uniform.return_value = 0.25
+        retry = JitterRetry(total=5, backoff_factor=1)
+        self.assertEqual(retry.get_backoff_time(), 0)
+        retry = retry.increment(method='GET', url='/').increment(method='GET', url='/')
+        self.assertIsInstance(retry, JitterRetry)
+        self.assertEqual(retry.get_backoff_time(), 2.25)
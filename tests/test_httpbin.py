@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import io
 import json
 import os
 import tempfile
@@ -7,7 +10,8 @@ import requests_mock
 from requests.exceptions import HTTPError
 
 import config
-from httpbin import HTTPBin
+from csv_handler import csv_chunks
+from httpbin import HTTPBin, MultipartStream
 
 
 class TestFileContent:
@@ -54,3 +58,79 @@ class TestHTTPBin(TestCase):
                           text=json.dumps({'files': {'file': 'test_data'}}))
         tmp_file = TestFileContent(content='test_data')
         httpbin_client.send_file(file=tmp_file.filename)
+
+    @requests_mock.mock()
+    def test_send_binary_file_echoed_as_data_url(self, request_mock):
+        content = b'PAR1\x00\xff\xfe'
+        data_url = 'data:application/octet-stream;base64,' + base64.b64encode(content).decode('ascii')
+        request_mock.post("{}/{}".format(config.HTTPBIN_BASE_URL, config.HTTPBIN_FILE_ENDPOINT),
+                          text=json.dumps({'files': {'file': data_url}}))
+        HTTPBin().send_file(file=io.BytesIO(content))
+
+
+def echo_file(request, context):
+    """
+    Echo the uploaded file like httpbin.org does
+    """
+    body = request.body.read() if hasattr(request.body, 'read') else b''.join(request.body)
+    content = body.split(b'\r\n\r\n', 1)[1].rsplit(b'\r\n--', 1)[0]
+    return json.dumps({'files': {'file': content.decode('utf-8')}})
+
+
+class TestHTTPBinStreaming(TestCase):
+    url = "{}/{}".format(config.HTTPBIN_BASE_URL, config.HTTPBIN_FILE_ENDPOINT)
+
+    @requests_mock.mock()
+    def test_send_file_path_streamed_with_length(self, request_mock):
+        request_mock.post(self.url, text=echo_file)
+        with TestFileContent(content='name,height\r\nLuke,172\r\n') as tmp_file:
+            HTTPBin().send_file(file=tmp_file.filename)
+
+        request = request_mock.last_request
+        self.assertTrue(request.headers['Content-Type'].startswith('multipart/form-data; boundary='))
+        self.assertEqual(int(request.headers['Content-Length']), request.body.len)
+
+    @requests_mock.mock()
+    def test_send_file_object(self, request_mock):
+        request_mock.post(self.url, text=echo_file)
+        file_obj = io.BytesIO(b'skip,name\r\nLuke\r\n')
+        file_obj.read(5)
+        HTTPBin().send_file(file=file_obj)
+        self.assertEqual(file_obj.read(), b'')
+
+    @requests_mock.mock()
+    def test_send_csv_producer_chunked(self, request_mock):
+        class Row:
+            def __init__(self, name):
+                self.name = name
+
+        request_mock.post(self.url, text=echo_file)
+        HTTPBin().send_file(file=csv_chunks(items=(Row(str(i)) for i in range(100)), fields={'name': 'name'},
+                                            chunk_size=16))
+        self.assertEqual(request_mock.last_request.headers['Transfer-Encoding'], 'chunked')
+
+    @requests_mock.mock()
+    def test_send_csv_producer_integrity_error(self, request_mock):
+        request_mock.post(self.url, text=json.dumps({'files': {'file': 'name\r\n'}}))
+        with self.assertRaises(HTTPBin.FileIntegrityError):
+            HTTPBin().send_file(file=iter([b'name\r\n', b'Luke\r\n']))
+
+
+class TestMultipartStream(TestCase):
+    def test_read_in_chunks_and_digest(self):
+        stream = MultipartStream(chunks=iter([b'abc', b'', b'def']), size=6, filename='output.csv')
+        body = b''
+        data = stream.read(4)
+        while data:
+            body += data
+            data = stream.read(4)
+
+        self.assertEqual(len(body), stream.len)
+        self.assertIn(b'filename="output.csv"\r\nContent-Type: application/octet-stream\r\n\r\nabcdef\r\n--', body)
+        self.assertTrue(body.endswith('--{}--\r\n'.format(stream.boundary).encode()))
+        self.assertEqual(stream.hexdigest(), hashlib.sha256(b'abcdef').hexdigest())
+
+    def test_digest_of_unsent_content(self):
+        stream = MultipartStream(chunks=iter([b'abc', b'def']))
+        self.assertFalse(hasattr(stream, 'len'))
+        self.assertEqual(stream.hexdigest(), hashlib.sha256(b'abcdef').hexdigest())
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session
+from incremental import IncrementalETL
+from models import Person
+from sqlite_cache import SQLiteCache
+from utils import MemoryCache, Requester
+
+
+class TestPersonAttributes(TestCase):
+    def test_round_trip(self):
+        person = Person.from_dict({'name': 'Luke', 'height': '172', 'films': ['a', 'b'], 'species': ['s'],
+                                   'url': 'u'})
+        copy = Person.from_attributes(person.as_dict())
+        self.assertEqual(copy.as_dict(), {'name': 'Luke', 'height': 172, 'films_count': 2, 'species': 's',
+                                          'url': 'u'})
+
+
+class TestIncrementalETL(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+        self.directory = tempfile.mkdtemp()
+        self.output_dir = patch('csv_handler.config.OUTPUT_DIR', self.directory)
+        self.output_dir.start()
+
+    def tearDown(self):
+        self.output_dir.stop()
+        Requester.set_cache(self.previous_cache)
+        close_session()
+        shutil.rmtree(self.directory)
+
+    def etl(self):
+        return IncrementalETL(snapshot_path=os.path.join(self.directory, 'snapshot.json'),
+                              cache=SQLiteCache(path=os.path.join(self.directory, 'cache.sqlite3'), ttl={},
+                                                default_ttl=0))
+
+    @patch('incremental.HTTPBin.send_file')
+    def test_only_redoes_changed_work(self, send_file):
+        dataset = StubDataset(people=30, species=4)
+        with serve(dataset=dataset, page_size=10) as server:
+            file_path = self.etl().run()
+            with open(file_path) as f:
+                top_names = [line.split(',')[0] for line in f.read().splitlines()[1:]]
+            self.assertEqual(len(top_names), 10)
+            self.assertEqual(send_file.call_count, 1)
+            modified_at = os.stat(file_path).st_mtime_ns
+
+            # Nothing changed: every page is a 304 and the output is kept
+            before = server.counters()
+            with patch('incremental.Person.from_dict') as from_dict:
+                self.assertEqual(self.etl().run(), file_path)
+            self.assertFalse(from_dict.called)
+            self.assertEqual(server.counters()['requests'] - before['requests'], 3 + 1)
+            self.assertEqual(server.counters()['bytes_sent'] - before['bytes_sent'], 0)
+            self.assertEqual(send_file.call_count, 1)
+
+            # A person outside of the ranking changed: ranking rebuilt, same result
+            outsider = next(index for index in range(1, 31) if 'Person {}'.format(index) not in top_names)
+            dataset.touch('people', outsider, name='Renamed')
+            self.assertEqual(self.etl().run(), file_path)
+            self.assertEqual(send_file.call_count, 1)
+            self.assertEqual(os.stat(file_path).st_mtime_ns, modified_at)
+
+            # A person of the ranking changed: CSV written and uploaded again
+            dataset.touch('people', int(top_names[0].split()[1]), name='Renamed top')
+            self.etl().run()
+            self.assertEqual(send_file.call_count, 2)
+            with open(file_path) as f:
+                self.assertIn('Renamed top', f.read())
+
+    @patch('incremental.HTTPBin.send_file')
+    def test_species_changes_are_detected(self, send_file):
+        dataset = StubDataset(people=30, species=4)
+        with serve(dataset=dataset, page_size=10):
+            file_path = self.etl().run()
+            with open(file_path) as f:
+                species_names = {line.split(',')[1] for line in f.read().splitlines()[1:]}
+            species_names.discard('')
+
+            for index in range(1, 5):
+                dataset.touch('species', index, name='Renamed species {}'.format(index))
+            self.assertEqual(self.etl().run(), file_path)
+            self.assertEqual(send_file.call_count, 2)
+            with open(file_path) as f:
+                content = f.read()
+            for name in species_names:
+                self.assertNotIn(name + ',', content)
+            self.assertIn('Renamed species', content)
@@ -0,0 +1,17 @@
+from unittest import TestCase
+
+from mock import patch
+
+import json_codec
+
+
+class TestJSONCodec(TestCase):
+    def test_round_trip(self):
+        value = {'count': 1, 'results': [{'name': 'Luke', 'height': '172', 'species': []}], 'next': None}
+        self.assertEqual(json_codec.loads(json_codec.dumps(value)), value)
+        self.assertEqual(json_codec.loads(json_codec.dumps(value).encode('utf-8')), value)
+
+    @patch('json_codec.orjson', None)
+    def test_stdlib_fallback(self):
+        self.assertEqual(json_codec.dumps({'a': [1, None]}), '{"a": [1, null]}')
+        self.assertEqual(json_codec.loads(b'{"a": [1, null]}'), {'a': [1, None]})
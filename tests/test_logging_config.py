@@ -0,0 +1,90 @@
+import logging
+import threading
+from unittest import TestCase
+
+from mock import patch
+
+import logging_config
+from utils import MemoryCache
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+        self.threads = set()
+
+    def emit(self, record):
+        self.records.append(record)
+        self.threads.add(threading.current_thread())
+
+
+class TestConfigureLogging(TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.root_level, self.root_handlers = root.level, list(root.handlers)
+
+    def tearDown(self):
+        logging_config.shutdown_logging()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in self.root_handlers:
+            root.addHandler(handler)
+        root.setLevel(self.root_level)
+
+    def test_records_written_by_listener_thread(self):
+        handler = RecordingHandler()
+        listener = logging_config.configure_logging(level='info', use_queue=True, handlers=[handler])
+        self.assertIsNotNone(listener)
+        logging.getLogger('Test').info("%s pages", 9)
+        logging.getLogger('Test').debug("level off")
+        logging_config.shutdown_logging()
+
+        self.assertEqual([record.getMessage() for record in handler.records], ['9 pages'])
+        self.assertNotIn(threading.current_thread(), handler.threads)
+
+    def test_records_formatted_by_listener_thread(self):
+        class FormattingHandler(RecordingHandler):
+            def emit(self, record):
+                super().emit(record)
+                self.records[-1] = self.format(record)
+
+        handler = FormattingHandler()
+        logging_config.configure_logging(level='info', use_queue=True, handlers=[handler])
+        format_threads = set()
+
+        def format_record(formatter, record):
+            format_threads.add(threading.current_thread())
+            return original_format(formatter, record)
+
+        original_format = logging.Formatter.format
+        pages = [1]
+        with patch('logging.Formatter.format', side_effect=format_record, autospec=True):
+            logging.getLogger('Test').info("pages %s", pages)
+            pages.append(2)
+            try:
+                raise ValueError('broken page')
+            except ValueError:
+                logging.getLogger('Test').exception("failed")
+            logging_config.shutdown_logging()
+
+        self.assertEqual(handler.records[0], 'pages [1]')
+        self.assertIn('ValueError: broken page', handler.records[1])
+        self.assertTrue(format_threads)
+        self.assertNotIn(threading.current_thread(), format_threads)
+
+    def test_records_written_by_calling_thread(self):
+        handler = RecordingHandler()
+        self.assertIsNone(logging_config.configure_logging(level=logging.INFO, use_queue=False, handlers=[handler]))
+        logging.getLogger('Test').info("done")
+        self.assertEqual(handler.threads, {threading.current_thread()})
+
+    def test_cache_lookups_do_not_log(self):
+        handler = RecordingHandler()
+        logging_config.configure_logging(level='debug', use_queue=False, handlers=[handler])
+        cache = MemoryCache()
+        cache.set('https://swapi.co/api/people/1/', {'name': 'Luke Skywalker'})
+        cache.get('https://swapi.co/api/people/1/')
+        cache.get('https://swapi.co/api/people/2/')
+        self.assertEqual(handler.records, [])
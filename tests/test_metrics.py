@@ -0,0 +1,91 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import requests_mock
+
+from metrics import MetricsRegistry, registry
+from utils import Requester
+
+
+class TestMetricsRegistry(TestCase):
+    def test_counters_and_histograms(self):
+        metrics = MetricsRegistry(buckets=(0.1, 1))
+        metrics.inc('http_requests_total', method='GET', status=200)
+        metrics.inc('http_requests_total', 2, status=200, method='GET')
+        metrics.inc('http_requests_total', method='GET', status=404)
+        metrics.observe('http_request_duration_seconds', 0.05)
+        metrics.observe('http_request_duration_seconds', 0.5)
+        metrics.observe('http_request_duration_seconds', 5)
+
+        self.assertEqual(metrics.get('http_requests_total', method='GET', status=200), 3)
+        self.assertEqual(metrics.total('http_requests_total'), 4)
+        histogram = metrics.to_dict()['histograms'][0]
+        self.assertEqual(histogram['buckets'], {'0.1': 1, '1': 2, '+Inf': 3})
+        self.assertEqual(histogram['count'], 3)
+
+    def test_stage_and_cache_hit_ratio(self):
+        metrics = MetricsRegistry()
+        with metrics.stage('fetch'):
+            pass
+        metrics.inc('cache_hits_total', 3)
+        metrics.inc('cache_misses_total')
+        content = json.loads(metrics.to_json())
+        self.assertEqual(content['cache_hit_ratio'], 0.75)
+        self.assertEqual(content['histograms'][0]['labels'], {'stage': 'fetch'})
+        self.assertEqual(content['histograms'][0]['count'], 1)
+
+    def test_summary(self):
+        metrics = MetricsRegistry()
+        metrics.inc('pages_total', 9, endpoint='people')
+        metrics.inc('items_total', 82, endpoint='people')
+        metrics.inc('cache_hits_total', 70)
+        metrics.inc('http_requests_total', 12, method='GET', status=200)
+        self.assertEqual(metrics.summary(), '9 pages, 82 items, 70 cache hits, 12 requests')
+
+    def test_prometheus_format(self):
+        metrics = MetricsRegistry(buckets=(1,))
+        metrics.inc('http_requests_total', method='GET', status=200)
+        metrics.observe('stage_duration_seconds', 0.5, stage='fetch')
+        self.assertEqual(metrics.to_prometheus(), '\n'.join([
+            '# TYPE http_requests_total counter',
+            'http_requests_total{method="GET",status="200"} 1',
+            '# TYPE stage_duration_seconds histogram',
+            'stage_duration_seconds_bucket{stage="fetch",le="1"} 1',
+            'stage_duration_seconds_bucket{stage="fetch",le="+Inf"} 1',
+            'stage_duration_seconds_sum{stage="fetch"} 0.5',
+            'stage_duration_seconds_count{stage="fetch"} 1',
+            '# TYPE cache_hit_ratio gauge',
+            'cache_hit_ratio 0.0',
+        ]) + '\n')
+
+    def test_dump_to_file(self):
+        metrics = MetricsRegistry()
+        metrics.inc('csv_rows_total', 10)
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.prom', delete=False) as f:
+            path = f.name
+        try:
+            metrics.dump(path=path, format='prometheus')
+            with open(path) as f:
+                self.assertIn('csv_rows_total 10', f.read())
+        finally:
+            os.unlink(path)
+
+
+class TestRequesterMetrics(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    @requests_mock.mock()
+    def test_requests_and_cache_counters(self, request_mock):
+        request_mock.get('http://fake_metrics_url', text=json.dumps({'name': 'value'}))
+        requester = Requester()
+        requester._Requester__get('http://fake_metrics_url')
+        requester._Requester__get('http://fake_metrics_url')
+
+        self.assertEqual(registry.get('http_requests_total', method='GET', status=200), 1)
+        self.assertEqual(registry.get('http_received_bytes_total', method='GET'), len('{"name": "value"}'))
+        self.assertEqual(registry.total('cache_hits_total'), 1)
+        self.assertEqual(registry.total('cache_misses_total'), 1)
+        self.assertEqual(registry.to_dict()['histograms'][0]['name'], 'http_request_duration_seconds')
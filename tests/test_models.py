@@ -1,11 +1,17 @@
+import gc
+import heapq
 import json
 import os
+import types
 from unittest import TestCase
 
+import requests_mock
 from mock import patch
 
 import config
-from models import BaseQuerySet, PeopleQuerySet, SpeciesQuerySet, Person, Species
+from models import (LOOKUPS, BaseQuerySet, ColumnTable, PeopleQuerySet, PeopleTable, PersonView, SpeciesQuerySet,
+                    Person, Species, TableRows)
+from utils import MemoryCache, Requester
 
 
 class TestModels(TestCase):
@@ -240,3 +246,364 @@ class TestModels(TestCase):
 
         mock_get.assert_called_once()
         mock_get.assert_called_with('https://myfakeurl/species/1')
+
+    @patch('utils.Requester._Requester__get')
+    def test_resolve_foreign_keys_from_loaded_collection(self, mock_get):
+        mock_get.return_value = {'count': 2, 'next': None, 'results': [
+            {'name': 'Human', 'url': 'https://myfakeurl/species/1'},
+            {'name': 'Droid', 'url': 'https://myfakeurl/species/2'}]}
+        species = SpeciesQuerySet().get_all()
+        self.assertEqual(mock_get.call_count, 1)
+
+        query_set = PeopleQuerySet(items=[
+            Person(name='actor_{}'.format(index), height='100', films=[1],
+                   species=['https://myfakeurl/species/{}'.format(index % 2 + 1)]) for index in range(50)
+        ], foreign_keys={'species': SpeciesQuerySet()})
+        query_set.resolve_foreign_keys()
+
+        self.assertEqual({person.species for person in query_set}, {'Human', 'Droid'})
+        self.assertIs(SpeciesQuerySet().loaded_object('https://myfakeurl/species/2'), species.items[1])
+        self.assertEqual(mock_get.call_count, 1)
+
+    @requests_mock.mock()
+    def test_resolve_foreign_keys_after_collection_is_dropped(self, request_mock):
+        Requester.set_cache(MemoryCache())
+        self.addCleanup(Requester.set_cache, Requester.get_cache())
+        request_mock.get('{}/species'.format(config.SWAPI_BASE_URL), json={'count': 2, 'next': None, 'results': [
+            {'name': 'Human', 'url': 'https://myfakeurl/species/1'},
+            {'name': 'Droid', 'url': 'https://myfakeurl/species/2'}]})
+        SpeciesQuerySet().get_all()
+        gc.collect()
+        self.assertEqual(len(Requester.get_identity_map()), 0)
+
+        query_set = PeopleQuerySet(items=[
+            Person(name='actor_{}'.format(index), height='100', films=[1],
+                   species=['https://myfakeurl/species/{}'.format(index % 2 + 1)]) for index in range(4)
+        ], foreign_keys={'species': SpeciesQuerySet()})
+        query_set.resolve_foreign_keys()
+
+        self.assertEqual({person.species for person in query_set}, {'Human', 'Droid'})
+        self.assertEqual(request_mock.call_count, 1)
+
+    @requests_mock.mock()
+    def test_get_by_url_after_resolving_foreign_keys(self, request_mock):
+        Requester.set_cache(MemoryCache())
+        self.addCleanup(Requester.set_cache, Requester.get_cache())
+        species_url = 'https://myfakeurl/species/3'
+        person_url = 'https://myfakeurl/people/1'
+        request_mock.get('{}/people'.format(config.SWAPI_BASE_URL), json={'count': 1, 'next': None, 'results': [
+            {'name': 'Luke', 'height': '172', 'films': [1], 'species': [species_url], 'url': person_url}]})
+        request_mock.get(species_url, json={'name': 'Species 3', 'url': species_url})
+
+        people = PeopleQuerySet().get_all()
+        people.foreign_keys = {'species': SpeciesQuerySet()}
+        people.resolve_foreign_keys()
+        self.assertEqual(people[0].species, 'Species 3')
+
+        person = PeopleQuerySet().get_by_url(person_url).items[0]
+        self.assertEqual(person.species, species_url)
+        self.assertIsNot(person, people[0])
+        self.assertEqual(request_mock.call_count, 2)
+
+    @patch('utils.Requester._Requester__get')
+    def test_loaded_foreign_keys_win_over_identity_map(self, mock_get):
+        mock_get.return_value = {'count': 1, 'next': None, 'results': [
+            {'name': 'Old name', 'url': 'https://myfakeurl/species/1'}]}
+        old_species = SpeciesQuerySet().get_all()
+        fresh = SpeciesQuerySet(items=[Species(name='New name', url='https://myfakeurl/species/1')])
+        query_set = PeopleQuerySet(items=[
+            Person(name='actor_1', height='100', films=[1], species=['https://myfakeurl/species/1'])
+        ], foreign_keys={'species': fresh})
+        query_set.resolve_foreign_keys()
+
+        self.assertEqual(query_set[0].species, 'New name')
+        self.assertEqual(old_species[0].name, 'Old name')
+
+    @patch('utils.Requester._Requester__get')
+    def test_resolve_foreign_keys_requests_each_url_once(self, mock_get):
+        query_set = PeopleQuerySet(items=
+        [
+            Person(name='actor_1', height='100', films=[1], species=['https://myfakeurl/species/1']),
+            Person(name='actor_2', height='90', films=[1], species=['https://myfakeurl/species/2']),
+            Person(name='actor_3', height='80', films=[1], species=['https://myfakeurl/species/1']),
+            Person(name='actor_4', height='70', films=[1], species=None),
+        ], foreign_keys={'species': SpeciesQuerySet()})
+        mock_get.side_effect = lambda url: {'name': url.rsplit('/', 1)[-1], 'url': url}
+
+        query_set.resolve_foreign_keys()
+
+        self.assertEqual([person.species for person in query_set], ['1', '2', '1', None])
+        self.assertEqual(mock_get.call_count, 2)
+        mock_get.assert_any_call('https://myfakeurl/species/1')
+        mock_get.assert_any_call('https://myfakeurl/species/2')
+
+    @patch('utils.Requester._Requester__get')
+    def test_resolve_foreign_keys_with_loaded_query_set(self, mock_get):
+        species_query_set = SpeciesQuerySet(items=[Species(name='Human', url='https://myfakeurl/species/1')])
+        query_set = PeopleQuerySet(items=
+        [
+            Person(name='actor_1', height='100', films=[1], species=['https://myfakeurl/species/1']),
+        ], foreign_keys={'species': species_query_set})
+
+        query_set.resolve_foreign_keys()
+
+        self.assertEqual(query_set.people[0].species, 'Human')
+        mock_get.assert_not_called()
+        self.assertEqual(len(species_query_set), 1)
+
+    @patch('models.SpeciesQuerySet.get_all')
+    @patch('utils.Requester._Requester__get')
+    def test_resolve_foreign_keys_collection_strategy(self, mock_get, mock_get_all):
+        mock_get_all.return_value = SpeciesQuerySet(items=[Species(name='Human', url='https://myfakeurl/species/1'),
+                                                           Species(name='Droid', url='https://myfakeurl/species/2')])
+        query_set = PeopleQuerySet(items=
+        [
+            Person(name='actor_1', height='100', films=[1], species=['https://myfakeurl/species/2']),
+            Person(name='actor_2', height='90', films=[1], species=['https://myfakeurl/species/1']),
+        ], foreign_keys={'species': SpeciesQuerySet()})
+
+        query_set.resolve_foreign_keys(strategy='collection')
+
+        self.assertEqual([person.species for person in query_set], ['Droid', 'Human'])
+        mock_get_all.assert_called_once()
+        mock_get.assert_not_called()
+
+    def test_species_query_set_name_keeps_items(self):
+        query_set = SpeciesQuerySet(items=[Species(name='Human')])
+        self.assertEqual(query_set.name, 'Human')
+        self.assertEqual(query_set.name, 'Human')
+        self.assertEqual(len(query_set), 1)
+
+    def test_query_plan_runs_lazily(self):
+        people = [Person(name='actor_{}'.format(i), height=str(100 + i), films=[1] * (i % 4), species=None)
+                  for i in range(20)]
+        query_set = PeopleQuerySet(items=people)
+
+        top_query_set = query_set.order_by('films_count').filter(height__gte=105)[0:3].order_by('height', desc=False)
+        self.assertIsNone(top_query_set._result_cache)
+        self.assertEqual(len(top_query_set._plan), 4)
+        self.assertIs(query_set.items, people)
+
+        expected = sorted([person for person in sorted(people, key=lambda p: p.films_count or -1, reverse=True)
+                           if person.height >= 105][0:3], key=lambda p: p.height)
+        self.assertEqual([person.name for person in top_query_set], [person.name for person in expected])
+
+    @patch('models.heapq.nlargest', wraps=heapq.nlargest)
+    def test_order_by_followed_by_slice_uses_top_n(self, mock_nlargest):
+        people = [Person(name='actor_{}'.format(i), height='100', films=[1] * (i % 7), species=None)
+                  for i in range(30)]
+        top_query_set = PeopleQuerySet(items=people).order_by('films_count')[2:5]
+
+        self.assertEqual(top_query_set.items,
+                         sorted(people, key=lambda p: p.films_count or -1, reverse=True)[2:5])
+        mock_nlargest.assert_called_once()
+        self.assertEqual(mock_nlargest.call_args.args[0], 5)
+
+    def test_order_by_several_attributes(self):
+        query_set = PeopleQuerySet(items=
+        [
+            Person(name='actor_1', height='100', films=[1, 2], species=None),
+            Person(name='actor_2', height='180', films=[1], species=None),
+            Person(name='actor_3', height='150', films=[1, 2], species=None),
+            Person(name='actor_4', height='unknown', films=[1, 2], species=None),
+        ])
+        ordered = query_set.order_by('films_count', 'height')
+        self.assertEqual([person.name for person in ordered], ['actor_3', 'actor_1', 'actor_4', 'actor_2'])
+        ordered = query_set.order_by('films_count', 'height', desc=False)
+        self.assertEqual([person.name for person in ordered], ['actor_2', 'actor_4', 'actor_1', 'actor_3'])
+
+    def test_filter_lookups(self):
+        query_set = PeopleQuerySet(items=
+        [
+            Person(name='Luke Skywalker', height='172', films=[1, 2], species=None),
+            Person(name='Anakin Skywalker', height='188', films=[1], species=['species1']),
+            Person(name='Yoda', height='66', films=[1, 2, 3], species=['species2']),
+        ])
+        self.assertEqual([p.name for p in query_set.filter(name__icontains='skywalker', height__gt=180)],
+                         ['Anakin Skywalker'])
+        self.assertEqual([p.name for p in query_set.filter(species__isnull=True)], ['Luke Skywalker'])
+        self.assertEqual([p.name for p in query_set.filter(name='Yoda')], ['Yoda'])
+        self.assertEqual([p.name for p in query_set.filter(lambda p: p.films_count > 1, species__in=['species2'])],
+                         ['Yoda'])
+        with self.assertRaises(ValueError):
+            query_set.filter(name__startswith='Y')
+
+    def test_negative_slices(self):
+        query_set = PeopleQuerySet(items=[Person(name=str(i), height='1', films=[], species=None) for i in range(5)])
+        self.assertEqual([p.name for p in query_set[-2:]], ['3', '4'])
+        self.assertEqual([p.name for p in query_set[::-1]], ['4', '3', '2', '1', '0'])
+        self.assertEqual([p.name for p in query_set.order_by('name')[1:2]], ['3'])
+
+    @patch('utils.Requester._Requester__get')
+    def test_filter_is_pushed_down_to_swapi_search(self, mock_get):
+        mock_get.return_value = {'count': 2, 'next': None, 'results': [
+            {'name': 'Luke Skywalker', 'height': '172', 'films': [1], 'species': [], 'url': 'people/1'},
+            {'name': 'Anakin Skywalker', 'height': '188', 'films': [1], 'species': [], 'url': 'people/11'},
+        ]}
+        query_set = PeopleQuerySet().filter(name__icontains='sky walker', height__lt=180)
+        self.assertEqual(query_set.search, 'sky walker')
+
+        result = query_set.get_all()
+        mock_get.assert_called_once_with('{}/people/?search=sky+walker'.format(config.SWAPI_BASE_URL))
+        self.assertEqual([person.name for person in result], [])
+
+        result = PeopleQuerySet().filter(search='walker', height__lt=180).get_all()
+        mock_get.assert_called_with('{}/people/?search=walker'.format(config.SWAPI_BASE_URL))
+        self.assertEqual([person.name for person in result], ['Luke Skywalker'])
+
+    def test_filter_on_fetched_query_set_is_local(self):
+        query_set = PeopleQuerySet(items=[Person(name='Yoda', height='66', films=[1], species=None)])
+        filtered = query_set.filter(name='Yoda')
+        self.assertIsNone(filtered.search)
+        self.assertEqual(len(filtered), 1)
+        self.assertIsNone(BaseQuerySet().filter(name='Yoda').search)
+
+    def test_search_on_fetched_query_set_is_local(self):
+        query_set = PeopleQuerySet(items=[Person(name='Luke Skywalker', height='172', films=[1], species=None),
+                                          Person(name='Yoda', height='66', films=[1], species=None)])
+        self.assertEqual([person.name for person in query_set.filter(search='YOD')], ['Yoda'])
+        self.assertEqual([person.name for person in query_set.filter(search='vader')], [])
+        with self.assertRaises(ValueError):
+            BaseQuerySet().filter(search='yoda')
+
+    @patch('utils.Requester._Requester__get')
+    def test_filter_after_slice_is_not_pushed_down(self, mock_get):
+        mock_get.return_value = {'count': 2, 'next': None, 'results': [
+            {'name': 'Luke Skywalker', 'height': '172', 'films': [1], 'species': [], 'url': 'people/1'},
+            {'name': 'Yoda', 'height': '66', 'films': [1], 'species': [], 'url': 'people/20'},
+        ]}
+        query_set = PeopleQuerySet()[0:1].filter(name__icontains='yoda')
+        self.assertIsNone(query_set.search)
+        self.assertEqual([person.name for person in query_set.get_all()], [])
+        mock_get.assert_called_once_with('{}/people'.format(config.SWAPI_BASE_URL))
+        self.assertIsNone(PeopleQuerySet().order_by('height').filter(search='yoda').search)
+        self.assertEqual(PeopleQuerySet().filter(height__gt=1).filter(name='Yoda').search, 'Yoda')
+
+    @patch('utils.Requester._Requester__get')
+    def test_stream_all_top_n(self, mock_get):
+        fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+        with open(os.path.join(fixtures_path, 'people_page_1.json'), 'r') as f:
+            page_1 = json.loads(f.read())
+        with open(os.path.join(fixtures_path, 'people_page_2.json'), 'r') as f:
+            page_2 = json.loads(f.read())
+        mock_get.side_effect = [page_1, page_2]
+
+        query_set = PeopleQuerySet().stream_all().order_by('films_count')[0:3]
+        self.assertIsInstance(query_set._source, types.GeneratorType)
+        self.assertEqual([person.name for person in query_set], ['R2-D2', 'C-3PO', 'Obi-Wan Kenobi'])
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_models_use_slots(self):
+        person = Person(name='main_actor', height='90', films=[1], species=['species2'])
+        self.assertFalse(hasattr(person, '__dict__'))
+        self.assertFalse(hasattr(Species(name='species1'), '__dict__'))
+
+    def test_person_keeps_species_list(self):
+        species = ['species1', 'species2']
+        self.assertEqual(Person(name='main_actor', height='90', films=[1], species=species).species, 'species2')
+        self.assertEqual(species, ['species1', 'species2'])
+
+    def test_bulk_factories_match_from_dict(self):
+        fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+        with open(os.path.join(fixtures_path, 'people_page_1.json'), 'r') as f:
+            people = json.loads(f.read())['results']
+        with open(os.path.join(fixtures_path, 'species_1.json'), 'r') as f:
+            species = [json.loads(f.read())]
+
+        self.assertEqual([person.as_dict() for person in Person.from_dicts(people)],
+                         [Person.from_dict(person).as_dict() for person in people])
+        self.assertEqual([(item.name, item.url) for item in Species.from_dicts(species)],
+                         [(item.name, item.url) for item in map(Species.from_dict, species)])
+
+
+class TestPeopleTable(TestCase):
+    def setUp(self):
+        fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+        self.records = []
+        for page in ('people_page_1.json', 'people_page_2.json'):
+            with open(os.path.join(fixtures_path, page), 'r') as f:
+                self.records.extend(json.loads(f.read())['results'])
+        self.people = [Person.from_dict(record) for record in self.records]
+
+    def test_from_dicts_columns(self):
+        table = PeopleTable.from_dicts(self.records)
+        self.assertEqual(len(table), 12)
+        self.assertEqual(table.columns['height'].typecode, 'l')
+        self.assertEqual(list(table.columns['films_count']), [person.films_count for person in self.people])
+        self.assertIs(table.columns['species'][0], table.columns['species'][3])
+        self.assertEqual(table[0].name, 'Luke Skywalker')
+        self.assertEqual(table[-1].name, self.people[-1].name)
+        self.assertEqual(repr(table[0]), '<Person - Luke Skywalker>')
+
+    def test_from_rows_keeps_missing_values(self):
+        table = PeopleTable.from_rows([Person(name='unknown_height', height='unknown', films=[], species=None)])
+        self.assertIsNone(table[0].height)
+        self.assertIsNone(table[0].species)
+        self.assertEqual(table.columns['height'][0], PeopleTable.NULL)
+
+    def test_query_set_over_table_matches_objects(self):
+        table_query_set = PeopleQuerySet(items=PeopleTable.from_dicts(self.records))
+        objects_query_set = PeopleQuerySet(items=self.people)
+        for query in (lambda qs: qs.order_by('films_count')[0:5].order_by('height'),
+                      lambda qs: qs.order_by('height', 'films_count', desc=False)[2:],
+                      lambda qs: qs.filter(height__gte=170, films_count__gt=2)[1:3],
+                      lambda qs: qs.filter(lambda person: 'a' in person.name).order_by('name')):
+            self.assertEqual([person.name for person in query(table_query_set)],
+                             [person.name for person in query(objects_query_set)])
+
+    def test_table_top_n_and_where(self):
+        table = PeopleTable.from_dicts(self.records)
+        self.assertEqual(table.top_n(3, ['films_count']), table.argsort(['films_count'])[:3])
+        self.assertEqual([table[index].name for index in table.where([('name', 'icontains', 'skywalker')])],
+                         ['Luke Skywalker', 'Anakin Skywalker'])
+
+    def test_where_matches_lookups(self):
+        table = PeopleTable.from_rows([Person(name=name, height=height, films=[1] * films, species=None)
+                                       for name, height, films in (('a', '0', 1), ('b', 'unknown', 2),
+                                                                   ('c', '170', 0), ('d', '66', 2))])
+        people = list(table)
+        for lookups in ([('height', 'gte', 0)], [('height', 'lt', 100)], [('height', 'ne', 66)],
+                        [('height', 'exact', -1)], [('height', 'isnull', True)], [('films_count', 'gt', 0)],
+                        [('name', 'exact', 'c')], [('name', 'ne', 'c'), ('height', 'lte', 66)],
+                        [('height', 'gte', 1.5)]):
+            expected = [index for index, person in enumerate(people)
+                        if all(LOOKUPS[lookup](getattr(person, column), value) for column, lookup, value in lookups)]
+            self.assertEqual(table.where(lookups), expected, lookups)
+        self.assertEqual(table.where([('height', 'isnull', False)], indexes=[3, 0]), [3, 0])
+
+    def test_plan_over_table_does_not_copy_rows(self):
+        table = PeopleTable.from_dicts(self.records)
+        query_set = PeopleQuerySet(items=table).order_by('height')
+        self.assertIsInstance(query_set.items, TableRows)
+        self.assertIs(query_set.items.table, table)
+        self.assertEqual([person.name for person in query_set[0:2]],
+                         [person.name for person in PeopleQuerySet(items=self.people).order_by('height')[0:2]])
+
+    def test_generic_extend_dicts(self):
+        class PlanetTable(ColumnTable):
+            numeric_columns = ('diameter',)
+            string_columns = ('name',)
+            _view_class = PersonView
+
+        table = PlanetTable.from_dicts([{'name': 'Tatooine', 'diameter': '10465'}, {'name': 'Hoth', 'diameter': 7200},
+                                        {'name': 'Yavin IV', 'diameter': 'unknown'}])
+        self.assertEqual([(row.name, row.diameter) for row in table],
+                         [('Tatooine', 10465), ('Hoth', 7200), ('Yavin IV', None)])
+
+    @patch('utils.Requester._Requester__get')
+    def test_get_all_columnar_and_resolve_foreign_keys(self, mock_get):
+        fixtures_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+        pages = []
+        for page in ('people_page_1.json', 'people_page_2.json'):
+            with open(os.path.join(fixtures_path, page), 'r') as f:
+                pages.append(json.loads(f.read()))
+        species = {'https://swapi.co/api/species/1/': {'name': 'Human'},
+                   'https://swapi.co/api/species/2/': {'name': 'Droid'}}
+        mock_get.side_effect = lambda url: species[url] if url in species else pages.pop(0)
+
+        top_3 = PeopleQuerySet(foreign_keys={'species': SpeciesQuerySet()}).get_all(columnar=True) \
+            .order_by('films_count')[0:3]
+        self.assertIsInstance(top_3._source, PeopleTable)
+        top_3.resolve_foreign_keys(strategy='urls')
+        self.assertEqual([person.name for person in top_3], ['R2-D2', 'C-3PO', 'Obi-Wan Kenobi'])
+        self.assertEqual(sorted(person.species for person in top_3), ['Droid', 'Droid', 'Human'])
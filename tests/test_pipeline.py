@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import threading
+from unittest import TestCase
+
+from mock import patch
+
+import config
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session
+from models import PeopleQuerySet, Person, Species, SpeciesQuerySet
+from pipeline import Pipeline, PipelineError
+from utils import MemoryCache, Requester
+
+
+class TestPipelineGraph(TestCase):
+    def test_stages_sorted_after_dependencies(self):
+        pipeline = Pipeline(config.PIPELINE)
+        order = pipeline.order
+        self.assertLess(order.index('people'), order.index('top_people'))
+        self.assertLess(order.index('species'), order.index('top_people_species'))
+        self.assertLess(order.index('top_people'), order.index('top_people_species'))
+        self.assertEqual(order[-1], 'csv')
+
+    def test_invalid_definitions(self):
+        with self.assertRaises(PipelineError):
+            Pipeline({'a': {'type': 'transform', 'input': 'b'}, 'b': {'type': 'transform', 'input': 'a'}})
+        with self.assertRaises(PipelineError):
+            Pipeline({'a': {'type': 'transform', 'input': 'missing'}})
+        with self.assertRaises(PipelineError):
+            Pipeline({'a': {'type': 'extract', 'resource': 'unknown'}})
+        with self.assertRaises(PipelineError):
+            Pipeline({'a': {'type': 'unknown'}})
+
+    def test_independent_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def get_all(query_set):
+            # Both extract stages have to be running at the same time to get through the barrier
+            barrier.wait()
+            return query_set.__class__(items=[])
+
+        with patch.object(PeopleQuerySet, 'get_all', get_all), patch.object(SpeciesQuerySet, 'get_all', get_all):
+            results = Pipeline({'people': {'type': 'extract', 'resource': 'people'},
+                                'species': {'type': 'extract', 'resource': 'species'}}).run()
+        self.assertEqual(sorted(results), ['people', 'species'])
+
+    def test_transform_and_join(self):
+        people = PeopleQuerySet(items=[
+            Person(name='Short', height='90', films=[1], species=['s1'], url='p1'),
+            Person(name='Tall', height='200', films=[1, 2, 3], species=['s2'], url='p2'),
+            Person(name='Unknown', height='unknown', films=[1, 2], species=[], url='p3'),
+        ])
+        species = SpeciesQuerySet(items=[Species(name='Human', url='s1'), Species(name='Droid', url='s2')])
+        with patch('pipeline.QUERY_SETS', {'people': lambda: people, 'species': lambda: species}), \
+                patch.object(PeopleQuerySet, 'get_all', lambda query_set: query_set), \
+                patch.object(SpeciesQuerySet, 'get_all', lambda query_set: query_set):
+            results = Pipeline({
+                'people': {'type': 'extract', 'resource': 'people'},
+                'species': {'type': 'extract', 'resource': 'species'},
+                'top': {'type': 'transform', 'input': 'people',
+                        'operations': [('filter', {'height__isnull': False}), ('order_by', 'height', {'desc': False}),
+                                       ('slice', 0, 2)]},
+                'joined': {'type': 'join', 'input': 'top', 'foreign_keys': {'species': 'species'}},
+            }).run()
+
+        self.assertEqual([(person.name, person.species) for person in results['joined']],
+                         [('Short', 'Human'), ('Tall', 'Droid')])
+        # The transform result keeps the urls
+        self.assertEqual([person.species for person in results['top']], ['s1', 's2'])
+
+
+class TestPipelineEndToEnd(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        close_session()
+
+    def test_default_pipeline(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            with patch('exporters.config.OUTPUT_DIR', output_dir):
+                with serve(dataset=StubDataset(people=40, species=5), page_size=10) as server:
+                    results = Pipeline().run()
+                    counters = server.counters()
+            with open(os.path.join(output_dir, 'output.csv')) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(output_dir)
+
+        self.assertEqual(results['csv'], os.path.join(output_dir, 'output.csv'))
+        self.assertEqual(lines[0], 'name,species,height,appearances')
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(all(line.split(',')[1].startswith('Species') or line.split(',')[1] == ''
+                            for line in lines[1:]))
+        # 4 pages of people, 1 page of species and the upload
+        self.assertEqual(counters['requests'], 4 + 1 + 1)
@@ -0,0 +1,92 @@
+import os
+import pstats
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+import config
+import main
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session
+from metrics import registry as metrics
+from profiling import Profiler, collapsed_stacks, profile
+from utils import MemoryCache, Requester
+
+
+def allocate(count):
+    return [str(index) * 10 for index in range(count)]
+
+
+class TestProfiler(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_nested_stages(self):
+        with profile(self.directory) as profiler:
+            with metrics.stage('outer'):
+                outer = allocate(20000)
+                with metrics.stage('inner'):
+                    inner = allocate(10000)
+        self.assertNotIn(profiler.stage, metrics.stage_listeners)
+        self.assertEqual(len(outer) + len(inner), 30000)
+
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['allocations.txt', 'inner.pstats', 'outer.pstats', 'stages.collapsed'])
+        # The inner stage is not part of the outer profile
+        outer_functions = {function[2] for function in pstats.Stats(os.path.join(self.directory,
+                                                                                 'outer.pstats')).stats}
+        inner_functions = {function[2] for function in pstats.Stats(os.path.join(self.directory,
+                                                                                 'inner.pstats')).stats}
+        self.assertIn('allocate', outer_functions)
+        self.assertIn('allocate', inner_functions)
+        self.assertNotIn('stage', inner_functions - outer_functions)
+
+        with open(os.path.join(self.directory, 'stages.collapsed')) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(all(line.split(';')[0] in ('inner', 'outer') and line.rsplit(' ', 1)[1].isdigit()
+                            for line in lines))
+        self.assertTrue(any('allocate (test_profiling.py' in line for line in lines))
+
+        with open(os.path.join(self.directory, 'allocations.txt')) as f:
+            allocations = f.read()
+        self.assertIn('inner: ', allocations)
+        self.assertIn('outer: ', allocations)
+        self.assertIn('test_profiling.py', allocations)
+
+    def test_collapsed_stacks_split_time_by_caller(self):
+        stats = Profiler(self.directory).stats
+        self.assertEqual(stats, {})
+        fake = type('Stats', (), {})()
+        root, child = ('a.py', 1, 'root'), ('a.py', 5, 'child')
+        fake.stats = {root: (1, 1, 0.001, 0.003, {}),
+                      child: (2, 2, 0.002, 0.002, {root: (2, 2, 0.002, 0.002)})}
+        self.assertEqual(collapsed_stacks(fake), [(['root (a.py:1)'], 1000),
+                                                  (['root (a.py:1)', 'child (a.py:5)'], 2000)])
+
+
+class TestProfileMain(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        close_session()
+        shutil.rmtree(self.directory)
+
+    def test_main_profiles_every_stage(self):
+        profile_directory = os.path.join(self.directory, 'profile')
+        with patch.multiple(config, OUTPUT_DIR=self.directory, PROFILE_DIR=profile_directory):
+            with serve(dataset=StubDataset(people=30, species=4), page_size=10):
+                main.main(profile=True)
+        reports = os.listdir(profile_directory)
+        for stage in ('fetch', 'serialize', 'query_plan', 'resolve_foreign_keys', 'csv_write', 'upload'):
+            self.assertIn('{}.pstats'.format(stage), reports)
+        self.assertEqual(metrics.stage_listeners, [])
@@ -0,0 +1,142 @@
+import asyncio
+import email.utils
+import threading
+import time
+from unittest import TestCase
+
+import requests_mock
+from mock import patch
+
+from http_session import RateLimitedSession
+from metrics import registry as metrics
+from ratelimit import AdaptiveConcurrency, HostLimiter, RateLimiter, TokenBucket, parse_retry_after
+
+
+class TestRetryAfter(TestCase):
+    def test_parse_retry_after(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+        self.assertEqual(parse_retry_after('3'), 3)
+        self.assertEqual(parse_retry_after('3600'), 60)
+        http_date = email.utils.formatdate(time.time() + 10, usegmt=True)
+        self.assertAlmostEqual(parse_retry_after(http_date), 10, delta=1.5)
+
+
+class TestTokenBucket(TestCase):
+    def test_unlimited(self):
+        bucket = TokenBucket()
+        self.assertEqual([bucket.acquire() for _ in range(100)], [0.0] * 100)
+
+    @patch('ratelimit.time.sleep')
+    def test_waits_when_empty(self, mock_sleep):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(bucket.acquire(), 0)
+        self.assertEqual(bucket.acquire(), 0)
+        mock_sleep.side_effect = lambda seconds: setattr(bucket, 'tokens', bucket.tokens + seconds * bucket.rate)
+        self.assertGreater(bucket.acquire(), 0)
+        self.assertLessEqual(mock_sleep.call_args[0][0], 0.1)
+
+
+class TestAdaptiveConcurrency(TestCase):
+    def test_additive_increase_multiplicative_decrease(self):
+        concurrency = AdaptiveConcurrency(initial=4, minimum=1, maximum=8)
+        started = [concurrency.acquire() for _ in range(4)]
+        self.assertEqual(concurrency.in_flight, 4)
+
+        concurrency.release(started[0], congested=False)
+        self.assertEqual(concurrency.limit, 4.25)
+        concurrency.release(started[1], congested=True)
+        self.assertEqual(concurrency.limit, 2.125)
+        # Requests started before the decrease do not decrease it again
+        concurrency.release(started[2], congested=True)
+        self.assertEqual(concurrency.limit, 2.125)
+        concurrency.release(concurrency.acquire(), congested=True)
+        self.assertEqual(concurrency.limit, 1.0625)
+        self.assertEqual(concurrency.in_flight, 1)
+
+    def test_coroutines_wait_for_a_free_slot(self):
+        async def request(concurrency, started):
+            started_at = await concurrency.aacquire()
+            started.append(concurrency.in_flight)
+            await asyncio.sleep(0)
+            concurrency.release(started_at, congested=False)
+
+        async def main():
+            concurrency = AdaptiveConcurrency(initial=2, maximum=2)
+            started = []
+            await asyncio.gather(*[request(concurrency, started) for _ in range(6)])
+            return concurrency, started
+
+        concurrency, started = asyncio.run(main())
+        self.assertEqual(len(started), 6)
+        self.assertLessEqual(max(started), 2)
+        self.assertEqual(concurrency.in_flight, 0)
+
+
+class TestHostLimiter(TestCase):
+    def test_throttled_and_slow_responses(self):
+        limiter = HostLimiter('swapi.test', max_concurrency=4, target_latency=1)
+        limiter.release(limiter.acquire(), status=200, latency=2)
+        self.assertEqual(limiter.concurrency.limit, 2)
+        limiter.release(limiter.acquire(), status=429, latency=0.1, retry_after=30)
+        self.assertEqual(limiter.concurrency.limit, 1)
+        self.assertGreater(limiter.blocked_until, time.monotonic() + 25)
+
+    def test_coroutine_acquire_waits_while_blocked(self):
+        limiter = HostLimiter('swapi.test', rate=1000, burst=1)
+        limiter.block(0.05)
+        start = time.monotonic()
+        limiter.release(asyncio.run(limiter.aacquire()))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+
+    def test_settings_per_host(self):
+        rate_limiter = RateLimiter(limits={'swapi.test': {'rate': 5, 'burst': 10}},
+                                   default={'rate': None, 'max_concurrency': 3})
+        self.assertIs(rate_limiter.for_host('swapi.test'), rate_limiter.for_host('swapi.test'))
+        self.assertEqual(rate_limiter.for_host('swapi.test').bucket.rate, 5)
+        self.assertEqual(rate_limiter.for_host('swapi.test').concurrency.maximum, 3)
+        self.assertIsNone(rate_limiter.for_host('other.test').bucket.rate)
+
+
+class TestRateLimitedSession(TestCase):
+    def setUp(self):
+        metrics.reset()
+
+    @requests_mock.Mocker()
+    def test_retries_throttled_get_after_retry_after(self, request_mock):
+        request_mock.get('http://swapi.test/people', [
+            {'status_code': 429, 'headers': {'Retry-After': '0'}, 'text': 'slow down'},
+            {'status_code': 503, 'text': 'unavailable'},
+            {'status_code': 200, 'text': 'ok'}])
+        with patch('http_session.config.HTTP_RETRY_BACKOFF_FACTOR', 0):
+            response = RateLimitedSession().get('http://swapi.test/people')
+        self.assertEqual(response.text, 'ok')
+        self.assertEqual(request_mock.call_count, 3)
+        self.assertEqual(metrics.total('http_throttled_total'), 2)
+
+    @requests_mock.Mocker()
+    def test_gives_up_after_retries_and_does_not_retry_posts(self, request_mock):
+        request_mock.get('http://swapi.test/people', status_code=429, headers={'Retry-After': '0'})
+        request_mock.post('http://swapi.test/post', status_code=429, headers={'Retry-After': '0'})
+        with patch('http_session.config.RATE_LIMIT_RETRIES', 2):
+            self.assertEqual(RateLimitedSession().get('http://swapi.test/people').status_code, 429)
+            self.assertEqual(request_mock.call_count, 3)
+            self.assertEqual(RateLimitedSession().post('http://swapi.test/post', data=b'x').status_code, 429)
+            self.assertEqual(request_mock.call_count, 4)
+
+    @requests_mock.Mocker()
+    def test_redirect_with_a_concurrency_limit_of_one(self, request_mock):
+        request_mock.get('http://swapi.test/api/people', status_code=301,
+                         headers={'Location': 'http://swapi.test/api/people/'})
+        request_mock.get('http://swapi.test/api/people/', text='ok')
+        session = RateLimitedSession(RateLimiter(limits={}, default={'max_concurrency': 1}))
+        responses = []
+        thread = threading.Thread(target=lambda: responses.append(session.get('http://swapi.test/api/people')),
+                                  daemon=True)
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(responses[0].text, 'ok')
+        self.assertEqual([response.status_code for response in responses[0].history], [301])
+        self.assertEqual(session.limiter.for_host('swapi.test').concurrency.in_flight, 0)
@@ -0,0 +1,64 @@
+import fnmatch
+import time
+from unittest import TestCase
+
+from mock import patch
+
+from redis_cache import RedisCache
+
+
+class DictClient:
+    """
+    Redis client stand-in keeping the values on a dictionary
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value.encode('utf-8')
+
+    def scan_iter(self, match):
+        return [key for key in list(self.values) if fnmatch.fnmatch(key, match)]
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+
+class TestRedisCache(TestCase):
+    def setUp(self):
+        self.client = DictClient()
+        self.cache = RedisCache(prefix='test:', ttl={'people': 60}, default_ttl=10, client=self.client)
+
+    def test_set_and_get_value(self):
+        self.cache.set('https://swapi.co/api/people/1/', {'name': 'Luke Skywalker'}, etag='"abc"')
+        self.assertEqual(self.cache.get('https://swapi.co/api/people/1/'), {'name': 'Luke Skywalker'})
+        self.assertEqual(self.cache.get_entry('https://swapi.co/api/people/1/').etag, '"abc"')
+        self.assertIn('test:https://swapi.co/api/people/1/', self.client.values)
+        self.assertIsNone(self.cache.get('https://swapi.co/api/people/2/'))
+
+    def test_expired_value_is_kept_for_revalidation(self):
+        self.cache.set('https://swapi.co/api/species/1/', {'name': 'Human'})
+        with patch('redis_cache.time.time', return_value=time.time() + 30):
+            self.assertIsNone(self.cache.get('https://swapi.co/api/species/1/'))
+            self.assertEqual(self.cache.get_entry('https://swapi.co/api/species/1/').value, {'name': 'Human'})
+            self.cache.touch('https://swapi.co/api/species/1/')
+            self.assertEqual(self.cache.get('https://swapi.co/api/species/1/'), {'name': 'Human'})
+
+    def test_lookup_returns_expired_entry(self):
+        self.cache.set('https://swapi.co/api/species/1/', {'name': 'Human'}, etag='"v1"')
+        self.assertEqual(self.cache.lookup('https://swapi.co/api/species/1/'), ({'name': 'Human'}, None))
+        with patch('redis_cache.time.time', return_value=time.time() + 30):
+            value, entry = self.cache.lookup('https://swapi.co/api/species/1/', 'missing')
+        self.assertEqual(value, 'missing')
+        self.assertEqual(entry.etag, '"v1"')
+        self.assertEqual(self.cache.lookup('https://swapi.co/api/species/2/'), (None, None))
+
+    def test_clear(self):
+        self.client.values['other:key'] = b'{}'
+        self.cache.set('https://swapi.co/api/people/1/', {'name': 'Luke Skywalker'})
+        self.cache.clear()
+        self.assertEqual(list(self.client.values), ['other:key'])
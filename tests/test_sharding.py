@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest import TestCase
+
+from mock import patch
+
+import config
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session
+from metrics import registry as metrics
+from models import PeopleQuerySet, SpeciesQuerySet
+from pipeline import Pipeline
+from sharding import ShardedExtractor, split, worker_settings
+from snapshot import dump, use_snapshot
+from utils import MemoryCache, Requester
+
+
+class TestSharding(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        close_session()
+        shutil.rmtree(self.directory)
+
+    def test_split(self):
+        self.assertEqual(split(['2', '3', '4', '5', '6'], 2), [['2', '3'], ['4', '5'], ['6']])
+        self.assertEqual(split([], 2), [])
+
+    def test_worker_settings_share_the_rate(self):
+        with patch('config.RATE_LIMIT_DEFAULT', {'rate': None, 'burst': 1, 'max_concurrency': 3}), \
+                patch('config.RATE_LIMITS', {'swapi.co': {'rate': 10, 'burst': 20}}), \
+                patch('config.HTTP_POOL_MAXSIZE', 3):
+            settings = worker_settings(4)
+        self.assertEqual(settings['RATE_LIMITS'], {'swapi.co': {'rate': 2.5, 'burst': 5}})
+        self.assertEqual(settings['RATE_LIMIT_DEFAULT'], {'rate': None, 'burst': 1, 'max_concurrency': 3})
+        self.assertEqual(settings['HTTP_POOL_MAXSIZE'], 3)
+        self.assertEqual(config.RATE_LIMITS['swapi.co']['rate'], 10)
+
+    def test_snapshot_extracts_without_workers(self):
+        path = os.path.join(self.directory, 'swapi.snapshot')
+        with serve(dataset=StubDataset(people=25, species=4), page_size=10):
+            dump(path)
+            expected = [person.as_dict() for person in PeopleQuerySet().get_all()]
+
+        with patch('http_session.RateLimitedSession.send') as send, use_snapshot(path), \
+                patch('sharding.get_executor') as get_executor:
+            people = ShardedExtractor(shard_pages=1).extract([config.PEOPLE])[config.PEOPLE]
+            self.assertFalse(get_executor.called)
+            self.assertFalse(send.called)
+        self.assertEqual([person.as_dict() for person in people], expected)
+
+    def test_extract_in_page_order(self):
+        with serve(dataset=StubDataset(people=45, species=12), page_size=10):
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                query_sets = ShardedExtractor(executor=executor, shard_pages=2, backend='memory').extract(
+                    [config.PEOPLE, config.SPECIES])
+            people = [person.as_dict() for person in PeopleQuerySet().get_all()]
+            species = [item.name for item in SpeciesQuerySet().get_all()]
+
+        self.assertIsInstance(query_sets[config.PEOPLE], PeopleQuerySet)
+        self.assertEqual([person.as_dict() for person in query_sets[config.PEOPLE]], people)
+        self.assertEqual([item.name for item in query_sets[config.SPECIES]], species)
+        self.assertEqual(len(people), 45)
+
+    def test_process_workers_share_the_cache(self):
+        sqlite_path = os.path.join(self.directory, 'cache.sqlite3')
+        context = multiprocessing.get_context('spawn')
+        with serve(dataset=StubDataset(people=45, species=4), page_size=10) as server, \
+                patch('config.CACHE_SQLITE_PATH', sqlite_path):
+            expected = [person.as_dict() for person in PeopleQuerySet().get_all()]
+            requests = server.counters()['requests']
+            http_requests = metrics.total('http_requests_total')
+
+            with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+                people = ShardedExtractor(executor=executor, shard_pages=2, backend='sqlite').extract(
+                    [config.PEOPLE])[config.PEOPLE]
+            self.assertEqual([person.as_dict() for person in people], expected)
+            # Pages 2-5 fetched by the workers, counted by the coordinator metrics
+            self.assertEqual(server.counters()['requests'], requests + 4)
+            self.assertEqual(metrics.total('http_requests_total'), http_requests + 4)
+            self.assertIs(Requester.get_identity_map().get(expected[-1]['url']), people[-1])
+
+            with ProcessPoolExecutor(max_workers=2, mp_context=context) as executor:
+                people = ShardedExtractor(executor=executor, shard_pages=3, backend='sqlite').extract(
+                    [config.PEOPLE])[config.PEOPLE]
+            self.assertEqual([person.as_dict() for person in people], expected)
+            self.assertEqual(server.counters()['requests'], requests + 4)
+
+    def test_sharded_pipeline_stage(self):
+        stages = {
+            'people': {'type': 'extract', 'resource': config.PEOPLE, 'sharded': True,
+                       'filter': {'height__gte': 150}},
+            'tallest': {'type': 'transform', 'input': 'people', 'operations': [('order_by', 'height')]},
+        }
+        with serve(dataset=StubDataset(people=30, species=4), page_size=10), \
+                ThreadPoolExecutor(max_workers=2) as executor, \
+                patch('sharding.get_executor', return_value=executor):
+            results = Pipeline(stages).run()
+            expected = PeopleQuerySet().get_all().filter(height__gte=150).order_by('height')
+            self.assertEqual([person.url for person in results['tallest']], [person.url for person in expected])
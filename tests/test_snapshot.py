@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+import config
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session
+from models import PeopleQuerySet, SpeciesQuerySet
+from snapshot import SnapshotCache, SnapshotFile, dump, run, use_snapshot
+from utils import MemoryCache, Requester
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'swapi.snapshot')
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        close_session()
+        shutil.rmtree(self.directory)
+
+    def test_dump_and_replay_without_network(self):
+        with serve(dataset=StubDataset(people=25, species=4), page_size=10) as server:
+            base_url = server.swapi_base_url
+            self.assertEqual(dump(self.path), 3 + 1 + 25 + 4)
+            online_people = [person.as_dict() for person in PeopleQuerySet().get_all()]
+
+        snapshot = SnapshotFile(self.path)
+        self.assertEqual(snapshot.base_url, base_url)
+        self.assertIn('{}/people/3/'.format(base_url), snapshot)
+        snapshot.close()
+
+        with patch('http_session.RateLimitedSession.send') as send, use_snapshot(self.path):
+            self.assertEqual(config.SWAPI_BASE_URL, base_url)
+            self.assertEqual([person.as_dict() for person in PeopleQuerySet().get_all()], online_people)
+            species = SpeciesQuerySet().get_by_url('{}/species/2/'.format(base_url))
+            self.assertEqual(species.name, 'Species 2')
+            with self.assertRaises(SnapshotCache.SnapshotMiss):
+                SpeciesQuerySet().get_by_url('{}/species/99/'.format(base_url))
+            self.assertFalse(send.called)
+        self.assertNotEqual(config.SWAPI_BASE_URL, base_url)
+
+    def test_run_pipeline_from_snapshot(self):
+        with serve(dataset=StubDataset(people=25, species=4), page_size=10):
+            dump(self.path)
+
+        with patch('http_session.RateLimitedSession.send') as send, \
+                patch('exporters.config.OUTPUT_DIR', self.directory):
+            results = run(self.path)
+            self.assertFalse(send.called)
+        with open(results['csv']) as f:
+            self.assertEqual(len(f.read().splitlines()), 11)
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot file at all')
+        with self.assertRaises(SnapshotFile.InvalidSnapshot):
+            SnapshotFile(self.path)
+        open(self.path, 'wb').close()
+        with self.assertRaises(SnapshotFile.InvalidSnapshot):
+            SnapshotFile(self.path)
@@ -0,0 +1,92 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import requests_mock
+from mock import patch
+
+from sqlite_cache import SQLiteCache, conditional_headers
+from utils import Requester
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cache.sqlite3')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_set_and_get_value(self):
+        cache = SQLiteCache(path=self.path, ttl={}, default_ttl=60)
+        cache.set(key='https://swapi.co/api/people/1/', value={'name': 'Luke Skywalker'})
+        self.assertEqual(cache.get('https://swapi.co/api/people/1/'), {'name': 'Luke Skywalker'})
+        self.assertEqual(cache.get('https://swapi.co/api/people/2/', default='default_value'), 'default_value')
+        self.assertIsNone(cache.get('https://swapi.co/api/people/2/'))
+
+    def test_set_many(self):
+        cache = SQLiteCache(path=self.path, ttl={}, default_ttl=60)
+        cache.set_many([('https://swapi.co/api/people/1/', {'name': 'Luke Skywalker'}),
+                        ('https://swapi.co/api/people/2/', {'name': 'C-3PO'})])
+        self.assertEqual(cache.get('https://swapi.co/api/people/1/'), {'name': 'Luke Skywalker'})
+        self.assertEqual(cache.get('https://swapi.co/api/people/2/'), {'name': 'C-3PO'})
+
+    def test_values_persist_between_instances(self):
+        SQLiteCache(path=self.path, ttl={}, default_ttl=60).set(key='http://fake_url', value=[1, 2])
+        self.assertEqual(SQLiteCache(path=self.path, ttl={}, default_ttl=60).get('http://fake_url'), [1, 2])
+
+    def test_expired_value_is_kept_for_revalidation(self):
+        cache = SQLiteCache(path=self.path, ttl={'people': 0}, default_ttl=60)
+        cache.set(key='https://swapi.co/api/people/?page=2', value={'count': 1}, etag='"abc"',
+                  last_modified='Wed, 21 Oct 2015 07:28:00 GMT')
+        self.assertIsNone(cache.get('https://swapi.co/api/people/?page=2'))
+
+        entry = cache.get_entry('https://swapi.co/api/people/?page=2')
+        self.assertEqual(entry.value, {'count': 1})
+        self.assertEqual(conditional_headers(entry), {'If-None-Match': '"abc"',
+                                                      'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+        self.assertEqual(conditional_headers(None), {})
+
+    def test_ttl_for_endpoint(self):
+        cache = SQLiteCache(path=self.path, ttl={'people': 10, 'species': 20}, default_ttl=30)
+        self.assertEqual(cache.ttl_for('https://swapi.co/api/people/?page=2'), 10)
+        self.assertEqual(cache.ttl_for('https://swapi.co/api/species/1/'), 20)
+        self.assertEqual(cache.ttl_for('https://swapi.co/api/planets/1/'), 30)
+
+
+class TestRequesterRevalidation(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(SQLiteCache(path=os.path.join(self.directory, 'cache.sqlite3'), ttl={}, default_ttl=0))
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        shutil.rmtree(self.directory)
+
+    @requests_mock.mock()
+    def test_expired_entry_not_modified(self, request_mock):
+        request_mock.get('http://fake_url/resource', [
+            {'text': json.dumps({'name': 'value'}), 'headers': {'ETag': '"v1"'}},
+            {'status_code': 304},
+        ])
+        requester = Requester()
+        self.assertEqual(requester._Requester__get('http://fake_url/resource'), {'name': 'value'})
+        self.assertEqual(requester._Requester__get('http://fake_url/resource'), {'name': 'value'})
+
+        self.assertEqual(request_mock.call_count, 2)
+        self.assertNotIn('If-None-Match', request_mock.request_history[0].headers)
+        self.assertEqual(request_mock.request_history[1].headers['If-None-Match'], '"v1"')
+
+    @requests_mock.mock()
+    def test_expired_entry_read_once(self, request_mock):
+        request_mock.get('http://fake_url/resource', text=json.dumps({'name': 'value'}), headers={'ETag': '"v1"'})
+        requester = Requester()
+        requester._Requester__get('http://fake_url/resource')
+        cache = Requester.get_cache()
+        with patch.object(cache, 'get_entry', wraps=cache.get_entry) as get_entry:
+            requester._Requester__get('http://fake_url/resource')
+        self.assertEqual(get_entry.call_count, 1)
+        self.assertEqual(request_mock.request_history[1].headers['If-None-Match'], '"v1"')
@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+import config
+import main
+from benchmarks.run import compare
+from benchmarks.stub_server import StubDataset, serve
+from http_session import close_session, get_session
+from models import PeopleQuerySet
+from utils import MemoryCache, Requester
+
+
+class TestStubServer(TestCase):
+    def setUp(self):
+        self.previous_cache = Requester.get_cache()
+        Requester.set_cache(MemoryCache())
+        close_session()
+
+    def tearDown(self):
+        Requester.set_cache(self.previous_cache)
+        close_session()
+
+    def test_pages_search_and_objects(self):
+        with serve(dataset=StubDataset(people=25, species=3), page_size=10) as server:
+            first_page = get_session().get('{}/people'.format(config.SWAPI_BASE_URL)).json()
+            self.assertEqual(first_page['count'], 25)
+            self.assertEqual(len(first_page['results']), 10)
+            self.assertEqual(first_page['next'], '{}/people/?page=2'.format(server.swapi_base_url))
+
+            search_page = get_session().get('{}/people/?search=person 2'.format(config.SWAPI_BASE_URL)).json()
+            self.assertEqual(search_page['count'], 7)
+
+            species = get_session().get('{}/species/3/'.format(config.SWAPI_BASE_URL))
+            self.assertEqual(species.json()['name'], 'Species 3')
+            not_modified = get_session().get('{}/species/3/'.format(config.SWAPI_BASE_URL),
+                                             headers={'If-None-Match': species.headers['ETag']})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(server.counters()['requests'], 4)
+
+    def test_get_all_retries_server_errors(self):
+        with patch('http_session.config.HTTP_RETRY_BACKOFF_FACTOR', 0):
+            close_session()
+            with serve(dataset=StubDataset(people=45), page_size=10, error_rate=0.3, seed=1) as server:
+                people = PeopleQuerySet().get_all()
+                self.assertEqual([person.name for person in people],
+                                 ['Person {}'.format(index) for index in range(1, 46)])
+                self.assertGreater(server.counters()['requests'], 5)
+
+    def test_main_end_to_end(self):
+        output_dir = tempfile.mkdtemp()
+        try:
+            with patch('csv_handler.config.OUTPUT_DIR', output_dir):
+                with serve(dataset=StubDataset(people=40, species=5), page_size=10) as server:
+                    main.main()
+                    counters = server.counters()
+            with open(os.path.join(output_dir, 'output.csv')) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(output_dir)
+
+        self.assertEqual(lines[0], 'name,species,height,appearances')
+        self.assertEqual(len(lines), 11)
+        self.assertTrue(all(line.split(',')[1].startswith('Species') or line.split(',')[1] == 'None'
+                            for line in lines[1:]))
+        # 4 pages of people, at most 5 species and the upload
+        self.assertLessEqual(counters['requests'], 4 + 5 + 1)
+        self.assertGreater(counters['bytes_received'], 0)
+
+
+class TestBenchmarkCompare(TestCase):
+    def test_compare_with_baseline(self):
+        baseline = {'main': {'wall_time': 1.0, 'requests': 10, 'peak_memory': 1000, 'bytes': 1}}
+        self.assertEqual(compare({'main': {'wall_time': 1.2, 'requests': 10, 'peak_memory': 1100, 'bytes': 1}},
+                                 baseline, time_tolerance=0.5, memory_tolerance=0.25), [])
+        regressions = compare({'main': {'wall_time': 2.0, 'requests': 11, 'peak_memory': 2000, 'bytes': 1}},
+                              baseline, time_tolerance=0.5, memory_tolerance=0.25)
+        self.assertEqual(len(regressions), 3)
+
+    def test_compare_memory_slack(self):
+        baseline = {'queryset_top_n': {'wall_time': 0.001, 'requests': 0, 'peak_memory': 2124, 'bytes': 0}}
+        results = {'queryset_top_n': {'wall_time': 0.001, 'requests': 0, 'peak_memory': 3564, 'bytes': 0}}
+        self.assertEqual(len(compare(results, baseline, time_tolerance=0.5, memory_tolerance=0.25)), 1)
+        self.assertEqual(compare(results, baseline, time_tolerance=0.5, memory_tolerance=0.25, memory_slack=4096), [])
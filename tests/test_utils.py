@@ -1,9 +1,39 @@
 import json
+import time
 from unittest import TestCase
 
+import requests
 import requests_mock
+from mock import patch
 
-from utils import MemoryCache, Requester
+import config
+from models import Person, Species
+from utils import IdentityMap, MemoryCache, Requester
+
+
+class TestIdentityMap(TestCase):
+    def test_weak_references_by_url(self):
+        identity_map = IdentityMap()
+        species = Species(name='Human', url='https://myfakeurl/species/1')
+        identity_map.add([species, Species(name='No url')])
+        self.assertIs(identity_map.get('https://myfakeurl/species/1'), species)
+        self.assertIs(identity_map.get('https://myfakeurl/species/1', Species), species)
+        self.assertIsNone(identity_map.get('https://myfakeurl/species/1', Person))
+        self.assertEqual(len(identity_map), 1)
+
+        del species
+        self.assertIsNone(identity_map.get('https://myfakeurl/species/1'))
+        self.assertEqual(len(identity_map), 0)
+
+    def test_max_age(self):
+        identity_map = IdentityMap()
+        species = Species(name='Human', url='https://myfakeurl/species/1')
+        identity_map.add([species])
+        self.assertIs(identity_map.get('https://myfakeurl/species/1', max_age=60), species)
+        self.assertIsNone(identity_map.get('https://myfakeurl/species/1', max_age=0))
+        with patch('utils.time.monotonic', return_value=time.monotonic() + 120):
+            self.assertIsNone(identity_map.get('https://myfakeurl/species/1', max_age=60))
+            self.assertIs(identity_map.get('https://myfakeurl/species/1'), species)
 
 
 class TestMemoryCache(TestCase):
@@ -17,6 +47,67 @@ class TestMemoryCache(TestCase):
         read_default_value = cache.get(key='invalid_key')
         self.assertIsNone(read_default_value)
 
+    def test_evicts_least_recently_used_entries(self):
+        cache = MemoryCache(max_entries=2)
+        cache.set(key='key1', value='value1')
+        cache.set(key='key2', value='value2')
+        cache.get(key='key1')
+        cache.set(key='key3', value='value3')
+        self.assertEqual(cache.get(key='key1'), 'value1')
+        self.assertIsNone(cache.get(key='key2'))
+        self.assertEqual(cache.get(key='key3'), 'value3')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_evicts_entries_above_max_bytes(self):
+        cache = MemoryCache(max_bytes=100)
+        cache.set(key='key1', value='value1', size=60)
+        cache.set(key='key2', value='value2', size=60)
+        self.assertIsNone(cache.get(key='key1'))
+        self.assertEqual(cache.get(key='key2'), 'value2')
+        self.assertEqual(cache.stats()['bytes'], 60)
+
+    def test_expired_entries(self):
+        cache = MemoryCache(ttl=60)
+        cache.set(key='key1', value='value1', ttl=0)
+        cache.set(key='key2', value='value2')
+        self.assertIsNone(cache.get(key='key1'))
+        self.assertEqual(cache.get(key='key2'), 'value2')
+        self.assertEqual(len(cache), 1)
+
+    def test_shared_entries_are_not_counted(self):
+        cache = MemoryCache(max_entries=2, max_bytes=100)
+        cache.set(key='page1', value=['record1', 'record2'], size=60)
+        cache.set_many([('record1', 'record1'), ('record2', 'record2')], shared_with='page1')
+        self.assertEqual(cache.stats()['bytes'], 60)
+        cache.set(key='other', value='other', size=10)
+        self.assertEqual(cache.get(key='record2'), 'record2')
+        self.assertEqual(cache.stats()['evictions'], 0)
+
+        # The records go away with their page
+        cache.set(key='page2', value=['record3'], size=60)
+        self.assertIsNone(cache.get(key='page1'))
+        self.assertIsNone(cache.get(key='record1'))
+        self.assertIsNone(cache.get(key='record2'))
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats()['bytes'], 70)
+
+    def test_shared_entry_stored_on_its_own(self):
+        cache = MemoryCache()
+        cache.set(key='page1', value=['record1'], size=10)
+        cache.set_many([('record1', 'record1')], shared_with='page1')
+        cache.set(key='record1', value='record1', size=5)
+        cache.set(key='page1', value=[], size=10)
+        self.assertEqual(cache.get(key='record1'), 'record1')
+        self.assertEqual(cache.stats()['bytes'], 15)
+
+    def test_stats_count_falsy_values_as_hits(self):
+        cache = MemoryCache()
+        cache.set(key='empty', value={})
+        self.assertEqual(cache.get(key='empty', default='default_value'), {})
+        cache.get(key='invalid_key')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'evictions': 0, 'entries': 1,
+                                         'bytes': cache.stats()['bytes']})
+
 
 class TestRequester(TestCase):
 
@@ -27,8 +118,127 @@ class TestRequester(TestCase):
         result = requester._Requester__get('http://fake_url')
         self.assertEqual(result, {'data_request': 'value_request'})
 
+    @requests_mock.mock()
+    def test_private_get_error_response_not_cached(self, request_mock):
+        request_mock.get('http://fake_url404', status_code=404, text=json.dumps({'detail': 'Not found'}))
+        requester = Requester()
+        with self.assertRaises(requests.HTTPError):
+            requester._Requester__get('http://fake_url404')
+        self.assertIsNone(requester.get_cache().get('http://fake_url404'))
+
+    @requests_mock.mock()
+    @patch('config.RATE_LIMIT_RETRIES', 0)
+    def test_private_get_raises_once_retries_run_out(self, request_mock):
+        request_mock.get('http://fake_url429', status_code=429, text='slow down')
+        request_mock.get('http://fake_url302', status_code=302, text='moved')
+        requester = Requester()
+        with self.assertRaises(requests.HTTPError):
+            requester._Requester__get('http://fake_url429')
+        with self.assertRaises(requests.HTTPError) as context:
+            requester._Requester__get('http://fake_url302')
+        self.assertEqual(context.exception.response.status_code, 302)
+
     def test_private_get_cache_hit(self):
         requester = Requester()
         requester._Requester__cache.set(key='http://fake_url2', value='cache_data')
         result = requester._Requester__get('http://fake_url2')
         self.assertEqual(result, 'cache_data')
+
+    @requests_mock.mock()
+    def test_private_get_cache_hit_empty_response(self, request_mock):
+        requester = Requester()
+        requester._Requester__cache.set(key='http://fake_url3', value={})
+        self.assertEqual(requester._Requester__get('http://fake_url3'), {})
+        self.assertEqual(request_mock.call_count, 0)
+
+    def test_page_urls(self):
+        requester = Requester()
+        first_page = {'count': 25, 'next': 'https://swapi.co/api/people/?page=2', 'results': [{}] * 10}
+        self.assertEqual(requester._page_urls(first_page), ['https://swapi.co/api/people/?page=2',
+                                                             'https://swapi.co/api/people/?page=3'])
+
+    def test_page_urls_without_next_or_count(self):
+        requester = Requester()
+        self.assertEqual(requester._page_urls({'count': 5, 'next': None, 'results': [{}] * 5}), [])
+        self.assertEqual(requester._page_urls({'next': 'https://swapi.co/api/people/?page=2', 'results': [{}]}), [])
+
+    @requests_mock.mock()
+    def test_get_all_concurrent_keeps_page_order(self, request_mock):
+        class DummyModel:
+            @classmethod
+            def from_dict(cls, dict):
+                return dict['name']
+
+        class DummyRequester(Requester):
+            endpoint = 'concurrent_dummy'
+            _klass = DummyModel
+
+        base_url = '{}/{}'.format(config.SWAPI_BASE_URL, DummyRequester.endpoint)
+        request_mock.get(base_url, text=json.dumps(
+            {'count': 5, 'next': base_url + '/?page=2', 'results': [{'name': 'a'}, {'name': 'b'}]}))
+        request_mock.get(base_url + '/?page=2', text=json.dumps({'count': 5, 'results': [{'name': 'c'}, {'name': 'd'}]}))
+        request_mock.get(base_url + '/?page=3', text=json.dumps({'count': 5, 'results': [{'name': 'e'}]}))
+
+        self.assertEqual(DummyRequester().get_all(concurrent=True), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(request_mock.call_count, 3)
+
+    @requests_mock.mock()
+    def test_get_all_sequential_follows_next_links(self, request_mock):
+        class DummyModel:
+            @classmethod
+            def from_dict(cls, dict):
+                return dict['name']
+
+        class DummyRequester(Requester):
+            endpoint = 'sequential_dummy'
+            _klass = DummyModel
+
+        base_url = '{}/{}'.format(config.SWAPI_BASE_URL, DummyRequester.endpoint)
+        request_mock.get(base_url, text=json.dumps(
+            {'count': 3, 'next': base_url + '/?page=2', 'results': [{'name': 'a'}, {'name': 'b'}]}))
+        request_mock.get(base_url + '/?page=2', text=json.dumps({'count': 3, 'next': None, 'results': [{'name': 'c'}]}))
+
+        self.assertEqual(DummyRequester().get_all(concurrent=False), ['a', 'b', 'c'])
+        self.assertEqual(request_mock.call_count, 2)
+
+    def test_page_urls_keep_search(self):
+        requester = Requester()
+        first_page = {'count': 15, 'next': 'https://swapi.co/api/people/?search=a&page=2', 'results': [{}] * 10}
+        self.assertEqual(requester._page_urls(first_page), ['https://swapi.co/api/people/?search=a&page=2'])
+
+    @patch('utils.Requester._Requester__get')
+    def test_iter_pages_and_items(self, mock_get):
+        class DummyModel:
+            @classmethod
+            def from_dict(cls, dict):
+                return dict['name']
+
+        class DummyRequester(Requester):
+            endpoint = 'dummy'
+            _klass = DummyModel
+
+        mock_get.side_effect = lambda url: {
+            '{}/dummy'.format(config.SWAPI_BASE_URL): {'count': 3, 'next': 'http://dummy/?page=2',
+                                                         'results': [{'name': 'a'}, {'name': 'b'}]},
+            'http://dummy/?page=2': {'count': 3, 'next': None, 'results': [{'name': 'c'}]},
+        }[url]
+
+        self.assertEqual(list(DummyRequester().iter_pages()), [['a', 'b'], ['c']])
+        self.assertEqual(list(DummyRequester().iter_items(concurrent=False)), ['a', 'b', 'c'])
+
+    @patch('utils.config.REQUESTER_MAX_WORKERS', 2)
+    @patch('utils.Requester._Requester__get')
+    def test_iter_raw_pages_keeps_a_bounded_number_of_pages_in_flight(self, mock_get):
+        class DummyRequester(Requester):
+            endpoint = 'dummy'
+
+        first_page = {'count': 10, 'next': 'http://dummy/?page=2', 'results': [{}, {}]}
+        mock_get.side_effect = lambda url: first_page if url.endswith('dummy') else {'results': [{}, {}], 'url': url}
+
+        pages = DummyRequester().iter_raw_pages(concurrent=True)
+        self.assertIs(next(pages), first_page)
+        self.assertEqual(next(pages)['url'], 'http://dummy/?page=2')
+        self.assertLessEqual(mock_get.call_count, 4)
+        self.assertEqual([page['url'] for page in pages], ['http://dummy/?page=3', 'http://dummy/?page=4',
+                                                            'http://dummy/?page=5'])
+        self.assertEqual(mock_get.call_count, 5)
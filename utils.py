@@ -1,48 +1,337 @@
+import itertools
 import logging
-
-import requests
+import math
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
 
 import config
+from json_codec import loads
+from metrics import registry as metrics
+from sqlite_cache import SQLiteCache, conditional_headers
+
+# Sentinel returned by the caches on a miss, so empty / falsy responses are still cache hits
+MISSING = object()
+
+
+def approximate_size(value):
+    """
+    Approximate size in bytes of a decoded JSON value (dicts, lists and scalars)
+    :param value: value
+    :return: size in bytes
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sys.getsizeof(key) + approximate_size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += approximate_size(item)
+    return size
 
 
 class MemoryCache:
     """
-    Memory cache to store key values
-    TODO: Expire values based on TTL (time to live)
+    Memory cache to store key values, bounded by number of entries and approximate size in bytes.
+    Least recently used entries are evicted first and every entry can expire based on its TTL (time to live).
     """
 
-    def __init__(self):
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        """
+        :param max_entries: maximum number of entries [Default: config.MEMORY_CACHE_MAX_ENTRIES]
+        :param max_bytes: maximum approximate size of the values in bytes [Default: config.MEMORY_CACHE_MAX_BYTES]
+        :param ttl: default time to live of the entries in seconds, None to never expire
+                    [Default: config.MEMORY_CACHE_TTL]
+        """
         self.log = logging.getLogger(self.__class__.__name__)
-        self.cache = {}
+        self.max_entries = max_entries or config.MEMORY_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or config.MEMORY_CACHE_MAX_BYTES
+        self.ttl = ttl if ttl is not None else config.MEMORY_CACHE_TTL
+        self.cache = OrderedDict()  # key -> (value, expires_at, size), least recently used first
+        self.size = 0
+        # Entries sharing their value with another entry (records of a collection page): key -> key of the owner,
+        # and owner key -> keys of its shared entries
+        self.shared = {}
+        self.shared_keys = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
 
-    def set(self, key, value):
+    def set(self, key, value, etag=None, last_modified=None, ttl=None, size=None):
         """
         Store a value inside the cache
 
         :param key: key where the value should be stored
         :param value: value to be stored
+        :param etag: ETag of the response (not used, expired entries are not revalidated in memory)
+        :param last_modified: Last-Modified of the response (not used, expired entries are not revalidated in memory)
+        :param ttl: time to live of this entry in seconds [Default: self.ttl]
+        :param size: size of the value in bytes [Default: approximate_size(value)]
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        size = approximate_size(value) if size is None else size
+        with self.lock:
+            previous = self.cache.pop(key, None)
+            if previous is not None:
+                self._forget(key, previous)
+            self.cache[key] = (value, expires_at, size)
+            self.size += size
+            while self.cache and (self._counted_entries() > self.max_entries or self.size > self.max_bytes):
+                self._forget(*self.cache.popitem(last=False))
+                self.evictions += 1
+
+    def set_many(self, entries, shared_with=None):
+        """
+        Store several values inside the cache
+
+        :param entries: list of tuples (key, value)
+        :param shared_with: key of the entry already holding the values (the collection page of the records), the
+                            entries are not counted again in the size / entries limits and go away with it
+        """
+        if shared_with is None:
+            for key, value in entries:
+                self.set(key=key, value=value)
+            return
+        with self.lock:
+            owner = self.cache.get(shared_with)
+            if owner is None:
+                return
+            shared_keys = self.shared_keys.setdefault(shared_with, [])
+            for key, value in entries:
+                previous = self.cache.pop(key, None)
+                if previous is not None:
+                    self._forget(key, previous)
+                self.cache[key] = (value, owner[1], 0)
+                self.shared[key] = shared_with
+                shared_keys.append(key)
+
+    def _counted_entries(self):
+        return len(self.cache) - len(self.shared)
+
+    def _forget(self, key, entry):
         """
-        self.cache[key] = value
+        Bookkeeping of an entry removed from the cache, the entries sharing its value are removed with it
+        """
+        self.size -= entry[2]
+        if self.shared.pop(key, None) is not None:
+            return
+        for shared_key in self.shared_keys.pop(key, ()):
+            if self.shared.get(shared_key) == key:
+                del self.shared[shared_key]
+                del self.cache[shared_key]
 
     def get(self, key, default=None):
         """
         Get a value from the cache
         :param key: key where the value should be present
-        :param default: default value to return in case value not present
+        :param default: default value to return in case value not present or expired
         :return: value / default value if key not present on cache
         """
-        value = self.cache.get(key, default)
-        if value and value != default:
-            self.log.debug("Cache hit for url: %s", key)
-        else:
-            self.log.debug("Cache miss for url: %s", key)
-        return value
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self.cache[key]
+                self._forget(key, entry)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.cache.move_to_end(key)
+            self.hits += 1
+        return entry[0]
+
+    def get_entry(self, key):
+        """
+        Expired entries are dropped from memory, so there is nothing to revalidate
+        """
+        return None
+
+    def touch(self, key):
+        pass
+
+    def stats(self):
+        """
+        Counters of the cache
+        :return: dictionary with hits, misses, evictions, entries and bytes
+        """
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.cache), 'bytes': self.size}
+
+    def __len__(self):
+        return len(self.cache)
+
+
+class IdentityMap:
+    """
+    Objects deserialized by the requesters keyed by their url, so an object already loaded by a collection page is
+    not requested again on its own. Objects are held with weak references: the map never keeps alive objects
+    nobody else uses, so streaming a collection does not accumulate it in memory. Objects are shared, they are only
+    handed out to read them (foreign key names), never to callers that may change them.
+    """
+
+    def __init__(self):
+        self.objects = weakref.WeakValueDictionary()
+        self.loaded_at = {}  # url -> time.monotonic() the object was registered
+        self.lock = threading.Lock()
+
+    def add(self, items):
+        """
+        Register objects with an url attribute
+        :param items: iterable of objects
+        """
+        now = time.monotonic()
+        with self.lock:
+            for item in items:
+                url = getattr(item, 'url', None)
+                if url:
+                    self.objects[url] = item
+                    self.loaded_at[url] = now
+            if len(self.loaded_at) > 2 * len(self.objects) + 1024:
+                self.loaded_at = {url: self.loaded_at[url] for url in list(self.objects.keys())}
+
+    def get(self, url, klass=None, max_age=None):
+        """
+        Get a loaded object
+        :param url: object url
+        :param klass: only return the object when it is an instance of klass
+        :param max_age: only return the object when it was loaded less than max_age seconds ago, None for any age
+        :return: object / None if not loaded
+        """
+        item = self.objects.get(url)
+        if item is None or (klass is not None and not isinstance(item, klass)):
+            return None
+        if max_age is not None and time.monotonic() - self.loaded_at.get(url, float('-inf')) >= max_age:
+            return None
+        return item
+
+    def clear(self):
+        with self.lock:
+            self.objects.clear()
+            self.loaded_at.clear()
+
+    def __len__(self):
+        return len(self.objects)
+
+
+def build_cache(backend=None):
+    """
+    Build the cache backend used by the requesters
+    :param backend: 'memory' / 'sqlite' / 'redis' [Default: config.CACHE_BACKEND]
+    :return: cache object
+    """
+    backend = backend or config.CACHE_BACKEND
+    if backend == 'memory':
+        return MemoryCache()
+    if backend == 'sqlite':
+        return SQLiteCache()
+    if backend == 'redis':
+        from redis_cache import RedisCache
+        return RedisCache()
+    raise ValueError('Unknown cache backend: {}'.format(backend))
 
 
 class Requester:
-    __cache = MemoryCache()
+    __cache = build_cache()
+    __identity_map = IdentityMap()
     log = logging.getLogger("Requester")
 
+    @classmethod
+    def get_identity_map(cls):
+        """
+        Identity map shared by every requester, filled every time objects are deserialized
+        """
+        return Requester.__identity_map
+
+    @classmethod
+    def get_cache(cls):
+        """
+        Cache shared by every requester (blocking and asyncio ones)
+        """
+        return Requester.__cache
+
+    @classmethod
+    def set_cache(cls, cache):
+        """
+        Replace the cache shared by every requester
+        :param cache: cache object implementing get / set
+        """
+        Requester.__cache = cache
+
+    def _cache_lookup(self, url):
+        """
+        Cache side of a get request, shared by the blocking and the asyncio transports
+        :param url: url
+        :return: tuple (cached content / MISSING, stale entry to revalidate with a conditional GET / None)
+        """
+        lookup = getattr(self.__cache, 'lookup', None)
+        if lookup is not None:
+            # Persistent caches read the entry once, the expired one comes back to be revalidated
+            result, stale_entry = lookup(url, MISSING)
+        else:
+            result, stale_entry = self.__cache.get(url, MISSING), None
+        if result is not MISSING:
+            metrics.inc('cache_hits_total')
+            return result, None
+        metrics.inc('cache_misses_total')
+        # Expired entries of persistent caches are revalidated with a conditional GET
+        if lookup is None:
+            stale_entry = self.__cache.get_entry(url)
+        return MISSING, stale_entry
+
+    def _handle_response(self, url, stale_entry, status, headers, body, duration, raise_for_status):
+        """
+        Response side of a get request, shared by the blocking and the asyncio transports: metrics, revalidation of
+        the stale entry, decoding and cache update. Anything but a 2xx / 304 (404 {"detail": "Not found"}, the 503 /
+        429 left once the retries ran out, an unexpected 3xx...) is never cached nor decoded
+
+        :param url: url
+        :param stale_entry: entry returned by _cache_lookup
+        :param status: response status code
+        :param headers: response headers
+        :param body: response body (bytes)
+        :param duration: response time in seconds
+        :param raise_for_status: callable raising the HTTP error of the transport for the response
+        :return: content of the url
+        """
+        metrics.observe('http_request_duration_seconds', duration, method='GET')
+        metrics.inc('http_requests_total', method='GET', status=status)
+        metrics.inc('http_received_bytes_total', len(body), method='GET')
+        if status == 304 and stale_entry is not None:
+            self.__cache.touch(url)
+            return stale_entry.value
+        if not 200 <= status < 300:
+            raise_for_status()
+        result = loads(body)
+        self.__cache.set(key=url, value=result, etag=headers.get('ETag'), last_modified=headers.get('Last-Modified'))
+        self._seed_objects(url, result)
+        return result
+
+    def _seed_objects(self, url, page):
+        """
+        Store every record of a collection page under its own url as well, so get_by_url (foreign keys for example)
+        is served from the cache once the collection was fetched, even when the deserialized objects are gone from the
+        identity map
+        :param url: url of the page
+        :param page: content of the url
+        """
+        if not isinstance(page, dict) or not isinstance(page.get('results'), list):
+            return
+        entries = [(record['url'], record) for record in page['results']
+                   if isinstance(record, dict) and record.get('url')]
+        set_many = getattr(self.__cache, 'set_many', None)
+        if set_many is not None:
+            set_many(entries, shared_with=url)
+        else:
+            for key, value in entries:
+                self.__cache.set(key=key, value=value)
+
     def __get(self, url):
         """
         Function to make a get requests checking first on the cache
@@ -50,47 +339,181 @@ class Requester:
         :param url: url
         :return: content stored on the cache or content of the url in case of cache miss
         """
-        # First check if thats on the cache (in memory so far)
-        if self.__cache.get(url):
-            result = self.__cache.get(url)
-        else:
-            result = requests.get(url).json()
-            self.__cache.set(key=url, value=result)
-        return result
+        result, stale_entry = self._cache_lookup(url)
+        if result is not MISSING:
+            return result
+        # requests is only imported by runs that go to the network
+        from http_session import get_session, raise_for_status
+        start = time.perf_counter()
+        response = get_session().get(url, headers=conditional_headers(stale_entry))
+        return self._handle_response(url, stale_entry, response.status_code, response.headers, response.content,
+                                     time.perf_counter() - start, lambda: raise_for_status(response))
 
     def serialize(self, items):
         """
         Serialize items based on attribute _klass
         :param items: list of items to be serialized
         """
+        with metrics.stage('serialize'):
+            return self._serialize(items)
+
+    def _serialize(self, items):
         if isinstance(items, list):
             if getattr(self, '_klass', None):
-                serialized_items = []
-                for item in items:
-                    serialized_items.append(self._klass.from_dict(item))
+                # Models with a bulk factory build the whole list in one call
+                if hasattr(self._klass, 'from_dicts'):
+                    serialized_items = self._klass.from_dicts(items)
+                else:
+                    serialized_items = [self._klass.from_dict(item) for item in items]
+                self.__identity_map.add(serialized_items)
         else:
             serialized_items = self._klass.from_dict(items)
+            self.__identity_map.add([serialized_items])
         return serialized_items
 
-    def get_all(self):
+    def loaded_object(self, url):
         """
-        Get all objects of the defined endpoint attribute
+        Object of this requester model already deserialized (by a collection page for example) within the time to
+        live the cache gives to its url. The object is shared, it must not be changed
+        :param url: object url
+        :return: object / None if not loaded
+        """
+        return self.__identity_map.get(url, getattr(self, '_klass', None), max_age=self._cache_ttl(url))
+
+    def _cache_ttl(self, url):
+        """
+        :param url: url
+        :return: seconds the cache keeps the content of the url / None if it never expires
+        """
+        ttl_for = getattr(self.__cache, 'ttl_for', None)
+        return ttl_for(url) if ttl_for is not None else getattr(self.__cache, 'ttl', None)
+
+    def _page_urls(self, first_page):
+        """
+        Work out the urls of the remaining pages of a collection based on the first page, SWAPI returns the total
+        `count` of objects and a `next` link like https://swapi.co/api/people/?page=2
+
+        :param first_page: content of the first page of the collection
+        :return: list with the urls of the remaining pages in page order (empty if they cannot be worked out)
+        """
+        next_url = first_page.get('next')
+        count = first_page.get('count')
+        page_size = len(first_page.get('results', []))
+        if not next_url or not count or not page_size:
+            return []
+
+        scheme, netloc, path, params, query, fragment = urlparse(next_url)
+        query_params = parse_qs(query)
+        first_page_number = int(query_params.get('page', ['2'])[0])
+        pages = int(math.ceil(count / float(page_size)))
+        urls = []
+        for page in range(first_page_number, pages + 1):
+            query_params['page'] = [str(page)]
+            urls.append(urlunparse((scheme, netloc, path, params, urlencode(query_params, doseq=True), fragment)))
+        return urls
+
+    def _collection_url(self):
+        """
+        Url of the first page of the collection defined by the endpoint attribute, narrowed down with SWAPI ?search=
+        when the search attribute is set. Each search gets its own urls and so its own cache entries
         """
-        items = []
         url = '{}/{}'.format(config.SWAPI_BASE_URL, self.endpoint)
-        self.log.debug("Getting %s", url)
-        get_result = self.__get(url)
-        items.extend(get_result.get('results', []))
-        while get_result.get('next'):
-            self.log.debug("Getting %s", get_result.get('next'))
-            get_result = self.__get(get_result.get('next'))
-            items.extend(get_result.get('results', []))
+        if getattr(self, 'search', None):
+            url = '{}/?{}'.format(url, urlencode({'search': self.search}))
+        return url
+
+    def iter_raw_pages(self, concurrent=None):
+        """
+        Yield the content of every page of the defined endpoint attribute in page order. Concurrent fetching keeps at
+        most config.REQUESTER_MAX_WORKERS pages in flight, so pages are not piling up when the consumer is slower
+
+        :param concurrent: fetch the remaining pages in parallel once the first one is known
+                           [Default: config.REQUESTER_CONCURRENT]
+        """
+        if concurrent is None:
+            concurrent = config.REQUESTER_CONCURRENT
+
+        pages = items = 0
+        start = time.perf_counter()
+        try:
+            for page in self.__iter_raw_pages(concurrent):
+                pages += 1
+                items += len(page.get('results', []))
+                yield page
+        finally:
+            self._record_pages(pages, items, time.perf_counter() - start)
 
+    def _record_pages(self, pages, items, duration):
+        """
+        Count the pages and items of a collection walk, with one summary line per collection instead of a line per
+        page. Shared by the blocking and the asyncio walks
+        """
+        metrics.inc('pages_total', pages, endpoint=self.endpoint)
+        metrics.inc('items_total', items, endpoint=self.endpoint)
+        self.log.debug("%s: %s pages, %s items in %.3fs", self._collection_url(), pages, items, duration)
+
+    def __iter_raw_pages(self, concurrent):
+        get_result = self.__get(self._collection_url())
+        yield get_result
+
+        page_urls = self._page_urls(get_result) if concurrent else []
+        if page_urls:
+            with ThreadPoolExecutor(max_workers=min(config.REQUESTER_MAX_WORKERS, len(page_urls))) as executor:
+                page_urls = iter(page_urls)
+                pending = deque(executor.submit(self.__get, page_url)
+                                for page_url in itertools.islice(page_urls, config.REQUESTER_MAX_WORKERS))
+                while pending:
+                    # futures are consumed in submission order, so pages come back in page order
+                    page = pending.popleft().result()
+                    next_page_url = next(page_urls, None)
+                    if next_page_url:
+                        pending.append(executor.submit(self.__get, next_page_url))
+                    yield page
+        else:
+            while get_result.get('next'):
+                get_result = self.__get(get_result.get('next'))
+                yield get_result
+
+    def iter_pages(self, concurrent=None):
+        """
+        Yield the serialized objects of every page (one list per page) of the defined endpoint attribute
+        :param concurrent: see iter_raw_pages
+        """
+        for page in self.iter_raw_pages(concurrent=concurrent):
+            yield self.serialize(items=page.get('results', []))
+
+    def iter_items(self, concurrent=None):
+        """
+        Yield every serialized object of the defined endpoint attribute, one page in memory at a time
+        :param concurrent: see iter_raw_pages
+        """
+        for page in self.iter_pages(concurrent=concurrent):
+            for item in page:
+                yield item
+
+    def get_all(self, concurrent=None):
+        """
+        Get all objects of the defined endpoint attribute
+
+        :param concurrent: fetch the remaining pages in parallel once the first one is known
+                           [Default: config.REQUESTER_CONCURRENT]
+        """
+        with metrics.stage('fetch'):
+            items = []
+            for page in self.iter_raw_pages(concurrent=concurrent):
+                items.extend(page.get('results', []))
         return self.serialize(items=items)
 
+    def get_raw(self, url):
+        """
+        Content of a url (a page for example) going through the cache, without serializing it
+        :param url: url
+        """
+        return self.__get(url)
+
     def get_by_url(self, url):
         """
-        Get object based on url field
+        Get object based on url field, a new object every time (the content comes from the cache when present)
         """
         item = self.__get(url)
         return self.serialize(items=item)